@@ -0,0 +1,92 @@
+"""Benchmark: sequential post_to_connection loop vs gamecore.broadcast.
+
+Uses a stand-in management API client that sleeps for a fixed per-call
+latency and throttles a fraction of calls, so no AWS endpoint is needed.
+--shard-size also times fan_out() with shards run by the in-process worker
+stand-in, one thread pool per shard as separate invocations would have.
+
+    python benchmarks/bench_broadcast.py --connections 1000 10000 --latency-ms 20
+    python benchmarks/bench_broadcast.py --connections 5000 20000 --skip-sequential --shard-size 2500
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda'))
+
+from botocore.exceptions import ClientError
+from gamecore import broadcast as broadcaster
+from gamecore.broadcast import broadcast, fan_out, create_local_invoker, set_shard_invoker
+
+
+class SimulatedManagementClient:
+    """Mimics apigatewaymanagementapi.post_to_connection latency and errors."""
+
+    def __init__(self, latency_ms, throttle_rate, gone_rate, seed=1):
+        self.latency = latency_ms / 1000
+        self.throttle_rate = throttle_rate
+        self.gone_rate = gone_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def post_to_connection(self, ConnectionId, Data):
+        time.sleep(self.latency)
+        with self.lock:
+            draw = self.random.random()
+        if draw < self.gone_rate:
+            raise ClientError({'Error': {'Code': 'GoneException'}}, 'PostToConnection')
+        if draw < self.gone_rate + self.throttle_rate:
+            raise ClientError({'Error': {'Code': 'LimitExceededException'}}, 'PostToConnection')
+        return {}
+
+
+def run_sequential(client, connection_ids, data):
+    for connection_id in connection_ids:
+        try:
+            client.post_to_connection(ConnectionId=connection_id, Data=data)
+        except ClientError:
+            pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--connections', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--latency-ms', type=float, default=20)
+    parser.add_argument('--throttle-rate', type=float, default=0.01)
+    parser.add_argument('--gone-rate', type=float, default=0.02)
+    parser.add_argument('--skip-sequential', action='store_true', help='only time the parallel broadcaster')
+    parser.add_argument('--shard-size', type=int, default=0, help='also time sharded fan_out with this shard size')
+    args = parser.parse_args()
+
+    client = SimulatedManagementClient(args.latency_ms, args.throttle_rate, args.gone_rate)
+    message = {'attack': 'Phishing'}
+    data = json.dumps(message).encode('utf-8')
+    if args.shard_size:
+        broadcaster.BROADCAST_SHARD_SIZE = args.shard_size
+        set_shard_invoker(create_local_invoker(client))
+    print(f"{'connections':>12} {'sequential s':>13} {'broadcast s':>12} {'speedup':>8}")
+    for count in args.connections:
+        connection_ids = [f'conn-{i}' for i in range(count)]
+        if args.skip_sequential:
+            sequential = float('nan')
+        else:
+            start = time.perf_counter()
+            run_sequential(client, connection_ids, data)
+            sequential = time.perf_counter() - start
+        metrics = broadcast(client, connection_ids, data, label='bench')
+        parallel = metrics['duration_ms'] / 1000
+        if args.skip_sequential:
+            print(f"{count:>12} {'-':>13} {parallel:>12.2f} {'-':>8}")
+        else:
+            print(f"{count:>12} {sequential:>13.2f} {parallel:>12.2f} {sequential / parallel:>7.1f}x")
+        if args.shard_size:
+            metrics = fan_out(client, connection_ids, message, label='bench-sharded')
+            print(f"{'':>12} sharded: {metrics.get('shards', 1)} shards in {metrics['duration_ms'] / 1000:.2f} s")
+
+
+if __name__ == '__main__':
+    main()
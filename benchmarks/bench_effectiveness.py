@@ -0,0 +1,145 @@
+"""Benchmark: per-user attack resolution vs the vectorized effectiveness engine.
+
+Runs the original per-user `calculate_combined_effectiveness` /
+`check_attack_successfulness` loop from updatePostAttackStats against
+gamecore.effectiveness on synthetic cohorts. No database is needed.
+
+    python benchmarks/bench_effectiveness.py --users 1000 10000 50000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda'))
+
+from gamecore.effectiveness import compile_effectiveness, build_cohort, resolve_attack, describe_outcomes
+
+
+# --- Per-user implementation, as it was in updatePostAttackStats ---------------
+
+def legacy_calculate_combined_effectiveness(chosen_controls, controls_data, threat_key, tasks_data, tasks_completed, situations_completed_controls):
+    controls_effectiveness_list = {}
+    task_effectiveness_list = {}
+    combined_effectiveness = 1
+    controls_dict = {control['control']: control['effectiveness'].get(threat_key, '0%') for control in controls_data.values()}
+    tasks_dict = {task['name']: task['effectiveness'].get(threat_key, '0') for task in tasks_data.values()}
+    for chosen_control in chosen_controls:
+        if chosen_control not in situations_completed_controls:
+            effectiveness_str = controls_dict.get(chosen_control, '0%')
+            effectiveness = float(effectiveness_str.strip('%')) / 100
+            if effectiveness > 0:
+                controls_effectiveness_list[chosen_control] = effectiveness_str
+                combined_effectiveness *= (1 - effectiveness)
+    for task_completed in tasks_completed:
+        effectiveness_str = tasks_dict.get(task_completed, '0%')
+        effectiveness = float(effectiveness_str.strip('%')) / 100
+        if effectiveness > 0:
+            task_effectiveness_list[task_completed] = effectiveness_str
+            combined_effectiveness *= (1 - effectiveness)
+    combined_effectiveness = 1 - combined_effectiveness
+    return f"{combined_effectiveness * 100:.2f}%", controls_effectiveness_list, task_effectiveness_list
+
+
+def legacy_check_attack_successfulness(controls_tasks_combined_effectiveness, controls_effectiveness_list):
+    max_effectiveness_control = ""
+    max_effectiveness = 0
+    controls_effectiveness = int(float(controls_tasks_combined_effectiveness.strip('%')))
+    if controls_effectiveness:
+        attack_successful = random.randint(0, 99) > controls_effectiveness
+    else:
+        attack_successful = True
+    for control, effectiveness in controls_effectiveness_list.items():
+        effectiveness = int(effectiveness.strip('%'))
+        if effectiveness > max_effectiveness:
+            max_effectiveness = effectiveness
+            max_effectiveness_control = control
+    return attack_successful, max_effectiveness_control
+
+
+# --- Synthetic catalog and cohort ----------------------------------------------
+
+def make_catalog(n_controls, n_threats, n_projects, seed):
+    rnd = random.Random(seed)
+    threats = [f't{i}' for i in range(1, n_threats + 1)]
+    controls = {
+        f'c{i}': {
+            'control': f'Control {i}',
+            'cost': f'${rnd.choice([500, 1000, 1500])}',
+            'effectiveness': {t: f'{rnd.choice([10, 20, 40, 50, 60, 70, 80])}%' for t in rnd.sample(threats, rnd.randint(1, 3))}
+        }
+        for i in range(1, n_controls + 1)
+    }
+    projects = {
+        f'task{i}': {
+            'name': f'Project {i}',
+            'cost': 500,
+            'effectiveness': {t: f'{rnd.choice([10, 20])}%' for t in rnd.sample(threats, rnd.randint(1, 2))}
+        }
+        for i in range(1, n_projects + 1)
+    }
+    return controls, projects, threats
+
+
+def make_cohort(users, controls, projects, seed):
+    rnd = random.Random(seed)
+    control_names = [c['control'] for c in controls.values()]
+    project_names = [p['name'] for p in projects.values()]
+    cohort = []
+    for _ in range(users):
+        owned = rnd.sample(control_names, rnd.randint(0, min(8, len(control_names))))
+        cohort.append({
+            'controls': owned,
+            'tasks': rnd.sample(project_names, rnd.randint(0, len(project_names))),
+            'degraded_controls': owned[:1] if rnd.random() < 0.1 else []
+        })
+    return cohort
+
+
+def run_legacy(cohort, controls, projects, threat_key):
+    for player in cohort:
+        combined, controls_list, _ = legacy_calculate_combined_effectiveness(
+            player['controls'], controls, threat_key, projects, player['tasks'], player['degraded_controls'])
+        legacy_check_attack_successfulness(combined, controls_list)
+
+
+def run_vectorized(cohort, controls, projects, threat_key, describe):
+    model = compile_effectiveness(controls, projects)
+    owned, completed, purchase_order = build_cohort(model, cohort)
+    outcome = resolve_attack(model, owned, completed, threat_key, purchase_order)
+    if describe:
+        describe_outcomes(model, outcome)
+
+
+def best_of(repeats, fn, *args):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument('--controls', type=int, default=20)
+    parser.add_argument('--threats', type=int, default=12)
+    parser.add_argument('--projects', type=int, default=5)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    controls, projects, threats = make_catalog(args.controls, args.threats, args.projects, seed=1)
+    threat_key = threats[0]
+    print(f"{'users':>8} {'per-user ms':>12} {'vector ms':>10} {'vector+records ms':>18} {'speedup':>8}")
+    for users in args.users:
+        cohort = make_cohort(users, controls, projects, seed=users)
+        legacy = best_of(args.repeats, run_legacy, cohort, controls, projects, threat_key)
+        vector = best_of(args.repeats, run_vectorized, cohort, controls, projects, threat_key, False)
+        records = best_of(args.repeats, run_vectorized, cohort, controls, projects, threat_key, True)
+        print(f"{users:>8} {legacy * 1000:>12.1f} {vector * 1000:>10.1f} {records * 1000:>18.1f} {legacy / vector:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
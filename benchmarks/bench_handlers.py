@@ -0,0 +1,288 @@
+"""Benchmark: every game handler at 100 / 1k / 10k / 100k players.
+
+Each tier seeds a synthetic population into a fresh database through
+testing_tools/lambda_harness.py: players holding a random share of the
+catalog controls, projects and situation choices, a history of `--history`
+userEvents each (attack levels and threats, situations, tasks, budget
+grants), and a connection each. The catalogs come from DB/. Request handlers
+are timed over `--requests` calls by distinct players; the scheduled and push
+functions run `--runs` times over the whole population. Every case reports
+p50/p95/p99 latency and DB round trips per invocation.
+
+    python benchmarks/bench_handlers.py --tiers 100 1000
+    python benchmarks/bench_handlers.py --tiers 100 1000 10000 100000 --mongodb-uri mongodb://localhost:27017
+    python benchmarks/bench_handlers.py --save-baseline benchmarks/baseline.json
+    python benchmarks/bench_handlers.py --baseline benchmarks/baseline.json --tolerance 0.25
+
+With mongomock (the default) round trips are collection calls and times are
+in-memory work. mongomock scans without indexes, so its batch timings grow
+faster than linearly: use a local mongod for wire-level numbers and for the
+10k and 100k tiers. The database (MONGODB_DATABASE, default `game_bench`) is
+dropped before each tier. Against a baseline, a case whose p95 grew by more
+than the tolerance, or that makes more DB round trips, is reported as a
+regression and the exit status is 1.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault('MONGODB_DATABASE', 'game_bench')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'testing_tools'))
+
+from lambda_harness import LambdaHarness
+from gamecore.catalog import get_controls, get_projects, get_situations
+from gamecore.events import USER_EVENTS_COLLECTION, ensure_event_indexes
+
+INSERT_BATCH_SIZE = 10000
+# Scheduled and push functions, with the event each is invoked with
+BATCH_CASES = {
+    'updateGameStats': lambda population: {},
+    'updatePostAttackStats': lambda population: {'attack_name': population['threat_name'],
+                                                 'attack_down_time': 1, 'attack_key': population['threat_key']},
+    'pushControls': lambda population: {'invoke': 'pushControls'},
+    'pushSituations': lambda population: {},
+    'pushAttack': lambda population: {},
+}
+REQUEST_CASES = ('/selectControls', '/situation', '/specialProject', '/requestBudget',
+                 '/getUserStats', '/getUserStats?history=levels')
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def insert_batched(collection, documents):
+    batch = []
+    for document in documents:
+        batch.append(document)
+        if len(batch) >= INSERT_BATCH_SIZE:
+            collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        collection.insert_many(batch, ordered=False)
+
+
+def make_player(user_id, rng, controls, projects, situations, now):
+    owned = rng.sample(controls, rng.randint(0, len(controls) // 2))
+    tasks = rng.sample(projects, rng.randint(0, len(projects) // 3))
+    choices = {name: [rng.choice(list(situation['options']))] for name, situation in situations.items() if rng.random() < 0.3}
+    initial_budget = 15000
+    budget_left = rng.randint(0, initial_budget)
+    return {
+        'user_id': user_id, 'initial_budget': initial_budget, 'budget_left': budget_left,
+        'player_start_time': now - timedelta(hours=2), 'is_playing_status': False,
+        'controls': [{'control': control['control'], 'timestamp': now - timedelta(minutes=rng.randint(20, 120))} for control in owned],
+        'tasks_completed': [project['name'] for project in tasks],
+        'situation_choices': choices, 'degraded_controls': [], 'obsolete_controls': [],
+        # Renewal needs apply_for_budget; a quarter of the players qualify
+        'apply_for_budget': rng.random() < 0.25, 'accumulated_production_amount': rng.randint(0, 50000),
+        'expected_production_amount': 60000, 'no_of_attacks': 5,
+        'level_count': rng.randint(1, 30), 'no_of_attacks_successfull': rng.randint(0, 15),
+        'no_of_attacks_mitigated': rng.randint(0, 15), 'uptime': rng.randint(0, 100), 'downtime': rng.randint(0, 20),
+        'expected_uptime': 100, 'version': rng.randint(1, 50)
+    }
+
+
+def make_history(user_id, rng, length, controls, threats, now):
+    """length userEvents of a player, oldest first."""
+    level = 0
+    for i in range(length):
+        ts = now - timedelta(minutes=length - i)
+        kind = rng.choices(('attack', 'situation', 'task', 'budget'), (6, 2, 1, 1))[0]
+        if kind == 'attack':
+            level += 1
+            threat = rng.choice(threats)
+            chosen = [control['control'] for control in rng.sample(controls, min(3, len(controls)))]
+            yield {'user_id': user_id, 'kind': 'attack', 'ts': ts, 'seq': level,
+                   'level': {'attack': threat, 'controls': {'chosen': chosen, 'max_effective_control': chosen[0],
+                                                            'max_effective_control_effectiveness': 50},
+                             'controls_effectiveness': {name: '50%' for name in chosen}, 'tasks_effectiveness': {},
+                             'controls_tasks_combined_effectiveness': '87.50%', 'timestamp': ts.strftime('%d-%m-%Y %H:%M:%S')},
+                   'threat': {'name': threat, 'is_attack_successfull': rng.random() < 0.5, 'expected_earning': 10000,
+                              'actual_earning': rng.choice((0, 10000)), 'loss_due_to_attack': rng.choice((0, 10000))}}
+        elif kind == 'situation':
+            yield {'user_id': user_id, 'kind': 'situation', 'ts': ts,
+                   'situation': {'situation': f'situation{rng.randint(1, 5)}', 'option': str(rng.randint(1, 3)), 'timestamp': ts}}
+        elif kind == 'task':
+            yield {'user_id': user_id, 'kind': 'task', 'ts': ts, 'task': {'completed_task': f'task{i}', 'timestamp': ts}}
+        else:
+            yield {'user_id': user_id, 'kind': 'budget', 'ts': ts, 'budget': {'assigned_budget': 1500, 'timestamp': ts}}
+
+
+def populate(harness, players, history, seed):
+    """Seeds players, their histories and connections; returns what the cases need."""
+    rng = random.Random(seed)
+    db = harness.db
+    controls = list(get_controls(db).values())
+    projects = list(get_projects(db).values())
+    situations = get_situations(db)
+    threats = db.threats.find_one()['threats']
+    threat_names = [threat['name'] for threat in threats.values()]
+    now = datetime.utcnow()
+    user_ids = [f'bench{i:06d}' for i in range(players)]
+
+    insert_batched(db.usersData, (make_player(user_id, rng, controls, projects, situations, now) for user_id in user_ids))
+    db.usersData.create_index('user_id', unique=True)
+    ensure_event_indexes(db)
+    insert_batched(db[USER_EVENTS_COLLECTION], (event for user_id in user_ids
+                                                for event in make_history(user_id, rng, history, controls, threat_names, now)))
+    insert_batched(db.connections, ({'connection_id': f'conn-{user_id}', 'user_id': user_id} for user_id in user_ids))
+    # pushAttack only attacks games started more than five minutes ago
+    db.game_status.update_one({}, {'$set': {'started': 'True', 'update_attack_stats': 'False',
+                                            'start_timestamp': now - timedelta(minutes=30)}}, upsert=True)
+    threat_key = rng.choice(list(threats))
+    return {'user_ids': user_ids, 'controls': controls, 'projects': projects, 'situations': situations,
+            'threat_key': threat_key, 'threat_name': threats[threat_key]['name'], 'rng': rng}
+
+
+def request_params(harness, case, user_id, population):
+    """(path, params) of one request of case by user_id.
+
+    Purchases pick something the player does not own yet, so the accepted
+    path is what gets timed; a player short of budget is still rejected.
+    """
+    rng = population['rng']
+    if case in ('/selectControls', '/specialProject'):
+        player = harness.db.usersData.find_one({'user_id': user_id}, {'controls.control': 1, 'tasks_completed': 1})
+        if case == '/selectControls':
+            owned = {control['control'] for control in player['controls']}
+            names = [control['control'] for control in population['controls'] if control['control'] not in owned]
+            return case, {'controls': rng.choice(names or [population['controls'][0]['control']])}
+        names = [project['name'] for project in population['projects'] if project['name'] not in player['tasks_completed']]
+        return case, {'project': rng.choice(names or [population['projects'][0]['name']])}
+    if case == '/situation':
+        name = rng.choice(list(population['situations']))
+        return case, {'situation': f"{name},{rng.choice(list(population['situations'][name]['options']))}"}
+    if case == '/getUserStats?history=levels':
+        return '/getUserStats', {'history': 'levels', 'limit': '20'}
+    return case, None
+
+
+def measure(harness, run):
+    """Runs run() and returns (ms, DB round trips) of the invocation it made."""
+    harness.traces.clear()
+    start = time.perf_counter()
+    response = run()
+    elapsed = (time.perf_counter() - start) * 1000
+    operations = sum(trace['operations'] for trace in harness.traces.traces)
+    status = response.get('statusCode') if isinstance(response, dict) else None
+    return elapsed, operations, status
+
+
+def summarize(samples):
+    times = sorted(sample[0] for sample in samples)
+    operations = [sample[1] for sample in samples]
+    statuses = {}
+    for sample in samples:
+        if sample[2] is not None:
+            statuses[str(sample[2])] = statuses.get(str(sample[2]), 0) + 1
+    return {
+        'n': len(samples),
+        'p50_ms': round(percentile(times, 0.50), 3),
+        'p95_ms': round(percentile(times, 0.95), 3),
+        'p99_ms': round(percentile(times, 0.99), 3),
+        'db_ops': round(sum(operations) / len(operations), 1) if operations else 0,
+        'statuses': statuses
+    }
+
+
+def run_tier(players, args):
+    harness = LambdaHarness(args.mongodb_uri, seed=False)
+    harness.db.client.drop_database(harness.db.name)
+    harness.seed()
+    start = time.perf_counter()
+    population = populate(harness, players, args.history, args.seed)
+    print(f"\n{players} players, {players * args.history} events seeded in {time.perf_counter() - start:.1f}s")
+
+    results = {}
+    for case in REQUEST_CASES:
+        if args.cases and case not in args.cases:
+            continue
+        # Distinct players per call, so purchases and renewals do not pile onto one document
+        user_ids = population['rng'].sample(population['user_ids'], min(args.requests, players))
+        samples = []
+        for user_id in user_ids:
+            path, params = request_params(harness, case, user_id, population)
+            samples.append(measure(harness, lambda: harness.call(path, user_id, params)))
+        results[case] = summarize(samples)
+
+    for case, make_event in BATCH_CASES.items():
+        if args.cases and case not in args.cases:
+            continue
+        samples = []
+        for _ in range(args.runs):
+            # updatePostAttackStats flags the stats as up to date; updateGameStats would skip
+            harness.db.game_status.update_one({}, {'$set': {'update_attack_stats': 'False'}})
+            samples.append(measure(harness, lambda: harness.invoke(case, make_event(population))))
+            harness.lambda_client.pending.clear()
+            harness.management.clear()
+        results[case] = summarize(samples)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Rows of (key, baseline result, result, p95 ratio, regressed) for cases in both runs."""
+    rows = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        before = baseline[key]
+        ratio = result['p95_ms'] / before['p95_ms'] if before['p95_ms'] else 1.0
+        regressed = ratio > 1 + tolerance or result['db_ops'] > before['db_ops']
+        rows.append((key, before, result, ratio, regressed))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tiers', type=int, nargs='+', default=[100, 1000])
+    parser.add_argument('--requests', type=int, default=200, help='calls per request handler and tier')
+    parser.add_argument('--runs', type=int, default=5, help='runs per scheduled/push function and tier')
+    parser.add_argument('--history', type=int, default=40, help='userEvents per player')
+    parser.add_argument('--cases', nargs='*', help='only these handlers, e.g. /selectControls updateGameStats')
+    parser.add_argument('--mongodb-uri', help='local mongod instead of mongomock')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--output', help='write the results as JSON')
+    parser.add_argument('--baseline', help='compare p95 against this results JSON')
+    parser.add_argument('--save-baseline', help='write the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed p95 growth over the baseline')
+    args = parser.parse_args()
+
+    results = {}
+    for players in args.tiers:
+        tier = run_tier(players, args)
+        print(f"{'handler':<30} {'n':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'db ops':>7}  statuses")
+        for case, result in tier.items():
+            print(f"{case:<30} {result['n']:>5} {result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} "
+                  f"{result['p99_ms']:>9.2f} {result['db_ops']:>7}  {result['statuses']}")
+            results[f'{players}:{case}'] = result
+
+    report = {'backend': 'mongod' if args.mongodb_uri else 'mongomock', 'history': args.history, 'results': results}
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('backend') != report['backend']:
+            print(f"\nwarning: baseline was measured on {baseline.get('backend')}, this run on {report['backend']}")
+        rows = compare(results, baseline['results'], args.tolerance)
+        print(f"\n{'case':<38} {'base p95':>9} {'p95':>9} {'ratio':>6} {'base ops':>9} {'db ops':>7}")
+        for key, before, after, ratio, regressed in rows:
+            print(f"{key:<38} {before['p95_ms']:>9.2f} {after['p95_ms']:>9.2f} {ratio:>6.2f} "
+                  f"{before['db_ops']:>9} {after['db_ops']:>7}{'  REGRESSION' if regressed else ''}")
+        if any(row[4] for row in rows):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""Benchmark: per-request logging cost of print() vs gamecore.log.
+
+Replays the log calls of one /selectControls request: the old handler
+printed the whole API Gateway event and f-string formatted every message;
+the new one logs a request summary at DEBUG and %-style messages that are
+only formatted when emitted. Output goes to a byte-counting sink, so the
+numbers are CPU time and log volume per request, not terminal speed.
+
+    python benchmarks/bench_logging.py --requests 20000
+    python benchmarks/bench_logging.py --requests 20000 --controls 200
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda'))
+
+from gamecore import log as gamelog
+
+
+class CountingSink(io.TextIOBase):
+    def __init__(self):
+        self.bytes = 0
+
+    def write(self, text):
+        self.bytes += len(text)
+        return len(text)
+
+
+def make_event(n_controls):
+    controls = ','.join(f'Control {i}' for i in range(n_controls))
+    return {
+        'resource': '/selectControls', 'path': '/selectControls', 'httpMethod': 'GET',
+        'headers': {'Authorization': 'Bearer ' + 'x' * 900, 'Host': 'example.execute-api.us-east-1.amazonaws.com',
+                    'User-Agent': 'python-aiohttp', 'X-Forwarded-For': '10.0.0.1'},
+        'multiValueHeaders': {'Authorization': ['Bearer ' + 'x' * 900]},
+        'queryStringParameters': {'controls': controls},
+        'multiValueQueryStringParameters': {'controls': [controls]},
+        'requestContext': {'resourcePath': '/selectControls', 'httpMethod': 'GET', 'requestId': 'c6af9ac6-7b61-11e6-9a41-93e8deadbeef',
+                           'authorizer': {'claims': {'username': 'player1', 'scope': 'https://api_userpool_resource_server.com/Read',
+                                                     'token_use': 'access', 'auth_time': '1700000000'}},
+                           'identity': {'sourceIp': '10.0.0.1', 'userAgent': 'python-aiohttp'}},
+        'body': None, 'isBase64Encoded': False
+    }
+
+
+def legacy_request(event, user_id, chosen, owned, degraded):
+    print(f"gameSelectControls: {event}")
+    print(f"gameSelectControls: {user_id}- Chosen controls are {chosen}")
+    print(f"gameSelectControls: {user_id}- new Controls {owned}")
+    print(f"gameSelectControls: {user_id}- degraded Controls {degraded}")
+
+
+def structured_request(log, event, user_id, chosen, owned, degraded):
+    log.start(event)
+    log.info('Chosen controls are %s', chosen)
+    log.info('new Controls %s', owned)
+    log.info('degraded Controls %s', degraded)
+
+
+def run(requests, fn, *args):
+    sink = CountingSink()
+    stdout = sys.stdout
+    sys.stdout = sink
+    try:
+        start = time.perf_counter()
+        for _ in range(requests):
+            fn(*args)
+        elapsed = time.perf_counter() - start
+    finally:
+        sys.stdout = stdout
+    return elapsed / requests * 1e6, sink.bytes / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--controls', type=int, default=20, help='controls in the request and on the player')
+    args = parser.parse_args()
+
+    event = make_event(args.controls)
+    chosen = [f'Control {i}' for i in range(args.controls)]
+    owned = chosen + [f'Owned {i}' for i in range(args.controls)]
+    cases = [('print (before)', None, None, 1.0)]
+    cases += [(f'gamecore.log {level} sample={rate}', level, gamelog.LEVELS[level], rate)
+              for level, rate in (('DEBUG', 1.0), ('INFO', 1.0), ('WARNING', 1.0))]
+    cases.append((f'gamecore.log INFO sample={gamelog.REQUEST_SAMPLE_RATE} (default)', 'INFO',
+                  gamelog.LEVELS['INFO'], gamelog.REQUEST_SAMPLE_RATE))
+
+    print(f"{'case':<44} {'us/request':>11} {'bytes/request':>14}")
+    for name, _, level, rate in cases:
+        if level is None:
+            cost, size = run(args.requests, legacy_request, event, 'player1', chosen, owned, [])
+        else:
+            log = gamelog.Logger('gameSelectControls', sample_rate=rate)
+            log.level = level
+            cost, size = run(args.requests, structured_request, log, event, 'player1', chosen, owned, [])
+        print(f"{name:<44} {cost:>11.1f} {size:>14.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,15 @@
+from gamecore.broadcast import broadcast_shard
+from gamecore.clients import get_management_client
+from gamecore.log import get_logger
+
+MANAGEMENT_API_URL = "https://xxxxxxxxxxxxxx.us-east-1.amazonaws.com/production"
+log = get_logger('broadcastWorker')
+
+
+# Posts one shard of a sharded broadcast (see gamecore.broadcast.fan_out).
+# Event: {'label': str, 'shard': int, 'message': {...}, 'connection_ids': [...]}
+# Stale ids are returned to the caller, which prunes them once for the whole broadcast.
+def lambda_handler(event, context):
+    log.start(event, label=event.get('label'))
+    log.info('shard %s with %s connections', event.get('shard'), len(event.get('connection_ids', [])))
+    return broadcast_shard(get_management_client(MANAGEMENT_API_URL), event)
@@ -1,10 +1,13 @@
 import json
+from gamecore.log import get_logger
+
+log = get_logger('defaultResponse')
 
 def lambda_handler(event, context):
     # Extract the connection ID from the event
     connection_id = event['requestContext']['connectionId']
-    print(f'connection_id: {connection_id}')
-    print(f'event: {event}')
+    log.start(event)
+    log.info('Unrouted message on connection %s', connection_id)
     message = event['body']
     return {
         'statusCode': 401,
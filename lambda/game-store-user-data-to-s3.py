@@ -1,57 +1,20 @@
 import os
 import json
-from pymongo import MongoClient
-import boto3
 from datetime import datetime
 from bson.json_util import dumps
+from gamecore.db import connect_to_database, warm_up
+from gamecore.responses import return_success, return_error
+from gamecore.clients import get_s3_client
+from gamecore.log import get_logger
+from gamecore.tracing import traced
 
 # Environment variable: MongoDB URI
 MONGODB_URI = os.environ['MONGODB_URI']
-cached_db = None
+warm_up(MONGODB_URI)
+log = get_logger('game-store-user-data-to-s3')
 
-# AWS S3 client setup
-s3_client = boto3.client('s3')
 bucket_name = 'game-store-user-data-to-s3'
 
-def return_success(response_data):
-    return {
-            'statusCode': 200,
-            #'headers': { 'Content-Type': 'application/json' },
-            'headers': {
-            'Access-Control-Allow-Origin': '*',  # Allows requests from any origin
-            'Access-Control-Allow-Methods': 'GET',  # Adjust as needed
-            'Access-Control-Allow-Headers': 'Content-Type',  # Adjust as needed
-            'Content-Type': 'application/json'
-            },
-            
-            'body': json.dumps(response_data)
-        }
-
-def return_error(status_code, error):
-    return {
-            'statusCode': status_code,
-            #'headers': { 'Content-Type': 'application/json' },
-            'headers': {
-            'Access-Control-Allow-Origin': '*',  # Allows requests from any origin
-            'Access-Control-Allow-Methods': 'GET',  # Adjust as needed
-            'Access-Control-Allow-Headers': 'Content-Type',  # Adjust as needed
-            'Content-Type': 'application/json'
-            },
-            
-            'body': json.dumps({'error': str(error)})
-        }
-
-def connect_to_database(uri):
-    global cached_db
-    print('=> connect to database')
-    if cached_db is not None:
-        print('=> using cached database instance')
-        return cached_db
-    client = MongoClient(uri)
-    print(client)
-    cached_db = client.test
-    return cached_db
-
 def get_user_data(db, user_id):
     # extracting userdata based on the user_id
     user_document = db.users.find_one({"user_id": user_id})
@@ -68,8 +31,9 @@ def get_user_data(db, user_id):
     
 
 
+@traced('game-store-user-data-to-s3')
 def lambda_handler(event, context):
-    print('event: ', event)
+    log.start(event)
     if event.get('multiValueQueryStringParameters', {}):
         return return_error(400,f"unexpected query parameter")
     
@@ -99,25 +63,25 @@ def lambda_handler(event, context):
         
         try:
         # Upload the file to S3
-            s3_client.upload_file(tmp_file_path, bucket_name, filename)
+            get_s3_client().upload_file(tmp_file_path, bucket_name, filename)
             
             # verify the upload was successful by checking the file's existence
-            s3_client.head_object(Bucket=bucket_name, Key=filename)
+            get_s3_client().head_object(Bucket=bucket_name, Key=filename)
             
             # Since upload was successful, delete the document from MongoDB
             delete_result = db.users.delete_one({'user_id': user_id})
             
             # Check if the document was successfully deleted
             if delete_result.deleted_count > 0:
-                print(f'status: success message: File {filename} uploaded to S3 and user document deleted successfully')
+                log.info('File %s uploaded to S3 and user document deleted successfully', filename)
                 return return_success('Data is deleted....')
                 
             else:
-                print(f'status: warning message: File {filename} uploaded to S3 but failed to delete user document')
+                log.warning('File %s uploaded to S3 but failed to delete user document', filename)
                 return return_error(400, 'Data cannot be deleted from DB')
         except Exception as e:
             # Handle exceptions and possible S3 errors or MongoDB deletion errors
-            print(f'status: error message: File {filename} Failed to upload file to S3 or delete user document {str(e)}')
+            log.error('File %s failed to upload to S3 or delete user document', filename, error=e)
             return return_error(400, 'Data cannot stored on the disk')
         finally:
         # Delete the temporary file, regardless of the upload's success or failure
@@ -125,5 +89,5 @@ def lambda_handler(event, context):
                 os.remove(tmp_file_path)
             except Exception as e:
                 # Log the error if the file could not be deleted
-                print(f"Error deleting temporary file: {str(e)}")
+                log.error('Error deleting temporary file', error=e)
             
\ No newline at end of file
@@ -1,84 +1,180 @@
 import os
-import json
-from pymongo import MongoClient
-from datetime import datetime
+from gamecore.db import connect_to_database, warm_up
+from gamecore.responses import return_success, return_error, return_not_modified, make_etag, if_none_match, get_request_header
+from gamecore.log import get_logger, REQUEST_SAMPLE_RATE
+from gamecore.tracing import traced
+from gamecore.events import HISTORY_EVENTS, get_history_page, get_first_pages, encode_cursor, decode_cursor, decode_history_cursor
 
 # Load MongoDB URI from environment variable
 MONGODB_URI = os.environ['MONGODB_URI']
-cached_db = None
-
-def connect_to_database(uri):
-    """ Connect to MongoDB using the URI, with caching to avoid multiple connections. """
-    global cached_db
-    print('=> connect to database')
-    if cached_db is not None:
-        print('=> using cached database instance')
-        return cached_db
-    try:
-        client = MongoClient(uri)
-        cached_db = client.test  # 'test' is the intended database
-        print(client)
-    except Exception as e:
-        print(f"gameGetUserStats: Error connecting to database: {e}")
-        raise
-    return cached_db
+warm_up(MONGODB_URI)
+# Polled every few seconds by every player
+log = get_logger('gameGetUserStats', sample_rate=REQUEST_SAMPLE_RATE)
+
+# Fields of the player document a client may ask for with ?fields=a,b,c.
+# Histories are paged with ?history=<name>&limit=&cursor=; all of them but
+# controls live in userEvents (see gamecore.events). Without parameters the
+# response is the player document plus the first page of each history, so
+# the polled default stays the same size however long the game runs.
+DOCUMENT_FIELDS = (
+    'user_id', 'initial_budget', 'budget_left', 'apply_for_budget', 'player_start_time', 'is_playing_status',
+    'expected_uptime', 'uptime', 'downtime', 'accumulated_production_amount', 'accumulated_production_loss',
+    'expected_production_amount', 'no_of_attacks_successfull', 'no_of_attacks_mitigated', 'level_count',
+    'obsolete_controls', 'stats_update_timestamp', 'version', 'controls', 'tasks_completed',
+    'situation_choices', 'degraded_controls'
+)
+HISTORY_FIELDS = tuple(HISTORY_EVENTS) + ('controls',)
+DEFAULT_PAGE_LIMIT = 20
+MAX_PAGE_LIMIT = 100
+ETAG_FIELDS = ('version', 'player_start_time')
+
 
-def return_success(response_data):
-    """ Return a success HTTP response with JSON body. """
+def get_query_value(params, name):
+    values = params.get(name) or []
+    return values[0] if values else None
+
+
+def is_valid_cursor(history, cursor):
     try:
-        response_body = json.dumps(response_data, cls=CustomJSONEncoder)
-    except Exception as e:
-        return return_error(500, f"JSON Encoding Error: {e}")
-    return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET',
-                'Access-Control-Allow-Headers': 'Content-Type',
-                'Content-Type': 'application/json'
-            },
-            'body': response_body
-        }
-
-def return_error(status_code, error):
-    """ Return an error HTTP response with JSON body describing the error. """
-    error_message = json.dumps({'error': str(error)})
-    return {
-            'statusCode': status_code,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET',
-                'Access-Control-Allow-Headers': 'Content-Type',
-                'Content-Type': 'application/json'
-            },
-            'body': error_message
-        }
-
-class CustomJSONEncoder(json.JSONEncoder):
-    """ Custom JSON encoder for encoding datetime objects into ISO format. """
-    def default(self, obj):
-        if isinstance(obj, datetime):
-            return obj.isoformat()
-        return json.JSONEncoder.default(self, obj)
-
-def get_user_stats(db, user_id):
+        if history == 'controls':
+            offset = decode_cursor(cursor).get('offset')
+            return isinstance(offset, int) and offset >= 0
+        decode_history_cursor(cursor)
+        return True
+    except ValueError:
+        return False
+
+
+def parse_stats_query(params):
+    """Turns the query string into a stats query, or returns an error message.
+
+    Without parameters the whole document and the first page of every history are returned.
+    """
+    unexpected = set(params) - {'fields', 'history', 'limit', 'cursor'}
+    if unexpected:
+        return None, f"Unexpected query parameter {sorted(unexpected)}"
+    query = {'fields': None, 'history': None, 'limit': DEFAULT_PAGE_LIMIT, 'cursor': None}
+
+    fields = get_query_value(params, 'fields')
+    if fields is not None:
+        query['fields'] = [field for field in dict.fromkeys(fields.split(',')) if field]
+        unknown = [field for field in query['fields'] if field not in DOCUMENT_FIELDS]
+        if unknown:
+            return None, f"Unknown fields {unknown}"
+
+    history = get_query_value(params, 'history')
+    if history is not None:
+        if history not in HISTORY_FIELDS:
+            return None, f"history must be one of {list(HISTORY_FIELDS)}"
+        query['history'] = history
+        try:
+            query['limit'] = int(get_query_value(params, 'limit') or DEFAULT_PAGE_LIMIT)
+        except ValueError:
+            return None, "limit must be an integer"
+        if not 1 <= query['limit'] <= MAX_PAGE_LIMIT:
+            return None, f"limit must be between 1 and {MAX_PAGE_LIMIT}"
+        # cursor is the opaque next_cursor of the previous page
+        query['cursor'] = get_query_value(params, 'cursor') or None
+        if query['cursor'] and not is_valid_cursor(history, query['cursor']):
+            return None, "cursor must be a next_cursor returned by a previous page"
+    elif 'limit' in params or 'cursor' in params:
+        return None, "limit and cursor need a history parameter"
+    return query, None
+
+
+def get_controls_offset(query):
+    # controls are a bounded array on the player document, paged by position
+    return decode_cursor(query['cursor'])['offset'] if query['cursor'] else 0
+
+
+def build_stats_projection(query):
+    """MongoDB projection for a stats query; None means the whole document."""
+    if query['fields'] is None and query['history'] is None:
+        return None
+    projection = {'_id': 0}
+    for field in (query['fields'] or []) + list(ETAG_FIELDS):
+        projection[field] = 1
+    if query['history'] == 'controls':
+        # one extra element tells whether another page exists
+        projection['controls'] = {'$slice': [get_controls_offset(query), query['limit'] + 1]}
+    return projection
+
+
+def apply_stats_page(db, user_id, user_data, query):
+    """Adds the requested history page, trimmed to limit, and sets next_cursor."""
+    history = query['history']
+    if not history:
+        return user_data
+    limit = query['limit']
+    if history == 'controls':
+        items, next_cursor = user_data.get('controls', []), None
+        if len(items) > limit:
+            items = items[:limit]
+            next_cursor = encode_cursor({'offset': get_controls_offset(query) + limit})
+    else:
+        items, next_cursor = get_history_page(db, user_id, history, query['cursor'], limit)
+    if history == 'levels':
+        # levels keep their historical shape: an object keyed by level number
+        user_data['levels'] = {str(number): level for number, level in items}
+    else:
+        user_data[history] = items
+    user_data['next_cursor'] = next_cursor
+    return user_data
+
+
+def get_user_etag(user_id, user_data, params=None):
+    # version is bumped by every write to the player document; the start time
+    # keeps ETags from matching across a reset that recreates the player, and
+    # the query string distinguishes the different projections of one version
+    query_key = sorted((key, tuple(values or [])) for key, values in (params or {}).items())
+    return make_etag(user_id, user_data.get('version', 0), user_data.get('player_start_time', ''), query_key)
+
+def get_user_stats(db, user_id, event=None):
     """ Fetch or create initial user stats based on the user ID. """
+    event = event or {}
+    params = event.get('multiValueQueryStringParameters') or {}
+    query, error = parse_stats_query(params)
+    if error:
+        log.info('Rejected stats query: %s', error)
+        return return_error(400, error)
     try:
-        user_data = db.usersData.find_one({"user_id": user_id})
+        if get_request_header(event, 'If-None-Match'):
+            # Conditional request: answer from a projected version lookup when unchanged
+            user_version = db.usersData.find_one({"user_id": user_id}, {"_id": 0, "version": 1, "player_start_time": 1})
+            if user_version:
+                etag = get_user_etag(user_id, user_version, params)
+                if if_none_match(event, etag):
+                    return return_not_modified({'ETag': etag, 'Cache-Control': 'no-cache'})
+        user_data = db.usersData.find_one({"user_id": user_id}, build_stats_projection(query))
+        if user_data and query['history']:
+            user_data = apply_stats_page(db, user_id, user_data, query)
+        elif user_data and query['fields'] is None:
+            # Documents not yet migrated still carry their own history arrays
+            histories, next_cursors = get_first_pages(db, user_id, DEFAULT_PAGE_LIMIT)
+            for history, entries in histories.items():
+                user_data.setdefault(history, entries)
+            user_data['next_cursors'] = next_cursors
     except Exception as e:
-        print(f'gameGetUserStats: {user_id}- Database query failed. Error is {e}')
+        log.error('Database query failed', error=e)
         return return_error(500, f"Internal Server error.")
 
     if not user_data:
-        user_data = {"user_id": user_id, "initial_budget": 0, "player_start_time": "", "controls": [], "threats": [], "levels": {}}
-    else:
-        user_data.pop('_id', None)  # Remove MongoDB-specific '_id' field
+        user_data = {"user_id": user_id, "initial_budget": 0, "player_start_time": "", "controls": [], "threats": [],
+                     "levels": {}, "level_count": 0}
+        return return_success(user_data)
+    user_data.pop('_id', None)  # Remove MongoDB-specific '_id' field
 
-    return return_success(user_data)
+    headers = {'ETag': get_user_etag(user_id, user_data, params), 'Cache-Control': 'no-cache'}
+    if query['fields'] is not None or query['history'] is not None:
+        for field in ETAG_FIELDS:
+            if field not in (query['fields'] or []):
+                user_data.pop(field, None)
+    return return_success(user_data, headers)
 
+@traced('gameGetUserStats')
 def lambda_handler(event, context):
     """ Lambda function handler processing HTTP requests. """
-    print('event: ', event)
+    log.start(event)
     #user_id = "dummyuser1"  # Dummy user ID for testing purposes
     user_id = event.get('requestContext', {}).get('authorizer', {}).get('claims', {}).get('username', None)
 
@@ -87,20 +183,17 @@ def lambda_handler(event, context):
         try:
             db = connect_to_database(MONGODB_URI)
         except Exception as e:
-            print(f'gameGetUserStats: Failed to connect to database. Error is {e}')
+            log.error('Failed to connect to database', error=e)
             return return_error(500, f"Internal Server error.")
 
         if path == '/getUserStats':
-            if event.get('multiValueQueryStringParameters', {}):
-                print(f'gameGetUserStats: {user_id} - Unexpected query parameter')
-                return return_error(400, "Unexpected query parameter")
-            response = get_user_stats(db, user_id)
+            response = get_user_stats(db, user_id, event)
         else:
-            print(f'gameGetUserStats: {user_id} - Endpoint not found')
+            log.info('Endpoint not found')
             response = return_error(403, "Endpoint not found")
     else:
-        print(f'gameGetUserStats: UserID cannot be deduced from the API request token.')
+        log.warning('UserID cannot be deduced from the API request token.')
         response = return_error(438, "UserID cannot be deduced from the API request.")
 
-    print('=> returning result: ', response)
+    log.debug('returning result', response=response)
     return response
\ No newline at end of file
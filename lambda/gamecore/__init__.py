@@ -0,0 +1,5 @@
+"""Shared runtime for the game Lambda functions.
+
+Shipped as a Lambda layer (see README) so that every handler uses the same
+MongoDB connection pool settings and HTTP response builders.
+"""
@@ -0,0 +1,284 @@
+import os
+import json
+import time
+import random
+from itertools import islice, chain
+from concurrent.futures import ThreadPoolExecutor
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from gamecore.log import get_logger
+
+log = get_logger('gamecore.broadcast')
+
+# Fan-out settings are read once per container. The management API client is
+# thread-safe, so one client with a pool as wide as the worker count is shared
+# by every send of a broadcast.
+WEBSOCKET_ENDPOINT_URL = os.environ.get('WEBSOCKET_ENDPOINT_URL')
+BROADCAST_CONCURRENCY = int(os.environ.get('BROADCAST_CONCURRENCY', 128))
+BROADCAST_MAX_ATTEMPTS = int(os.environ.get('BROADCAST_MAX_ATTEMPTS', 5))
+BROADCAST_BASE_DELAY_MS = int(os.environ.get('BROADCAST_BASE_DELAY_MS', 50))
+BROADCAST_MAX_DELAY_MS = int(os.environ.get('BROADCAST_MAX_DELAY_MS', 2000))
+# Connection ids are pulled from their cursor this many at a time.
+BROADCAST_CHUNK_SIZE = int(os.environ.get('BROADCAST_CHUNK_SIZE', 1000))
+# Sharded mode: when more than one shard of connections is registered, each
+# shard is posted by its own broadcastWorker invocation. 0 disables sharding.
+BROADCAST_SHARD_SIZE = int(os.environ.get('BROADCAST_SHARD_SIZE', 0))
+BROADCAST_WORKER_FUNCTION = os.environ.get('BROADCAST_WORKER_FUNCTION', 'broadcastWorker')
+BROADCAST_MAX_SHARDS_IN_FLIGHT = int(os.environ.get('BROADCAST_MAX_SHARDS_IN_FLIGHT', 50))
+
+THROTTLING_ERROR_CODES = {'LimitExceededException', 'TooManyRequestsException', 'ThrottlingException'}
+
+
+def create_management_client(endpoint_url):
+    """Create an apigatewaymanagementapi client tuned for parallel fan-out.
+
+    WEBSOCKET_ENDPOINT_URL, when set, takes precedence over the endpoint
+    passed in by the handler. botocore does not retry: send_one() is the only
+    retry layer, so a connection gets at most BROADCAST_MAX_ATTEMPTS posts on
+    one backoff schedule.
+    """
+    config = Config(
+        max_pool_connections=BROADCAST_CONCURRENCY,
+        tcp_keepalive=True,
+        connect_timeout=2,
+        read_timeout=5,
+        retries={'mode': 'standard', 'total_max_attempts': 1},
+    )
+    return boto3.client('apigatewaymanagementapi', endpoint_url=WEBSOCKET_ENDPOINT_URL or endpoint_url, config=config)
+
+
+def backoff_delay(attempt):
+    """Full-jitter exponential backoff, in seconds."""
+    cap = min(BROADCAST_MAX_DELAY_MS, BROADCAST_BASE_DELAY_MS * (2 ** attempt))
+    return random.uniform(0, cap) / 1000
+
+
+def is_retryable(error):
+    """Throttling and 5xx errors, which botocore would otherwise have retried."""
+    code = error.response.get('Error', {}).get('Code')
+    status = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode') or 0
+    return code in THROTTLING_ERROR_CODES or status >= 500
+
+
+def send_one(client, connection_id, data):
+    """Posts to a single connection and returns (status, seconds, retries).
+
+    status is 'sent', 'stale' (GoneException) or 'failed'. Throttled and 5xx
+    posts are retried with backoff, BROADCAST_MAX_ATTEMPTS attempts in all.
+    Single posts are only logged at DEBUG: stale connections are pruned by the
+    caller and failures are counted once per broadcast by deliver().
+    """
+    start = time.perf_counter()
+    retries = 0
+    while True:
+        try:
+            client.post_to_connection(ConnectionId=connection_id, Data=data)
+            return 'sent', time.perf_counter() - start, retries
+        except ClientError as e:
+            code = e.response.get('Error', {}).get('Code')
+            if code == 'GoneException':
+                log.debug('connection %s is gone', connection_id)
+                return 'stale', time.perf_counter() - start, retries
+            if is_retryable(e) and retries + 1 < BROADCAST_MAX_ATTEMPTS:
+                time.sleep(backoff_delay(retries))
+                retries += 1
+                continue
+            log.debug('post to %s failed: %s', connection_id, code)
+            return 'failed', time.perf_counter() - start, retries
+        except Exception as e:
+            log.debug('post to %s failed', connection_id, error=e)
+            return 'failed', time.perf_counter() - start, retries
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def run_parallel(fn, items):
+    """Maps fn over items on at most BROADCAST_CONCURRENCY threads, preserving order."""
+    if not items:
+        return []
+    with ThreadPoolExecutor(max_workers=min(BROADCAST_CONCURRENCY, len(items))) as executor:
+        return list(executor.map(fn, items))
+
+
+def encode_message(message):
+    return message if isinstance(message, bytes) else json.dumps(message).encode('utf-8')
+
+
+def broadcast(client, connection_ids, message, label='broadcast'):
+    """Sends message to every connection with bounded concurrency.
+
+    connection_ids may be any iterable, including a DB cursor; it is consumed
+    BROADCAST_CHUNK_SIZE ids at a time on one shared thread pool. Returns the
+    send metrics, including the list of stale connection ids so callers can
+    clean them up.
+    """
+    data = encode_message(message)
+    return deliver(client, ((connection_id, data) for connection_id in connection_ids), label)
+
+
+def deliver(client, messages, label='deliver'):
+    """Sends a possibly different message to each connection.
+
+    messages is an iterable of (connection_id, message) pairs, consumed in
+    chunks like broadcast(). Returns the same metrics as broadcast().
+    """
+    start = time.perf_counter()
+    connection_ids = []
+    results = []
+    message_iter = iter(messages)
+    with ThreadPoolExecutor(max_workers=BROADCAST_CONCURRENCY) as executor:
+        while True:
+            chunk = list(islice(message_iter, BROADCAST_CHUNK_SIZE))
+            if not chunk:
+                break
+            connection_ids.extend(connection_id for connection_id, _ in chunk)
+            results.extend(executor.map(
+                lambda item: send_one(client, item[0], encode_message(item[1])), chunk))
+    duration = time.perf_counter() - start
+
+    stale = [connection_id for connection_id, result in zip(connection_ids, results) if result[0] == 'stale']
+    send_times = sorted(result[1] * 1000 for result in results)
+    metrics = {
+        'connections': len(connection_ids),
+        'sent': sum(1 for result in results if result[0] == 'sent'),
+        'stale': stale,
+        'failed': sum(1 for result in results if result[0] == 'failed'),
+        'throttle_retries': sum(result[2] for result in results),
+        'duration_ms': round(duration * 1000, 1),
+        'send_ms_p50': round(percentile(send_times, 0.50), 1),
+        'send_ms_p95': round(percentile(send_times, 0.95), 1),
+        'send_ms_max': round(send_times[-1], 1) if send_times else 0.0,
+    }
+    log.info('broadcast sent', label=label, sent=metrics['sent'], stale=len(stale), failed=metrics['failed'],
+             throttle_retries=metrics['throttle_retries'], duration_ms=metrics['duration_ms'],
+             p50=metrics['send_ms_p50'], p95=metrics['send_ms_p95'], max=metrics['send_ms_max'])
+    if metrics['failed']:
+        log.warning('%s of %s posts failed', metrics['failed'], metrics['connections'], label=label)
+    return metrics
+
+
+# --- Sharded broadcast ---------------------------------------------------------
+
+# Callable(payload) -> shard metrics. None means "invoke BROADCAST_WORKER_FUNCTION";
+# set_shard_invoker() swaps in an in-process stand-in for tests and local runs.
+shard_invoker = None
+
+
+def create_lambda_invoker(function_name=BROADCAST_WORKER_FUNCTION):
+    """Returns an invoker that runs each shard as a synchronous worker invocation."""
+    lambda_client = boto3.client('lambda', config=Config(
+        max_pool_connections=BROADCAST_MAX_SHARDS_IN_FLIGHT,
+        tcp_keepalive=True,
+        read_timeout=900,
+        retries={'mode': 'standard', 'max_attempts': 2},
+    ))
+
+    def invoke(payload):
+        response = lambda_client.invoke(
+            FunctionName=function_name,
+            InvocationType='RequestResponse',
+            Payload=json.dumps(payload).encode('utf-8')
+        )
+        result = json.loads(response['Payload'].read() or b'null')
+        if response.get('FunctionError') or not isinstance(result, dict):
+            raise RuntimeError(f"worker error: {response.get('FunctionError')} {result}")
+        return result
+    return invoke
+
+
+def create_local_invoker(client):
+    """In-process stand-in for the worker Lambda, sharing the given client."""
+    return lambda payload: broadcast_shard(client, payload)
+
+
+def set_shard_invoker(invoker):
+    global shard_invoker
+    shard_invoker = invoker
+
+
+def get_shard_invoker():
+    global shard_invoker
+    if shard_invoker is None:
+        shard_invoker = create_lambda_invoker()
+    return shard_invoker
+
+
+def broadcast_shard(client, payload):
+    """Worker side: posts payload['message'] to payload['connection_ids']."""
+    return broadcast(client, payload['connection_ids'], payload['message'],
+                     label=f"{payload.get('label', 'broadcast')}[shard {payload.get('shard', 0)}]")
+
+
+def iter_shards(connection_ids, shard_size):
+    connection_iter = iter(connection_ids)
+    while True:
+        shard = list(islice(connection_iter, shard_size))
+        if not shard:
+            return
+        yield shard
+
+
+def run_shard(invoker, payload):
+    try:
+        return invoker(payload)
+    except Exception as e:
+        log.error('shard %s failed', payload['shard'], label=payload['label'], error=e)
+        return None
+
+
+def fan_out(client, connection_ids, message, label='broadcast'):
+    """Broadcasts in-process, or across worker invocations for large cohorts.
+
+    Sharding applies when BROADCAST_SHARD_SIZE is set and more than one shard
+    of connections exists; otherwise this is exactly broadcast(). Returns
+    metrics of the same shape as broadcast(), aggregated over shards. A shard
+    whose worker invocation fails counts all of its connections as failed.
+    """
+    if BROADCAST_SHARD_SIZE <= 0:
+        return broadcast(client, connection_ids, message, label)
+    shards = iter_shards(connection_ids, BROADCAST_SHARD_SIZE)
+    first = next(shards, [])
+    second = next(shards, None)
+    if second is None:
+        return broadcast(client, first, message, label)
+
+    start = time.perf_counter()
+    invoker = get_shard_invoker()
+    payloads = [
+        {'label': label, 'shard': number, 'message': message, 'connection_ids': shard}
+        for number, shard in enumerate(chain([first, second], shards))
+    ]
+
+    with ThreadPoolExecutor(max_workers=min(BROADCAST_MAX_SHARDS_IN_FLIGHT, len(payloads))) as executor:
+        results = list(executor.map(lambda payload: run_shard(invoker, payload), payloads))
+    duration = time.perf_counter() - start
+
+    metrics = {
+        'connections': 0, 'sent': 0, 'stale': [], 'failed': 0, 'throttle_retries': 0,
+        'shards': len(payloads), 'failed_shards': 0,
+        'duration_ms': round(duration * 1000, 1),
+        'shard_ms_max': 0.0, 'send_ms_p95': 0.0, 'send_ms_max': 0.0,
+    }
+    for payload, result in zip(payloads, results):
+        metrics['connections'] += len(payload['connection_ids'])
+        if result is None:
+            metrics['failed_shards'] += 1
+            metrics['failed'] += len(payload['connection_ids'])
+            continue
+        metrics['sent'] += result['sent']
+        metrics['stale'].extend(result['stale'])
+        metrics['failed'] += result['failed']
+        metrics['throttle_retries'] += result['throttle_retries']
+        metrics['shard_ms_max'] = max(metrics['shard_ms_max'], result['duration_ms'])
+        metrics['send_ms_p95'] = max(metrics['send_ms_p95'], result['send_ms_p95'])
+        metrics['send_ms_max'] = max(metrics['send_ms_max'], result['send_ms_max'])
+    log.info('sharded broadcast sent', label=label, shards=metrics['shards'], failed_shards=metrics['failed_shards'],
+             sent=metrics['sent'], stale=len(metrics['stale']), failed=metrics['failed'],
+             throttle_retries=metrics['throttle_retries'], duration_ms=metrics['duration_ms'],
+             slowest_shard_ms=metrics['shard_ms_max'])
+    return metrics
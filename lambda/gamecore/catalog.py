@@ -0,0 +1,135 @@
+import os
+import json
+import time
+import hashlib
+from pymongo import ReturnDocument
+
+# How long a warm container trusts its cached catalog before re-checking the
+# version document. Lookups inside this window cost no DB round-trip at all.
+CATALOG_REVALIDATE_SECONDS = float(os.environ.get('CATALOG_REVALIDATE_SECONDS', 30))
+CATALOG_VERSION_ID = 'catalog'
+
+# catalog name -> (collection, path to the catalog inside its single document)
+CATALOG_SOURCES = {
+    'controls': ('controls_data', ('info', 'controls')),
+    'threats': ('threats', ('threats',)),
+    'situations': ('situations', ('situations',)),
+    'projects': ('specialProjects', ('projects',)),
+}
+
+# Process-wide cache shared by every invocation served by this container.
+# Cached catalogs are shared objects: callers must treat them as read-only.
+catalog_cache = {'version': None, 'checked_at': 0.0, 'entries': {}}
+
+
+def get_catalog_version(db):
+    """Reads the current catalog version with a single projected lookup."""
+    document = db.catalog_version.find_one({'_id': CATALOG_VERSION_ID}, {'version': 1})
+    return document.get('version', 0) if document else 0
+
+
+def revalidate(db, force=False):
+    """Drops cached catalogs if the version has moved since the last check."""
+    now = time.monotonic()
+    if (not force and catalog_cache['version'] is not None
+            and now - catalog_cache['checked_at'] < CATALOG_REVALIDATE_SECONDS):
+        return catalog_cache['version']
+    version = get_catalog_version(db)
+    if version != catalog_cache['version']:
+        catalog_cache['entries'] = {}
+        catalog_cache['version'] = version
+    catalog_cache['checked_at'] = now
+    return version
+
+
+def get_catalog(db, name):
+    """Returns the named catalog, loading it from the DB only on a cache miss."""
+    revalidate(db)
+    entries = catalog_cache['entries']
+    if name not in entries:
+        collection, path = CATALOG_SOURCES[name]
+        data = db[collection].find_one({}, {'_id': 0, '.'.join(path): 1})
+        for key in path:
+            data = data[key]
+        entries[name] = data
+    return entries[name]
+
+
+def get_derived(db, name, build):
+    """Returns build(db), recomputed only when the catalog version changes."""
+    revalidate(db)
+    key = ('derived', name)
+    entries = catalog_cache['entries']
+    if key not in entries:
+        entries[key] = build(db)
+    return entries[key]
+
+
+def get_controls(db):
+    return get_catalog(db, 'controls')
+
+
+def get_threats(db):
+    return get_catalog(db, 'threats')
+
+
+def get_situations(db):
+    return get_catalog(db, 'situations')
+
+
+def get_projects(db):
+    return get_catalog(db, 'projects')
+
+
+def catalog_digest(data):
+    """Content hash of a catalog, stable across key order."""
+    encoded = json.dumps(data, sort_keys=True, separators=(',', ':'), default=str).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+def build_player_controls(db):
+    controls = {key: {'control': value['control'], 'cost': value['cost']}
+                for key, value in get_controls(db).items()}
+    return {
+        'name': 'controls',
+        'version': catalog_cache['version'],
+        'hash': catalog_digest(controls),
+        'controls': controls
+    }
+
+
+def get_player_controls(db):
+    """The controls catalog as players see it (name and cost), with version and hash."""
+    return get_derived(db, 'player_controls', build_player_controls)
+
+
+def catalog_reference(catalog):
+    """The small catalog header sent over WebSocket instead of the full body."""
+    return {'name': catalog['name'], 'version': catalog['version'], 'hash': catalog['hash']}
+
+
+def catalog_delta(before, after):
+    """Entries added or changed and keys removed between two player catalogs."""
+    return {
+        'name': after['name'],
+        'base_version': before['version'],
+        'base_hash': before['hash'],
+        'version': after['version'],
+        'hash': after['hash'],
+        'upserted': {key: value for key, value in after['controls'].items() if before['controls'].get(key) != value},
+        'removed': [key for key in before['controls'] if key not in after['controls']]
+    }
+
+
+def bump_catalog_version(db):
+    """Invalidates every container's catalog cache after an admin change."""
+    document = db.catalog_version.find_one_and_update(
+        {'_id': CATALOG_VERSION_ID},
+        {'$inc': {'version': 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    catalog_cache['entries'] = {}
+    catalog_cache['version'] = document['version']
+    catalog_cache['checked_at'] = time.monotonic()
+    return document['version']
@@ -0,0 +1,40 @@
+import boto3
+from gamecore.broadcast import create_management_client
+
+# AWS clients are created on first use rather than at import, so a handler
+# module imports without credentials or a reachable endpoint, and a harness can
+# swap in fakes with set_client() before driving it. Clients are shared by all
+# invocations of a container, as they were when built at import time.
+clients = {}
+
+
+def get_client(name, factory):
+    """The client registered under name, created with factory() on first use."""
+    if name not in clients:
+        clients[name] = factory()
+    return clients[name]
+
+
+def set_client(name, client):
+    clients[name] = client
+
+
+def reset_clients():
+    clients.clear()
+
+
+def get_management_client(endpoint_url):
+    return get_client('apigatewaymanagementapi', lambda: create_management_client(endpoint_url))
+
+
+def get_lambda_client():
+    return get_client('lambda', lambda: boto3.client('lambda'))
+
+
+def get_s3_client():
+    return get_client('s3', lambda: boto3.client('s3'))
+
+
+def get_cognito_client(user_pool_id):
+    # A user pool id starts with its region, e.g. us-east-1_AbCdEf
+    return get_client('cognito-idp', lambda: boto3.client('cognito-idp', region_name=user_pool_id.split('_', 1)[0]))
@@ -0,0 +1,115 @@
+import os
+from datetime import datetime
+from botocore.exceptions import ClientError
+from pymongo.errors import DuplicateKeyError
+from gamecore.broadcast import run_parallel
+from gamecore.log import get_logger
+
+log = get_logger('gamecore.connections')
+
+# WebSocket connections are registered one document per connection in the
+# `connections` collection, keyed by the API Gateway connection id:
+#   {'_id': 'abc=', 'user_id': 'player1', 'connected_at': datetime}
+# The _id index makes $connect / $disconnect single indexed writes with no
+# read-modify-write on a shared document; the user_id index serves targeted pushes.
+CONNECTIONS_COLLECTION = 'connections'
+CONNECTION_CURSOR_BATCH_SIZE = int(os.environ.get('CONNECTION_CURSOR_BATCH_SIZE', 1000))
+
+indexes_ensured = False
+
+
+def ensure_connection_indexes(db):
+    """Creates the user_id index once per container."""
+    global indexes_ensured
+    if not indexes_ensured:
+        db[CONNECTIONS_COLLECTION].create_index('user_id', sparse=True)
+        indexes_ensured = True
+
+
+def get_connection_user_id(event):
+    """The authenticated user of a $connect event, or None.
+
+    Reads the context set by the route's REQUEST authorizer (wsAuthorizer.py):
+    context.user_id, falling back to its principalId.
+    """
+    authorizer = event.get('requestContext', {}).get('authorizer') or {}
+    return authorizer.get('user_id') or authorizer.get('principalId')
+
+
+def register_connection(db, connection_id, user_id=None):
+    """Records a new connection. A replayed $connect for the same id is a no-op."""
+    ensure_connection_indexes(db)
+    document = {'_id': connection_id, 'connected_at': datetime.utcnow()}
+    if user_id:
+        document['user_id'] = user_id
+    try:
+        db[CONNECTIONS_COLLECTION].insert_one(document)
+        return True
+    except DuplicateKeyError:
+        return False
+
+
+def unregister_connection(db, connection_id):
+    """Removes one connection; returns True if it was registered."""
+    return db[CONNECTIONS_COLLECTION].delete_one({'_id': connection_id}).deleted_count > 0
+
+
+def iter_connection_ids(db):
+    """Streams every registered connection id from a covered _id cursor."""
+    cursor = db[CONNECTIONS_COLLECTION].find({}, {'_id': 1}).batch_size(CONNECTION_CURSOR_BATCH_SIZE)
+    for document in cursor:
+        yield document['_id']
+
+
+def iter_user_connections(db, user_ids):
+    """Streams (connection_id, user_id) for the connections of the given users."""
+    cursor = db[CONNECTIONS_COLLECTION].find(
+        {'user_id': {'$in': list(user_ids)}}, {'_id': 1, 'user_id': 1}
+    ).batch_size(CONNECTION_CURSOR_BATCH_SIZE)
+    for document in cursor:
+        yield document['_id'], document['user_id']
+
+
+def get_connection_ids(db):
+    """Returns every registered connection id as a list."""
+    return list(iter_connection_ids(db))
+
+
+def prune_connections(db, connection_ids):
+    """Removes the given connection ids with one delete_many."""
+    connection_ids = list(set(connection_ids))
+    if not connection_ids:
+        return 0
+    removed = db[CONNECTIONS_COLLECTION].delete_many({'_id': {'$in': connection_ids}}).deleted_count
+    log.info('Pruned %s stale connection ids', removed)
+    return removed
+
+
+def prune_stale_connections(db, metrics):
+    """Removes the connections a broadcast found to be gone."""
+    try:
+        return prune_connections(db, metrics['stale'])
+    except Exception as e:
+        log.error('Failed to prune stale connection ids', error=e)
+        return 0
+
+
+def is_connection_alive(client, connection_id):
+    """True unless the management API reports the connection as gone.
+
+    Any other error counts as alive so a transient failure never drops a
+    live player from the fan-out set.
+    """
+    try:
+        client.get_connection(ConnectionId=connection_id)
+        return True
+    except ClientError as e:
+        return e.response.get('Error', {}).get('Code') != 'GoneException'
+    except Exception:
+        return True
+
+
+def find_dead_connections(client, connection_ids):
+    """Checks connection liveness in parallel and returns the dead ids."""
+    alive = run_parallel(lambda connection_id: is_connection_alive(client, connection_id), connection_ids)
+    return [connection_id for connection_id, ok in zip(connection_ids, alive) if not ok]
@@ -0,0 +1,105 @@
+import os
+from pymongo import MongoClient
+from pymongo.errors import BulkWriteError
+from gamecore.log import get_logger
+from gamecore.tracing import TRACING_ENABLED, command_tracer
+
+log = get_logger('gamecore.db')
+
+# Pool settings are read once per container so they can be tuned per function
+# from the Lambda configuration without touching the handlers.
+DATABASE_NAME = os.environ.get('MONGODB_DATABASE', 'test')
+MAX_POOL_SIZE = int(os.environ.get('MONGODB_MAX_POOL_SIZE', 10))
+MIN_POOL_SIZE = int(os.environ.get('MONGODB_MIN_POOL_SIZE', 1))
+MAX_IDLE_TIME_MS = int(os.environ.get('MONGODB_MAX_IDLE_TIME_MS', 60000))
+SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGODB_SERVER_SELECTION_TIMEOUT_MS', 5000))
+CONNECT_TIMEOUT_MS = int(os.environ.get('MONGODB_CONNECT_TIMEOUT_MS', 5000))
+SOCKET_TIMEOUT_MS = int(os.environ.get('MONGODB_SOCKET_TIMEOUT_MS', 20000))
+BULK_WRITE_CHUNK_SIZE = int(os.environ.get('BULK_WRITE_CHUNK_SIZE', 1000))
+
+cached_client = None
+cached_db = None
+
+
+def create_client(uri):
+    """Create a MongoClient with the explicit pool and timeout settings."""
+    return MongoClient(
+        uri,
+        maxPoolSize=MAX_POOL_SIZE,
+        minPoolSize=MIN_POOL_SIZE,
+        maxIdleTimeMS=MAX_IDLE_TIME_MS,
+        serverSelectionTimeoutMS=SERVER_SELECTION_TIMEOUT_MS,
+        connectTimeoutMS=CONNECT_TIMEOUT_MS,
+        socketTimeoutMS=SOCKET_TIMEOUT_MS,
+        retryWrites=True,
+        retryReads=True,
+        appname=os.environ.get('AWS_LAMBDA_FUNCTION_NAME', 'game-backend'),
+        event_listeners=[command_tracer] if TRACING_ENABLED else [],
+    )
+
+
+def connect_to_database(uri=None):
+    """Return the cached database handle, creating the pooled client on first use."""
+    global cached_client, cached_db
+    if cached_db is not None:
+        return cached_db
+    uri = uri or os.environ['MONGODB_URI']
+    try:
+        cached_client = create_client(uri)
+        cached_db = cached_client[DATABASE_NAME]
+    except Exception as e:
+        log.error('Error connecting to database', error=e)
+        raise
+    return cached_db
+
+
+def set_database(db):
+    """Makes db the cached handle, e.g. a local or in-memory database for the harness."""
+    global cached_client, cached_db
+    cached_client = db.client
+    cached_db = db
+
+
+def warm_up(uri=None):
+    """Create the pool during Lambda init and open the first connection.
+
+    Called at module import time by every handler so the TCP/TLS handshake and
+    server selection are paid for in the init phase rather than by the first
+    request. A failure here is not fatal: the handler retries on demand.
+    """
+    try:
+        db = connect_to_database(uri)
+        db.client.admin.command('ping')
+        return db
+    except Exception as e:
+        log.warning('Database warm up failed, will retry on first request', error=e)
+        return None
+
+
+def bulk_write_chunked(collection, requests, chunk_size=BULK_WRITE_CHUNK_SIZE):
+    """Sends write requests as unordered bulk_write batches of chunk_size.
+
+    `requests` may be any iterable, including a generator fed by a cursor, so
+    the full write set never has to be held in memory. A failing chunk is
+    logged and does not stop the remaining chunks. Returns the number of
+    modified documents.
+    """
+    modified_count = 0
+    chunk = []
+
+    def flush(chunk):
+        try:
+            return collection.bulk_write(chunk, ordered=False).modified_count
+        except BulkWriteError as e:
+            details = e.details or {}
+            log.error('bulk_write on %s had %s failed writes', collection.name, len(details.get('writeErrors', [])))
+            return details.get('nModified', 0)
+
+    for request in requests:
+        chunk.append(request)
+        if len(chunk) >= chunk_size:
+            modified_count += flush(chunk)
+            chunk = []
+    if chunk:
+        modified_count += flush(chunk)
+    return modified_count
@@ -0,0 +1,184 @@
+import numpy as np
+from gamecore.catalog import get_controls, get_projects, get_derived
+
+# One generator per container; seeded from OS entropy like `random`.
+rng = np.random.default_rng()
+# purchase_order of a control the player does not own
+NOT_OWNED = np.iinfo(np.int32).max
+
+
+def parse_percent(value):
+    """Converts catalog strings such as '50%' (or bare numbers) to a fraction."""
+    return float(str(value).strip('%')) / 100
+
+
+def compile_effectiveness(controls_data, tasks_data):
+    """Compiles the catalog into controls x threats and projects x threats matrices.
+
+    Rows are addressed by control / project name, which is how player
+    documents refer to them. The original catalog strings are kept so level
+    records keep showing e.g. '50%' rather than 0.5.
+    """
+    control_index = {}
+    for control in controls_data.values():
+        control_index.setdefault(control['control'], len(control_index))
+    task_index = {}
+    for task in tasks_data.values():
+        task_index.setdefault(task['name'], len(task_index))
+
+    threat_keys = sorted({threat_key for item in list(controls_data.values()) + list(tasks_data.values())
+                          for threat_key in item.get('effectiveness', {})})
+    threat_index = {threat_key: idx for idx, threat_key in enumerate(threat_keys)}
+
+    control_matrix = np.zeros((len(control_index), len(threat_index)))
+    control_labels = {}
+    for control in controls_data.values():
+        row = control_index[control['control']]
+        control_matrix[row, :] = 0
+        for threat_key, effectiveness in control.get('effectiveness', {}).items():
+            control_matrix[row, threat_index[threat_key]] = parse_percent(effectiveness)
+            control_labels[(row, threat_index[threat_key])] = effectiveness
+
+    task_matrix = np.zeros((len(task_index), len(threat_index)))
+    task_labels = {}
+    for task in tasks_data.values():
+        row = task_index[task['name']]
+        task_matrix[row, :] = 0
+        for threat_key, effectiveness in task.get('effectiveness', {}).items():
+            task_matrix[row, threat_index[threat_key]] = parse_percent(effectiveness)
+            task_labels[(row, threat_index[threat_key])] = effectiveness
+
+    return {
+        'control_index': control_index,
+        'control_names': list(control_index),
+        'task_index': task_index,
+        'task_names': list(task_index),
+        'threat_index': threat_index,
+        'control_matrix': control_matrix,
+        'control_labels': control_labels,
+        'task_matrix': task_matrix,
+        'task_labels': task_labels
+    }
+
+
+def get_effectiveness_model(db):
+    """Returns the compiled matrices for the current catalog version."""
+    return get_derived(db, 'effectiveness', lambda db: compile_effectiveness(get_controls(db), get_projects(db)))
+
+
+def build_cohort(model, players):
+    """Builds the user x control and user x project ownership bitmaps.
+
+    Each player is a dict with `controls` (names, in purchase order), `tasks`
+    (names) and `degraded_controls` (names whose effect is suspended by a
+    situation). Names that are no longer in the catalog are ignored, as they
+    carry no effectiveness. Also returns each owned control's position in the
+    player's `controls`, which breaks ties for the most effective control.
+    """
+    control_index = model['control_index']
+    task_index = model['task_index']
+    owned = np.zeros((len(players), len(control_index)), dtype=bool)
+    purchase_order = np.full((len(players), len(control_index)), NOT_OWNED, dtype=np.int32)
+    completed = np.zeros((len(players), len(task_index)), dtype=bool)
+    for row, player in enumerate(players):
+        degraded = player.get('degraded_controls', ())
+        for position, name in enumerate(player.get('controls', ())):
+            col = control_index.get(name)
+            if col is not None and name not in degraded and not owned[row, col]:
+                owned[row, col] = True
+                purchase_order[row, col] = position
+        for name in player.get('tasks', ()):
+            col = task_index.get(name)
+            if col is not None:
+                completed[row, col] = True
+    return owned, completed, purchase_order
+
+
+def resolve_attack(model, owned, completed, threat_key, purchase_order):
+    """Resolves one attack for the whole cohort with vectorized array operations.
+
+    Combined effectiveness is 1 - prod(1 - e) over every owned control and
+    completed project. The attack succeeds when a uniform draw in [0, 99]
+    exceeds the combined effectiveness truncated to a whole percent, or
+    always when that percentage is zero. The most effective control is the
+    one with the highest whole percent, and of equals the one bought first,
+    as in the original per-player loop. Returns a dict of per-user arrays.
+    """
+    users = owned.shape[0]
+    threat = model['threat_index'].get(threat_key)
+    if threat is None:
+        control_effectiveness = np.zeros(owned.shape[1])
+        task_effectiveness = np.zeros(completed.shape[1])
+    else:
+        control_effectiveness = model['control_matrix'][:, threat]
+        task_effectiveness = model['task_matrix'][:, threat]
+
+    owned_effectiveness = owned * control_effectiveness
+    completed_effectiveness = completed * task_effectiveness
+    survival = (1 - owned_effectiveness).prod(axis=1) * (1 - completed_effectiveness).prod(axis=1)
+    combined = 1 - survival
+
+    effectiveness_percent = np.floor(np.round(combined * 100, 2)).astype(int)
+    draws = rng.integers(0, 100, size=users)
+    successful = np.where(effectiveness_percent > 0, draws > effectiveness_percent, True)
+
+    if owned.shape[1]:
+        owned_percent = np.round(owned_effectiveness * 100)
+        best_percent = owned_percent.max(axis=1)
+        best_control = np.where(owned_percent == best_percent[:, None], purchase_order, NOT_OWNED).argmin(axis=1)
+        has_best_control = best_percent >= 1
+    else:
+        best_control = np.zeros(users, dtype=int)
+        has_best_control = np.zeros(users, dtype=bool)
+
+    return {
+        'threat': threat,
+        'combined': combined,
+        'successful': successful,
+        'best_control': best_control,
+        'has_best_control': has_best_control,
+        'owned_effectiveness': owned_effectiveness,
+        'completed_effectiveness': completed_effectiveness
+    }
+
+
+def describe_outcomes(model, outcome):
+    """Returns the per-user values recorded in each player's level entry.
+
+    Matches the shape produced by the original per-user code: combined
+    effectiveness as a '12.34%' string, the name of the most effective owned
+    control, and {name: '50%'} maps of contributing controls and projects.
+    The whole batch is converted with one nonzero() per matrix so the
+    Python-side work is proportional to the number of contributing items.
+    """
+    threat = outcome['threat']
+    users = len(outcome['combined'])
+
+    controls_lists = [{} for _ in range(users)]
+    control_names = model['control_names']
+    control_labels = [model['control_labels'].get((col, threat)) for col in range(len(control_names))]
+    rows, cols = np.nonzero(outcome['owned_effectiveness'])
+    for row, col in zip(rows.tolist(), cols.tolist()):
+        controls_lists[row][control_names[col]] = control_labels[col]
+
+    task_lists = [{} for _ in range(users)]
+    task_names = model['task_names']
+    task_labels = [model['task_labels'].get((col, threat)) for col in range(len(task_names))]
+    rows, cols = np.nonzero(outcome['completed_effectiveness'])
+    for row, col in zip(rows.tolist(), cols.tolist()):
+        task_lists[row][task_names[col]] = task_labels[col]
+
+    combined = outcome['combined'].tolist()
+    successful = outcome['successful'].tolist()
+    best_control = outcome['best_control'].tolist()
+    has_best_control = outcome['has_best_control'].tolist()
+    return [
+        {
+            'is_attack_successfull': successful[row],
+            'controls_tasks_combined_effectiveness': f"{combined[row] * 100:.2f}%",
+            'max_effective_control': control_names[best_control[row]] if has_best_control[row] else "",
+            'controls_effectiveness_list': controls_lists[row],
+            'task_effectiveness_list': task_lists[row]
+        }
+        for row in range(users)
+    ]
@@ -0,0 +1,140 @@
+import json
+import base64
+from datetime import datetime
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import InsertOne
+
+# Per-player histories live in the append-only `userEvents` collection rather
+# than in arrays on the player document, so usersData stays a fixed size:
+#   {'user_id': 'player1', 'kind': 'attack', 'ts': datetime, 'seq': 3, 'level': {...}, 'threat': {...}}
+# Each history served by /getUserStats maps to an event kind and the field of
+# that event holding the entry. One attack event carries both its level and
+# its threat entry, so resolving an attack appends one document per player.
+USER_EVENTS_COLLECTION = 'userEvents'
+HISTORY_EVENTS = {
+    'levels': ('attack', 'level'),
+    'threats': ('attack', 'threat'),
+    'situations': ('situation', 'situation'),
+    'tasks': ('task', 'task'),
+    'assigned_budget': ('budget', 'budget'),
+}
+
+indexes_ensured = False
+
+
+def ensure_event_indexes(db):
+    """Creates the history paging index once per container."""
+    global indexes_ensured
+    if not indexes_ensured:
+        db[USER_EVENTS_COLLECTION].create_index([('user_id', 1), ('kind', 1), ('ts', 1), ('_id', 1)])
+        indexes_ensured = True
+
+
+def make_event(user_id, kind, fields, ts=None):
+    event = {'user_id': user_id, 'kind': kind, 'ts': ts or datetime.utcnow()}
+    event.update(fields)
+    return event
+
+
+def record_event(db, user_id, kind, fields, ts=None):
+    """Appends one event for a player."""
+    ensure_event_indexes(db)
+    db[USER_EVENTS_COLLECTION].insert_one(make_event(user_id, kind, fields, ts))
+
+
+def event_insert(user_id, kind, fields, ts=None):
+    """InsertOne request for bulk appends, e.g. one per player of an attack."""
+    return InsertOne(make_event(user_id, kind, fields, ts))
+
+
+def encode_cursor(position):
+    """An opaque page token for a JSON-serializable position."""
+    return base64.urlsafe_b64encode(json.dumps(position, separators=(',', ':')).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """The position inside a page token; raises ValueError if it is not one."""
+    try:
+        position = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError('malformed cursor') from e
+    if not isinstance(position, dict):
+        raise ValueError('malformed cursor')
+    return position
+
+
+def decode_history_cursor(token):
+    """The (ts, _id) after which a history page starts; raises ValueError if token is not one."""
+    position = decode_cursor(token)
+    try:
+        return datetime.fromisoformat(position['ts']), ObjectId(position['id'])
+    except (KeyError, TypeError, ValueError, InvalidId) as e:
+        raise ValueError('malformed cursor') from e
+
+
+def find_event_page(db, user_id, kind, fields, cursor, limit):
+    """Returns (events, next_cursor) for one keyset page of a player's events of kind.
+
+    Pages are keyset pages on (ts, _id), served by the (user_id, kind, ts, _id)
+    index: cursor is the token returned with the previous page, or None for
+    the first one, so every page costs the same and events appended meanwhile
+    do not shift it. next_cursor is None on the last page.
+    """
+    query = {'user_id': user_id, 'kind': kind}
+    if cursor:
+        ts, event_id = decode_history_cursor(cursor)
+        query['$or'] = [{'ts': {'$gt': ts}}, {'ts': ts, '_id': {'$gt': event_id}}]
+    projection = dict.fromkeys(fields, 1)
+    projection.update(seq=1, ts=1)
+    # one extra event tells whether another page exists
+    events = list(db[USER_EVENTS_COLLECTION].find(query, projection).sort([('ts', 1), ('_id', 1)]).limit(limit + 1))
+    next_cursor = None
+    if len(events) > limit:
+        events = events[:limit]
+        next_cursor = encode_cursor({'ts': events[-1]['ts'].isoformat(), 'id': str(events[-1]['_id'])})
+    return events, next_cursor
+
+
+def get_history_entries(events, history):
+    # levels come back as (level number, entry) pairs, everything else as plain entries
+    field = HISTORY_EVENTS[history][1]
+    if history == 'levels':
+        return [(event.get('seq'), event.get(field)) for event in events if field in event]
+    return [event[field] for event in events if field in event]
+
+
+def get_history_page(db, user_id, history, cursor, limit):
+    """Returns (entries, next_cursor) for one page of a history, oldest first."""
+    kind, field = HISTORY_EVENTS[history]
+    events, next_cursor = find_event_page(db, user_id, kind, [field], cursor, limit)
+    return get_history_entries(events, history), next_cursor
+
+
+def get_first_pages(db, user_id, limit):
+    """Returns the first page of every history in the shape they had on usersData.
+
+    levels is an object keyed by level number and threats a list, both always
+    present as on documents created by /play; situations, tasks and
+    assigned_budget appear once they have an entry. next_cursors maps each
+    history with more entries to the cursor of its second page. One query of
+    at most limit + 1 events per event kind, so the cost does not grow with
+    the length of the histories.
+    """
+    histories = {'levels': {}, 'threats': []}
+    next_cursors = {}
+    histories_by_kind = {}
+    for history, (kind, field) in HISTORY_EVENTS.items():
+        histories_by_kind.setdefault(kind, []).append(history)
+    for kind, kind_histories in histories_by_kind.items():
+        fields = [HISTORY_EVENTS[history][1] for history in kind_histories]
+        events, next_cursor = find_event_page(db, user_id, kind, fields, None, limit)
+        for history in kind_histories:
+            entries = get_history_entries(events, history)
+            if history == 'levels':
+                histories['levels'] = {str(number): level for number, level in entries}
+            elif entries or history in histories:
+                histories[history] = entries
+            if next_cursor:
+                next_cursors[history] = next_cursor
+    return histories, next_cursors
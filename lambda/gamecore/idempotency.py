@@ -0,0 +1,123 @@
+import os
+import json
+import hashlib
+import functools
+from datetime import datetime, timedelta
+from pymongo.errors import DuplicateKeyError
+from gamecore.db import connect_to_database
+from gamecore.responses import get_request_header, return_error
+from gamecore.log import get_logger
+
+# Mutating player endpoints accept an `Idempotency-Key` header. The first
+# request with a key claims it with an in-progress placeholder in the
+# `idempotencyKeys` collection and stores its response once it finishes:
+#   {'_id': 'player1:/selectControls:<key>', 'fingerprint': ..., 'status': 'completed', 'response': {...}, 'created_at': datetime}
+# A replay gets the stored response without touching player state. 5xx
+# responses are not stored, so the client can retry them. A TTL index drops
+# keys after IDEMPOTENCY_TTL_SECONDS.
+IDEMPOTENCY_COLLECTION = 'idempotencyKeys'
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', 86400))
+# A placeholder older than this belongs to an invocation that died mid-request
+# (e.g. a Lambda timeout) and may be claimed again.
+IDEMPOTENCY_LOCK_SECONDS = int(os.environ.get('IDEMPOTENCY_LOCK_SECONDS', 60))
+MAX_KEY_LENGTH = 255
+
+indexes_ensured = False
+
+
+def ensure_idempotency_indexes(db):
+    """Creates the TTL index once per container."""
+    global indexes_ensured
+    if not indexes_ensured:
+        db[IDEMPOTENCY_COLLECTION].create_index('created_at', expireAfterSeconds=IDEMPOTENCY_TTL_SECONDS)
+        indexes_ensured = True
+
+
+def get_request_fingerprint(event):
+    """Hash of what the request asks for, so a key cannot be reused for another request."""
+    request = {
+        'path': event.get('path'),
+        'method': event.get('httpMethod'),
+        'params': event.get('multiValueQueryStringParameters') or {},
+        'body': event.get('body')
+    }
+    return hashlib.sha256(json.dumps(request, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def claim_key(db, key_id, fingerprint, now):
+    """Claims key_id for this invocation; returns None or the existing record."""
+    collection = db[IDEMPOTENCY_COLLECTION]
+    try:
+        collection.insert_one({'_id': key_id, 'fingerprint': fingerprint, 'status': 'in_progress', 'created_at': now})
+        return None
+    except DuplicateKeyError:
+        pass
+    # Take over a placeholder left by an invocation that never finished
+    stale = collection.update_one(
+        {'_id': key_id, 'fingerprint': fingerprint, 'status': 'in_progress',
+         'created_at': {'$lt': now - timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS)}},
+        {'$set': {'created_at': now}}
+    )
+    if stale.modified_count:
+        return None
+    return collection.find_one({'_id': key_id}) or {'status': 'in_progress', 'fingerprint': fingerprint}
+
+
+def get_replay_response(record, fingerprint):
+    if record['fingerprint'] != fingerprint:
+        return return_error(422, 'Idempotency-Key has already been used for a different request.')
+    if record['status'] != 'completed':
+        return return_error(409, 'A request with this Idempotency-Key is still being processed.')
+    response = dict(record['response'])
+    response['headers'] = {**response.get('headers', {}), 'Idempotent-Replayed': 'true'}
+    return response
+
+
+def idempotent(handler_name):
+    """Decorates a lambda_handler so requests carrying an Idempotency-Key run once.
+
+    Requests without the header, or without a user, go straight to the
+    handler. If the idempotency store itself fails the request is processed
+    normally rather than rejected.
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            key = get_request_header(event, IDEMPOTENCY_HEADER)
+            user_id = event.get('requestContext', {}).get('authorizer', {}).get('claims', {}).get('username', None)
+            if not key or not user_id:
+                return handler(event, context)
+            if len(key) > MAX_KEY_LENGTH:
+                return return_error(400, f'{IDEMPOTENCY_HEADER} must be at most {MAX_KEY_LENGTH} characters.')
+
+            log = get_logger(handler_name)
+            key_id = f"{user_id}:{event.get('path')}:{key}"
+            fingerprint = get_request_fingerprint(event)
+            try:
+                db = connect_to_database()
+                ensure_idempotency_indexes(db)
+                record = claim_key(db, key_id, fingerprint, datetime.utcnow())
+            except Exception as e:
+                log.warning('Idempotency store unavailable, processing without it', user_id=user_id, error=e)
+                return handler(event, context)
+            if record:
+                log.info('Replaying idempotent request %s', key, user_id=user_id)
+                return get_replay_response(record, fingerprint)
+
+            response = None
+            try:
+                response = handler(event, context)
+                return response
+            finally:
+                try:
+                    if response is not None and response.get('statusCode', 500) < 500:
+                        db[IDEMPOTENCY_COLLECTION].update_one(
+                            {'_id': key_id}, {'$set': {'status': 'completed', 'response': response}}
+                        )
+                    else:
+                        db[IDEMPOTENCY_COLLECTION].delete_one({'_id': key_id, 'status': 'in_progress'})
+                except Exception as e:
+                    log.error('Failed to store the idempotent response', user_id=user_id, error=e)
+        return wrapper
+    return decorator
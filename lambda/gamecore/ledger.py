@@ -0,0 +1,82 @@
+from datetime import datetime
+from pymongo import ReturnDocument
+
+# Every change to a player's budget_left is an atomic increment on the player
+# document plus an append to the `budgetLedger` collection:
+#   {'user_id': 'player1', 'ts': datetime, 'amount': -1500, 'reason': 'controls', 'balance': 3500, 'ref': [...]}
+# Spends carry a `budget_left >= amount` guard in the update filter, so the
+# balance never goes negative and no handler reads the balance before writing
+# it. Summing a player's amounts reproduces their balance.
+BUDGET_LEDGER_COLLECTION = 'budgetLedger'
+# Documents created before budget_left existed spend from initial_budget, so
+# guards and increments work before migrateUserHistory.backfill_budget_left runs
+SPENDABLE_BUDGET = {'$ifNull': ['$budget_left', {'$toInt': '$initial_budget'}]}
+
+indexes_ensured = False
+
+
+def ensure_ledger_indexes(db):
+    """Creates the (user_id, ts) index once per container."""
+    global indexes_ensured
+    if not indexes_ensured:
+        db[BUDGET_LEDGER_COLLECTION].create_index([('user_id', 1), ('ts', 1)])
+        indexes_ensured = True
+
+
+def record_ledger_entry(db, user_id, amount, reason, balance, ref=None):
+    """Appends one budget change to the ledger."""
+    ensure_ledger_indexes(db)
+    entry = {'user_id': user_id, 'ts': datetime.utcnow(), 'amount': amount, 'reason': reason, 'balance': balance}
+    if ref is not None:
+        entry['ref'] = ref
+    db[BUDGET_LEDGER_COLLECTION].insert_one(entry)
+
+
+def budget_guard(amount):
+    """Filter keeping budget_left non-negative after adding amount."""
+    return {'$expr': {'$gte': [SPENDABLE_BUDGET, -amount]}} if amount < 0 else {}
+
+
+def budget_increment(amount, update=None):
+    """Appends the balance and version increments to an update pipeline.
+
+    update is an aggregation pipeline of the other changes, or None. The final
+    stage adds amount to SPENDABLE_BUDGET, which $inc could not fall back from.
+    """
+    return list(update or []) + [{'$set': {
+        'budget_left': {'$add': [SPENDABLE_BUDGET, amount]},
+        'version': {'$add': [{'$ifNull': ['$version', 0]}, 1]}
+    }}]
+
+
+def change_budget(db, user_id, amount, reason, guards=None, update=None, ref=None):
+    """Atomically adds amount (negative for a spend) to budget_left and records it.
+
+    guards are extra filter conditions and update extra changes applied in the
+    same write. Returns the player's post-image, or None when no player
+    matched, i.e. not registered, a guard failed or the budget was too small.
+    """
+    query = {'user_id': user_id}
+    query.update(guards or {})
+    query.update(budget_guard(amount))
+    user_data = db.usersData.find_one_and_update(
+        query, budget_increment(amount, update), projection={'_id': 0}, return_document=ReturnDocument.AFTER
+    )
+    if user_data:
+        record_ledger_entry(db, user_id, amount, reason, user_data['budget_left'], ref)
+    return user_data
+
+
+def backfill_budget_left(db):
+    """Gives documents created before budget_left existed their initial budget.
+
+    Bumps version like every other write, so /getUserStats ETags change.
+    """
+    result = db.usersData.update_many(
+        {'budget_left': {'$exists': False}, 'initial_budget': {'$exists': True}},
+        [{'$set': {
+            'budget_left': {'$toInt': '$initial_budget'},
+            'version': {'$add': [{'$ifNull': ['$version', 0]}, 1]}
+        }}]
+    )
+    return result.modified_count
@@ -0,0 +1,136 @@
+import os
+import sys
+import json
+import random
+
+# One JSON line per record on stdout, which CloudWatch ingests as is:
+#   {"level": "INFO", "logger": "gameSelectControls", "msg": "Chosen controls are ['A']", "user_id": "player1"}
+# Messages use %-style arguments and are only formatted for records that are
+# emitted. DEBUG and INFO records are sampled per invocation (WARNING and
+# ERROR always go out), and field values are redacted and size-capped so a
+# whole event or document never ends up in the logs. The handler's logger
+# draws the sample in start() and every logger, gamecore's included, follows
+# it for the rest of the invocation.
+LEVELS = {'DEBUG': 10, 'INFO': 20, 'WARNING': 30, 'ERROR': 40}
+LOG_LEVEL = LEVELS.get(os.environ.get('LOG_LEVEL', 'INFO').upper(), LEVELS['INFO'])
+# Overrides the sample rate every handler sets for itself
+LOG_SAMPLE_RATE = os.environ.get('LOG_SAMPLE_RATE')
+# Default for handlers every player calls many times a game: at full rate their
+# INFO records would cost more per request than the print()s they replaced
+REQUEST_SAMPLE_RATE = 0.1
+LOG_FIELD_MAX_CHARS = int(os.environ.get('LOG_FIELD_MAX_CHARS', 256))
+LOG_FIELD_MAX_ITEMS = int(os.environ.get('LOG_FIELD_MAX_ITEMS', 20))
+LOG_FIELD_MAX_DEPTH = 3
+REDACTED_KEYS = {'authorization', 'cookie', 'password', 'token', 'access_token', 'id_token',
+                 'refresh_token', 'x-api-key', 'x-amz-security-token'}
+
+loggers = {}
+encoder = json.JSONEncoder(default=str)
+# Whether the current invocation's DEBUG and INFO records are emitted
+sampled = True
+
+
+def redact(value, depth=0):
+    """A JSON-safe copy of value with secrets masked and sizes capped."""
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, str) and len(value) <= LOG_FIELD_MAX_CHARS:
+        return value
+    if depth >= LOG_FIELD_MAX_DEPTH:
+        return '[...]'
+    if isinstance(value, dict):
+        items = list(value.items())
+        capped = {str(key): '[redacted]' if str(key).lower() in REDACTED_KEYS else redact(item, depth + 1)
+                  for key, item in items[:LOG_FIELD_MAX_ITEMS]}
+        if len(items) > LOG_FIELD_MAX_ITEMS:
+            capped['...'] = f'{len(items) - LOG_FIELD_MAX_ITEMS} more'
+        return capped
+    if isinstance(value, (list, tuple, set)):
+        items = list(value)
+        if len(items) <= LOG_FIELD_MAX_ITEMS and all(type(item) is str and len(item) <= LOG_FIELD_MAX_CHARS for item in items):
+            return items
+        capped = [redact(item, depth + 1) for item in items[:LOG_FIELD_MAX_ITEMS]]
+        if len(items) > LOG_FIELD_MAX_ITEMS:
+            capped.append(f'... {len(items) - LOG_FIELD_MAX_ITEMS} more')
+        return capped
+    text = str(value)
+    if len(text) > LOG_FIELD_MAX_CHARS:
+        return f'{text[:LOG_FIELD_MAX_CHARS]}... ({len(text)} chars)'
+    return text
+
+
+def summarize_event(event):
+    """The parts of a Lambda event worth logging, without headers or bodies."""
+    request_context = event.get('requestContext') or {}
+    summary = {
+        'path': event.get('path') or request_context.get('routeKey'),
+        'params': event.get('multiValueQueryStringParameters'),
+        'source': event.get('source') or event.get('detail-type')
+    }
+    return {key: value for key, value in summary.items() if value}
+
+
+class Logger:
+    """Leveled, sampled JSON logger for one handler or gamecore module."""
+
+    def __init__(self, name, sample_rate=1.0):
+        self.name = name
+        self.level = LOG_LEVEL
+        self.sample_rate = float(LOG_SAMPLE_RATE) if LOG_SAMPLE_RATE else sample_rate
+        self.context = {}
+
+    def start(self, event, **fields):
+        """Begins an invocation: draws its sample for all loggers and binds the caller.
+
+        The request summary is logged at DEBUG, never the event itself.
+        """
+        global sampled
+        sampled = random.random() < self.sample_rate
+        request_context = event.get('requestContext') or {}
+        self.context = {}
+        user_id = (request_context.get('authorizer') or {}).get('claims', {}).get('username')
+        if user_id:
+            self.context['user_id'] = user_id
+        if request_context.get('connectionId'):
+            self.context['connection_id'] = request_context['connectionId']
+        self.context.update(fields)
+        if self.enabled(LEVELS['DEBUG']):
+            self.emit('DEBUG', 'request', (), {'request': summarize_event(event)})
+
+    def bind(self, **fields):
+        self.context.update(fields)
+
+    def enabled(self, level):
+        return level >= self.level and (sampled or level >= LEVELS['WARNING'])
+
+    def emit(self, level_name, msg, args, fields):
+        if args:
+            msg = msg % tuple(arg if isinstance(arg, (int, float)) else redact(arg) for arg in args)
+        record = {'level': level_name, 'logger': self.name, 'msg': msg}
+        record.update(self.context)
+        if fields:
+            record.update(redact(fields))
+        sys.stdout.write(encoder.encode(record) + '\n')
+
+    def debug(self, msg, *args, **fields):
+        if self.enabled(LEVELS['DEBUG']):
+            self.emit('DEBUG', msg, args, fields)
+
+    def info(self, msg, *args, **fields):
+        if self.enabled(LEVELS['INFO']):
+            self.emit('INFO', msg, args, fields)
+
+    def warning(self, msg, *args, **fields):
+        if self.enabled(LEVELS['WARNING']):
+            self.emit('WARNING', msg, args, fields)
+
+    def error(self, msg, *args, **fields):
+        if self.enabled(LEVELS['ERROR']):
+            self.emit('ERROR', msg, args, fields)
+
+
+def get_logger(name, sample_rate=1.0):
+    """The logger for name, created once per container."""
+    if name not in loggers:
+        loggers[name] = Logger(name, sample_rate)
+    return loggers[name]
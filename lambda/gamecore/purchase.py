@@ -0,0 +1,134 @@
+from datetime import datetime, timedelta
+from gamecore.catalog import get_controls, get_derived
+from gamecore.ledger import change_budget
+
+# Purchases are a single conditional find_one_and_update through the budget
+# ledger: the filter carries every precondition (registered, not in a finished
+# game, nothing bought twice, budget_left >= cost) and the update returns the
+# post-image, so a request reads the player at most once, and only to explain a
+# rejected purchase. Concurrent requests from one player cannot overspend: the
+# second one no longer matches.
+CONTROL_DEGRADE_MINUTES = 15
+DIAGNOSIS_PROJECTION = {'_id': 0, 'is_playing_status': 1, 'controls.control': 1, 'tasks_completed': 1}
+
+
+def parse_cost(cost):
+    return int(str(cost).replace("$", ""))
+
+
+def build_controls_cost_index(db):
+    """Controls sorted by cost, built once per catalog version.
+
+    'order' holds (cost, control) pairs cheapest first, 'position' a control's
+    bit in an owned-controls bitmap and 'cost' its parsed cost.
+    """
+    costs = {}
+    for control in get_controls(db).values():
+        costs.setdefault(control['control'], parse_cost(control['cost']))
+    order = sorted((cost, name) for name, cost in costs.items())
+    return {'order': order, 'position': {name: bit for bit, (_, name) in enumerate(order)}, 'cost': costs}
+
+
+def get_controls_cost_index(db):
+    return get_derived(db, 'controls_cost_index', build_controls_cost_index)
+
+
+def get_controls_cost(cost_index, chosen_controls):
+    return sum(cost_index['cost'][control] for control in chosen_controls)
+
+
+def get_owned_controls(user_data):
+    return [control['control'] for control in user_data.get('controls', [])]
+
+
+def get_owned_mask(cost_index, owned_controls):
+    position = cost_index['position']
+    return sum(1 << position[control] for control in set(owned_controls) if control in position)
+
+
+def needs_budget(cost_index, owned_controls, budget_left):
+    """The apply_for_budget flag for a player.
+
+    A player needs more budget once budget_left no longer covers the two
+    cheapest controls they do not hold (or what is left, if fewer remain);
+    with no controls, once it is below 1000. Walks the cost-sorted index
+    past at most the owned controls, so it is O(owned) whatever the catalog
+    size.
+    """
+    if not owned_controls:
+        return budget_left < 1000
+    owned_mask = get_owned_mask(cost_index, owned_controls)
+    cheapest = []
+    for bit, (cost, _) in enumerate(cost_index['order']):
+        if not owned_mask >> bit & 1:
+            cheapest.append(cost)
+            if len(cheapest) == 2:
+                break
+    return budget_left < sum(cheapest)
+
+
+def purchase_controls(db, user_id, chosen_controls, cost, now=None):
+    """Buys chosen_controls for cost; returns the updated player or None.
+
+    Controls bought more than CONTROL_DEGRADE_MINUTES ago are dropped in the
+    same update and recorded in expired_controls.
+    """
+    now = now or datetime.utcnow()
+    threshold_time = now - timedelta(minutes=CONTROL_DEGRADE_MINUTES)
+    # $literal keeps catalog names such as '$x' from being read as field paths
+    all_controls = {'$concatArrays': [
+        {'$ifNull': ['$controls', []]},
+        {'$literal': [{'control': control, 'timestamp': now} for control in chosen_controls]}
+    ]}
+    return change_budget(
+        db, user_id, -cost, 'controls',
+        guards={'is_playing_status': {'$ne': True}, 'controls.control': {'$nin': chosen_controls}},
+        update=[{'$set': {
+            'controls': {'$filter': {'input': all_controls, 'cond': {'$gt': ['$$this.timestamp', threshold_time]}}},
+            'expired_controls': {'$filter': {'input': all_controls, 'cond': {'$lte': ['$$this.timestamp', threshold_time]}}}
+        }}],
+        ref=chosen_controls
+    )
+
+
+def purchase_project(db, user_id, task_completed, cost):
+    """Pays for a completed special project; returns the updated player or None."""
+    return change_budget(
+        db, user_id, -cost, 'project',
+        guards={'is_playing_status': {'$ne': True}, 'tasks_completed': {'$ne': task_completed}},
+        update=[{'$set': {
+            'tasks_completed': {'$concatArrays': [{'$ifNull': ['$tasks_completed', []]}, {'$literal': [task_completed]}]}
+        }}],
+        ref=task_completed
+    )
+
+
+def diagnose_purchase(db, user_id, owned_items, owned_field):
+    """Explains a purchase that matched no player with one projected read.
+
+    Returns 'not_registered', 'playing', 'owned' (with the first item already
+    held, looked up in owned_field) or 'budget'.
+    """
+    user_data = db.usersData.find_one({'user_id': user_id}, DIAGNOSIS_PROJECTION)
+    if not user_data:
+        return 'not_registered', None
+    if user_data.get('is_playing_status', False):
+        return 'playing', None
+    if owned_field == 'controls':
+        owned = set(get_owned_controls(user_data))
+    else:
+        owned = set(user_data.get(owned_field, []))
+    for item in owned_items:
+        if item in owned:
+            return 'owned', item
+    return 'budget', None
+
+
+def set_apply_for_budget(db, user_id, user_data, apply_for_budget):
+    """Writes the apply_for_budget flag only when it changed."""
+    if user_data.get('apply_for_budget', False) == apply_for_budget:
+        return
+    db.usersData.update_one(
+        {'user_id': user_id},
+        {'$inc': {'version': 1}, '$set': {'apply_for_budget': apply_for_budget}}
+    )
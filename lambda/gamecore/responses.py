@@ -0,0 +1,76 @@
+import json
+import hashlib
+from datetime import datetime
+
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET',
+    'Access-Control-Allow-Headers': 'Content-Type,Idempotency-Key',
+    'Access-Control-Expose-Headers': 'ETag,Idempotent-Replayed',
+    'Content-Type': 'application/json'
+}
+
+
+class CustomJSONEncoder(json.JSONEncoder):
+    """ Custom JSON encoder for encoding datetime objects into ISO format. """
+    def default(self, obj):
+        if isinstance(obj, datetime):
+            return obj.isoformat()
+        return json.JSONEncoder.default(self, obj)
+
+
+def return_success(response_data, headers=None):
+    """Formats a successful HTTP response with JSON body."""
+    try:
+        response_body = json.dumps(response_data, cls=CustomJSONEncoder)
+    except Exception as e:
+        return return_error(500, f"JSON Encoding Error: {e}")
+    return {
+        'statusCode': 200,
+        'headers': {**CORS_HEADERS, **(headers or {})},
+        'body': response_body
+    }
+
+
+def return_not_modified(headers=None):
+    """Formats a 304 response; the client reuses the body it already has."""
+    return {
+        'statusCode': 304,
+        'headers': {**CORS_HEADERS, **(headers or {})},
+        'body': ''
+    }
+
+
+def get_request_header(event, name):
+    """Returns a request header from an API Gateway event, matched case-insensitively."""
+    name = name.lower()
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def return_error(status_code, error):
+    """Formats an error HTTP response based on the status code and error message."""
+    return {
+        'statusCode': status_code,
+        'headers': dict(CORS_HEADERS),
+        'body': json.dumps({'error': str(error)})
+    }
+
+
+def make_etag(*parts):
+    """Strong ETag derived from the given version parts."""
+    digest = hashlib.sha256('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()[:16]
+    return f'"{digest}"'
+
+
+def if_none_match(event, etag):
+    """True if the request's If-None-Match header already names etag."""
+    header = get_request_header(event, 'If-None-Match')
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    candidates = [value.strip() for value in header.split(',')]
+    return any(candidate.removeprefix('W/') == etag for candidate in candidates)
@@ -0,0 +1,171 @@
+import os
+import sys
+import json
+import time
+import threading
+import functools
+from collections.abc import Mapping
+import bson
+from pymongo import monitoring
+from gamecore.log import get_logger
+
+log = get_logger('gamecore.tracing')
+
+# Every MongoClient created by gamecore.db carries command_tracer, which adds
+# each command's round-trip to the current invocation's trace. Handlers wrapped
+# in `traced` export one trace per invocation. By default that is an embedded
+# metric format (EMF) log line, which CloudWatch turns into metrics without any
+# API calls:
+#   {"_aws": {...}, "Function": "gameSelectControls", "DbOperations": 3, "DbTimeMs": 4.1,
+#    "DbDocumentsReturned": 1, "HandlerTimeMs": 9.7, "db_commands": {"findAndModify": {"count": 1, "ms": 2.2}, ...}}
+# InMemoryExporter keeps the traces instead, for tests and benchmarks.
+TRACING_ENABLED = os.environ.get('TRACING_ENABLED', 'true').lower() == 'true'
+# What each command returned is always counted in documents, read from the
+# reply's batch. pymongo hands listeners the decoded reply, so its size in
+# bytes can only be had by encoding it again, doubling the BSON work of every
+# command: DbBytesReturned is off unless a deployment sets TRACE_REPLY_BYTES,
+# e.g. while sizing projections.
+TRACE_REPLY_BYTES = os.environ.get('TRACE_REPLY_BYTES', 'false').lower() == 'true'
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'GameBackend')
+EMF_METRICS = [
+    {'Name': 'DbOperations', 'Unit': 'Count'},
+    {'Name': 'DbFailedOperations', 'Unit': 'Count'},
+    {'Name': 'DbTimeMs', 'Unit': 'Milliseconds'},
+    {'Name': 'DbDocumentsReturned', 'Unit': 'Count'},
+    {'Name': 'HandlerTimeMs', 'Unit': 'Milliseconds'}
+]
+if TRACE_REPLY_BYTES:
+    EMF_METRICS.insert(4, {'Name': 'DbBytesReturned', 'Unit': 'Bytes'})
+
+
+def new_trace(function=None):
+    return {'function': function, 'operations': 0, 'failed': 0, 'db_ms': 0.0, 'documents': 0, 'bytes': 0, 'commands': {}}
+
+
+def count_reply_documents(reply):
+    """Documents a reply carries: its cursor batch, or a findAndModify value."""
+    if not isinstance(reply, Mapping):
+        return 0
+    cursor = reply.get('cursor')
+    if isinstance(cursor, Mapping):
+        return len(cursor.get('firstBatch', cursor.get('nextBatch', ())))
+    return 1 if reply.get('value') is not None else 0
+
+
+class CommandTracer(monitoring.CommandListener):
+    """Adds every command's latency and returned documents to the current trace."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.trace = new_trace()
+
+    def record(self, event, failed):
+        ms = event.duration_micros / 1000
+        documents = 0 if failed else count_reply_documents(event.reply)
+        size = len(bson.encode(event.reply)) if TRACE_REPLY_BYTES and not failed and isinstance(event.reply, Mapping) else 0
+        with self.lock:
+            trace = self.trace
+            command = trace['commands'].setdefault(event.command_name, {'count': 0, 'ms': 0.0})
+            command['count'] += 1
+            command['ms'] += ms
+            trace['operations'] += 1
+            trace['db_ms'] += ms
+            trace['documents'] += documents
+            trace['bytes'] += size
+            if failed:
+                command['failed'] = command.get('failed', 0) + 1
+                trace['failed'] += 1
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self.record(event, False)
+
+    def failed(self, event):
+        self.record(event, True)
+
+    def begin(self, function):
+        """Starts the trace of a new invocation."""
+        with self.lock:
+            self.trace = new_trace(function)
+
+    def end(self):
+        with self.lock:
+            trace, self.trace = self.trace, new_trace()
+        return trace
+
+
+command_tracer = CommandTracer()
+
+
+class EmfExporter:
+    """Writes each trace as one CloudWatch embedded metric format line."""
+
+    def export(self, trace):
+        record = {
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{'Namespace': METRICS_NAMESPACE, 'Dimensions': [['Function']], 'Metrics': EMF_METRICS}]
+            },
+            'Function': trace['function'],
+            'DbOperations': trace['operations'],
+            'DbFailedOperations': trace['failed'],
+            'DbTimeMs': round(trace['db_ms'], 2),
+            'DbDocumentsReturned': trace.get('documents', 0),
+            'HandlerTimeMs': round(trace['handler_ms'], 2),
+            'StatusCode': trace.get('status_code'),
+            'db_commands': {name: {**command, 'ms': round(command['ms'], 2)} for name, command in trace['commands'].items()}
+        }
+        if TRACE_REPLY_BYTES:
+            record['DbBytesReturned'] = trace['bytes']
+        sys.stdout.write(json.dumps(record) + '\n')
+
+
+class InMemoryExporter:
+    """Keeps exported traces in a list."""
+
+    def __init__(self):
+        self.traces = []
+
+    def export(self, trace):
+        self.traces.append(trace)
+
+    def clear(self):
+        self.traces.clear()
+
+
+exporter = EmfExporter()
+
+
+def set_exporter(new_exporter):
+    """Replaces the exporter, e.g. with an InMemoryExporter in tests; returns the old one."""
+    global exporter
+    previous, exporter = exporter, new_exporter
+    return previous
+
+
+def traced(function):
+    """Decorates a lambda_handler to export its DB operations and run time per invocation."""
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            if not TRACING_ENABLED:
+                return handler(event, context)
+            command_tracer.begin(function)
+            start = time.perf_counter()
+            response = None
+            try:
+                response = handler(event, context)
+                return response
+            finally:
+                trace = command_tracer.end()
+                trace['handler_ms'] = (time.perf_counter() - start) * 1000
+                if isinstance(response, dict):
+                    trace['status_code'] = response.get('statusCode')
+                try:
+                    exporter.export(trace)
+                except Exception as e:
+                    log.error('Trace export failed', function=function, error=e)
+        return wrapper
+    return decorator
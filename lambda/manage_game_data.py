@@ -1,59 +1,22 @@
 import json
 import os
 from datetime import datetime
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure, OperationFailure
+from pymongo.errors import OperationFailure
+from gamecore.db import connect_to_database, warm_up
+from gamecore.catalog import bump_catalog_version, revalidate, get_player_controls, catalog_delta, get_catalog_version
+from gamecore.responses import return_success, return_error, return_not_modified, make_etag, if_none_match
+from gamecore.broadcast import fan_out
+from gamecore.connections import iter_connection_ids, prune_stale_connections
+from gamecore.clients import get_management_client
+from gamecore.log import get_logger
+from gamecore.tracing import traced
 
 
 # Environment variable: MongoDB URI
 MONGODB_URI = os.environ['MONGODB_URI']
-cached_db = None
-
-
-def return_success(response_data):
-    return {
-            'statusCode': 200,
-            #'headers': { 'Content-Type': 'application/json' },
-            'headers': {
-            'Access-Control-Allow-Origin': '*',  # Allows requests from any origin
-            'Access-Control-Allow-Methods': 'GET',  # Adjust as needed
-            'Access-Control-Allow-Headers': 'Content-Type',  # Adjust as needed
-            'Content-Type': 'application/json'
-            },
-            
-            'body': json.dumps(response_data)
-        }
-
-def return_error(status_code, error):
-    return {
-            'statusCode': status_code,
-            #'headers': { 'Content-Type': 'application/json' },
-            'headers': {
-            'Access-Control-Allow-Origin': '*',  # Allows requests from any origin
-            'Access-Control-Allow-Methods': 'GET',  # Adjust as needed
-            'Access-Control-Allow-Headers': 'Content-Type',  # Adjust as needed
-            'Content-Type': 'application/json'
-            },
-            
-            'body': json.dumps({'error': str(error)})
-        }
-
-
-def connect_to_database(uri):
-    global cached_db
-    print('=> connect to database')
-    if cached_db is not None:
-        print('=> using cached database instance')
-        return cached_db
-    client = MongoClient(uri)
-    print(client)
-    try:
-        cached_db = client.test
-    except ConnectionFailure as e:
-        print(f"Could not connect to MongoDB: {e}")
-    
-    #db = client['test']
-    return cached_db
+warm_up(MONGODB_URI)
+log = get_logger('manage_game_data')
+MANAGEMENT_API_URL = "https://xxxxxxxxxxxxxx.us-east-1.amazonaws.com/production"
 
 
 def verify_threats_id(db, effectiveness_keys):
@@ -70,7 +33,7 @@ def verify_threat_name(db, data, threat_data):
     #threats_collection = db['threats']
     threat_name = threat_data.get('name', "")
     threat_key = list(data.keys())[0]
-    print(f'threat_name: {threat_name}')
+    log.info('threat_name: %s', threat_name)
     threats_document = db.threats.find_one()
     existing_threats = threats_document['threats'].values() if threats_document else []
      # Validate provided threat IDs
@@ -79,23 +42,50 @@ def verify_threat_name(db, data, threat_data):
         return return_error(400,f"Provided threat name is already present in the DB...")
     
     existing_threats = threats_document['threats'].keys() if threats_document else []
-    print(f'threat_key: {threat_key}')
-    print(f'existing_threats: {existing_threats}')
+    log.info('threat_key: %s', threat_key)
+    log.debug('existing_threats', existing_threats=existing_threats)
     if threat_key in existing_threats:
         # Return an error response
         return return_error(400,f"Provided threat id is already present in the DB...")
 
 
 
+def snapshot_player_controls(db):
+    # Player-facing controls catalog before an admin change, used as the delta base
+    try:
+        revalidate(db, force=True)
+        return get_player_controls(db)
+    except Exception as e:
+        log.error('Controls catalog snapshot failed', error=e)
+        return None
+
+
+def push_controls_delta(db, before):
+    # Sends only the changed controls to connected players after an admin change
+    if before is None:
+        return
+    try:
+        delta = catalog_delta(before, get_player_controls(db))
+        if not delta['upserted'] and not delta['removed']:
+            return
+        metrics = fan_out(get_management_client(MANAGEMENT_API_URL), iter_connection_ids(db), {'catalog_delta': delta}, label='catalogDelta')
+        prune_stale_connections(db, metrics)
+    except Exception as e:
+        log.error('Controls catalog delta push failed', error=e)
+
+
 def update_control_data(db, data, control_data):
     try:
+        before = snapshot_player_controls(db)
         controls_collection = db['controls_data']
         update_query = {"$set": {f"info.controls.{list(data.keys())[0]}": control_data}}
         controls_collection.update_one({}, update_query, upsert=True)
+        bump_catalog_version(db)
+        push_controls_delta(db, before)
         return return_success('Data updated successfully')
     except Exception as e:
             # Handle exceptions 
-            print(f'Data update to DB failed')
+            log.error('Data update to DB failed')
             return return_error(400, 'Data cannot be found in DB')
     
 
@@ -104,13 +94,23 @@ def update_threat_data(db, data, threat_data):
         threats_collection = db['threats']
         update_query = {"$set": {f"threats.{list(data.keys())[0]}": threat_data}}
         threats_collection.update_one({}, update_query, upsert=True)
+        bump_catalog_version(db)
         return return_success('Data updated successfully')
     except Exception as e:
             # Handle exceptions 
-            print(f'Data update to DB failed')
+            log.error('Data update to DB failed')
             return return_error(400, 'Data cannot be found in DB')
     
-def get_controls_list(db):
+def get_catalog_etag_headers(db):
+    # Every admin change to controls or threats bumps the catalog version,
+    # so a projected lookup of that version is enough to answer If-None-Match
+    return {'ETag': make_etag('catalog', get_catalog_version(db)), 'Cache-Control': 'no-cache'}
+
+
+def get_controls_list(db, event):
+    headers = get_catalog_etag_headers(db)
+    if if_none_match(event, headers['ETag']):
+        return return_not_modified(headers)
     collection = db['controls_data']  
     # Fetch the document;
     controls_data = collection.find_one()
@@ -119,13 +119,16 @@ def get_controls_list(db):
     if controls_data:
         controls_data.pop('_id', None) #exclude '_id'
         #json_str = json.dumps(controls_data, indent=4)
-        return return_success(controls_data)
+        return return_success(controls_data, headers)
         #return return_success(json_str)
     else:
         return return_error(400, 'Data cannot be found in DB')
     
 
-def get_threats_list(db):
+def get_threats_list(db, event):
+    headers = get_catalog_etag_headers(db)
+    if if_none_match(event, headers['ETag']):
+        return return_not_modified(headers)
     collection = db['threats']
     
     # Fetch the document;
@@ -135,11 +138,30 @@ def get_threats_list(db):
     if threats_data:
         threats_data.pop('_id', None)
         #json_str = json.dumps(threats_data, indent=4)
-        return return_success(threats_data)
+        return return_success(threats_data, headers)
     else:
         return return_error(400, 'Data cannot be found in DB')
     
 
+def get_controls_catalog(event, db):
+    # Player-facing controls catalog. The hash doubles as the ETag, and a URL
+    # pinned to the current hash (?v=<hash>) never changes, so it may be cached for good.
+    try:
+        catalog = get_player_controls(db)
+    except Exception as e:
+        log.error('Controls catalog lookup failed', error=e)
+        return return_error(400, 'Data cannot be found in DB')
+    params = event.get('queryStringParameters') or {}
+    headers = {'ETag': f'"{catalog["hash"]}"'}
+    if params.get('v') == catalog['hash']:
+        headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        headers['Cache-Control'] = 'no-cache'
+    if if_none_match(event, headers['ETag']):
+        return return_not_modified(headers)
+    return return_success(catalog, headers)
+
+
 def delete_threats(db, threat_ids):
     collection = db['threats']
     query = {'$or': [{f'threats.{threat_id}': {'$exists': True}} for threat_id in threat_ids]}
@@ -150,10 +172,11 @@ def delete_threats(db, threat_ids):
     # If the document exists, delete the specified threats
     if document:
         update_query = {f'$unset': {f'threats.{threat_id}': "" for threat_id in threat_ids}}
-        print(f'update_query:{update_query}')
+        log.debug('update_query', update_query=update_query)
         result = collection.update_one({}, update_query)
-        print(f'result:{result}')
+        log.debug('result', result=result)
         if result.modified_count > 0:
+            bump_catalog_version(db)
             return return_success(f"Deleted {threat_ids} from the DB.")
         else:
             return return_error(400, f"Error: in deleting the threat_id(s) {threat_ids} from the database.")
@@ -170,11 +193,14 @@ def delete_controls(db, control_ids):
 
     # If the document exists, delete the specified controls
     if document:
+        before = snapshot_player_controls(db)
         update_query = {f'$unset': {f'info.controls.{control_id}': "" for control_id in control_ids}}
-        print(f'update_query:{update_query}')
+        log.debug('update_query', update_query=update_query)
         result = collection.update_one({}, update_query)
-        print(f'result:{result}')
+        log.debug('result', result=result)
         if result.modified_count > 0:
+            bump_catalog_version(db)
+            push_controls_delta(db, before)
             return return_success(f"Deleted {control_ids} from the DB.")
         else:
             return return_error(400, f"Error: in deleting the control_id(s) {control_ids} from the database.")
@@ -187,18 +213,18 @@ def reset_game(db):
     operation_status = True
     try:
         db.drop_collection('users')
-        print("Collection 'users' dropped successfully.")
+        log.info("Collection 'users' dropped successfully.")
     
     except OperationFailure as e:
-        print(f"Error dropping collection 'users': {e}")
+        log.error("Error dropping collection 'users'", error=e)
         operation_status = False
     
     # Attempt to drop the second collection
     try:
         db.drop_collection('attacks')
-        print("Collection 'attacks' dropped successfully.")
+        log.info("Collection 'attacks' dropped successfully.")
     except OperationFailure as e:
-        print(f"Error dropping collection 'attacks': {e}")
+        log.error("Error dropping collection 'attacks'", error=e)
         operation_status = False
     
     try:
@@ -213,7 +239,7 @@ def reset_game(db):
                     }
         collection.update_one({}, update_query, upsert=True)
     except OperationFailure as e:
-            print(f'Stop Game flag is failed to set in DB')
+            log.error('Stop Game flag is failed to set in DB')
             operation_status = False
 
     return return_success("Game reset is successful") if operation_status else return_error(400, "Game reset failed...")
@@ -228,13 +254,14 @@ def verify_admin_user(db, user_id):
         return return_error(400, "Invalid User")
     else:
         # If found, print a confirmation message
-        print(f'Found user {user_id} in DB')
+        log.info('Found user %s in DB', user_id)
     
     
             
 
+@traced('manage_game_data')
 def lambda_handler(event, context):
-    print(event)
+    log.start(event)
     # Parse the incoming JSON payload from the event body   
     
     path = event.get('path')
@@ -249,7 +276,7 @@ def lambda_handler(event, context):
     if path == '/addControl':
         response = {}
         data = json.loads(event['body'])
-        print(data) 
+        log.debug('request body', data=data)
         control_data = data[list(data.keys())[0]]  # Extract the control data
         effectiveness_keys = control_data.get('effectiveness', {}).keys()  # Get threat IDs from effectiveness
         response = verify_threats_id(db, effectiveness_keys)
@@ -262,7 +289,7 @@ def lambda_handler(event, context):
     elif path == '/addThreat':
         data = json.loads(event['body'])
         threat_data = data[list(data.keys())[0]]
-        print(data) 
+        log.debug('request body', data=data)
         response = verify_threat_name(db, data, threat_data)
         if response:
             return response
@@ -274,13 +301,16 @@ def lambda_handler(event, context):
     elif path == '/getThreats':
         if event.get('multiValueQueryStringParameters', {}):
             return return_error(400,f"unexpected query parameter") 
-        return get_threats_list(db)
+        return get_threats_list(db, event)
     
     elif path == '/getControls':
         if event.get('multiValueQueryStringParameters', {}):
             return return_error(400,f"unexpected query parameter") 
-        return get_controls_list(db)
+        return get_controls_list(db, event)
     
+    elif path == '/controlsCatalog':
+        return get_controls_catalog(event, db)
+
     elif path == '/deleteThreats':
         params = event.get('multiValueQueryStringParameters', {})
 
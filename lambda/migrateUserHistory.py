@@ -0,0 +1,106 @@
+import os
+from datetime import datetime
+from pymongo import UpdateOne
+from gamecore.db import connect_to_database, warm_up, bulk_write_chunked
+from gamecore.events import USER_EVENTS_COLLECTION, ensure_event_indexes, event_insert
+from gamecore.ledger import backfill_budget_left
+from gamecore.log import get_logger
+from gamecore.tracing import traced
+
+# Environment variable: MongoDB URI
+MONGODB_URI = os.environ['MONGODB_URI']
+warm_up(MONGODB_URI)
+log = get_logger('migrateUserHistory')
+cursor_batch_size = int(os.environ.get('PLAYER_CURSOR_BATCH_SIZE', 1000))
+
+LEGACY_HISTORY_FIELDS = ('levels', 'threats', 'situations', 'tasks', 'assigned_budget')
+
+
+# One-off migration for player documents written before the histories moved to
+# userEvents. Each document is rewritten once: its history arrays become events
+# and only the small sets the handlers need stay on the document. Documents
+# without budget_left get it from initial_budget, as the budget ledger only ever
+# increments it. Safe to re-run, migrated documents no longer match the queries.
+@traced('migrateUserHistory')
+def lambda_handler(event, context):
+    log.start(event)
+
+    db = connect_to_database(MONGODB_URI)
+    ensure_event_indexes(db)
+    query = {'$or': [{field: {'$exists': True}} for field in LEGACY_HISTORY_FIELDS]}
+    players = db.usersData.find(query).batch_size(cursor_batch_size)
+
+    events = []
+    updates = (migrate_player(user_data, events) for user_data in players)
+    migrated = bulk_write_chunked(db.usersData, updates)
+    bulk_write_chunked(db[USER_EVENTS_COLLECTION], events)
+    backfilled = backfill_budget_left(db)
+    log.info('migrated %s players, appended %s events, backfilled budget_left for %s', migrated, len(events), backfilled)
+    return {'migrated': migrated, 'events': len(events), 'budget_backfilled': backfilled}
+
+
+def get_event_time(entry, fallback):
+    timestamp = entry.get('timestamp') if isinstance(entry, dict) else None
+    if isinstance(timestamp, datetime):
+        return timestamp
+    if isinstance(timestamp, str):
+        try:
+            return datetime.strptime(timestamp, "%d-%m-%Y %H:%M:%S")
+        except ValueError:
+            pass
+    return fallback
+
+
+def migrate_player(user_data, events):
+    """Appends the player's history events to events and returns the document update."""
+    user_id = user_data['user_id']
+    start = user_data.get('player_start_time')
+    start = start if isinstance(start, datetime) else datetime.utcnow()
+
+    levels = user_data.get('levels') or {}
+    threats = user_data.get('threats') or []
+    level_numbers = sorted(levels, key=int)
+    # Attacks recorded a level and a threat entry together, in the same order
+    for index in range(max(len(level_numbers), len(threats))):
+        fields = {}
+        if index < len(level_numbers):
+            fields['seq'] = int(level_numbers[index])
+            fields['level'] = levels[level_numbers[index]]
+        if index < len(threats):
+            fields['threat'] = threats[index]
+        events.append(event_insert(user_id, 'attack', fields, ts=get_event_time(fields.get('level'), start)))
+
+    situation_choices = {}
+    degraded_controls = []
+    for situation in user_data.get('situations') or []:
+        events.append(event_insert(user_id, 'situation', {'situation': situation}, ts=get_event_time(situation, start)))
+        options = situation_choices.setdefault(situation['completed_situation'], [])
+        if situation['choosen_option'] not in options:
+            options.append(situation['choosen_option'])
+        if situation.get('effected_controls'):
+            degraded_controls.append({key: situation[key] for key in
+                                      ('completed_situation', 'effected_controls', 'timestamp', 'expired',
+                                       'effected_controls_upgrade_time_expired') if key in situation})
+
+    tasks_completed = []
+    for task in user_data.get('tasks') or []:
+        events.append(event_insert(user_id, 'task', {'task': task}, ts=get_event_time(task, start)))
+        if task['completed_task'] not in tasks_completed:
+            tasks_completed.append(task['completed_task'])
+
+    for budget in user_data.get('assigned_budget') or []:
+        events.append(event_insert(user_id, 'budget', {'budget': budget}, ts=get_event_time(budget, start)))
+
+    return UpdateOne(
+        {'_id': user_data['_id']},
+        {
+            '$set': {
+                'tasks_completed': tasks_completed,
+                'situation_choices': situation_choices,
+                'degraded_controls': degraded_controls,
+                'level_count': max(user_data.get('level_count', 0), len(level_numbers))
+            },
+            '$unset': {field: '' for field in LEGACY_HISTORY_FIELDS},
+            '$inc': {'version': 1}
+        }
+    )
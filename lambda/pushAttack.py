@@ -1,43 +1,28 @@
 import os
 import json
-#from bson import json_util
-from pymongo import MongoClient
 import random
 from datetime import datetime, timedelta
-import boto3
+from gamecore.db import connect_to_database, warm_up
+from gamecore.catalog import get_threats
+from gamecore.broadcast import fan_out
+from gamecore.connections import iter_connection_ids, prune_stale_connections
+from gamecore.clients import get_management_client, get_lambda_client
+from gamecore.log import get_logger
+from gamecore.tracing import traced
 
-lambda_client = boto3.client('lambda')
 function_arn = 'updatePostAttackStats'
-client = boto3.client('apigatewaymanagementapi', endpoint_url="https://xxxxxxxxxxxxxxxx.us-east-1.amazonaws.com/production")
+MANAGEMENT_API_URL = "https://xxxxxxxxxxxxxxxx.us-east-1.amazonaws.com/production"
 
 
 
 # Environment variable: MongoDB URI
 MONGODB_URI = os.environ['MONGODB_URI']
-cached_db = None
-
-def connect_to_database(uri):
-    global cached_db
-    print('=> connect to database')
-    if cached_db is not None:
-        print('=> using cached database instance')
-        return cached_db
-    client = MongoClient(uri)
-    print(client)
-    cached_db = client.test 
-    #db = client['test']
-    return cached_db
-
-def get_controls_data(db):
-    # Assuming there's only one document in control_data collection
-    document = db.controls_data.find_one()
-    controls_data = document['info']['controls']
-    return controls_data
+warm_up(MONGODB_URI)
+log = get_logger('pushAttack')
 
 def get_attack_data(db):
     # Assuming there's only one document in control_data collection
     attacks_document = db.attacks.find_one()
-    #print(user_document)
     if attacks_document:
         attacks_document.pop('_id', None)
     else:
@@ -52,16 +37,13 @@ def random_threat(threats, excluded_threats):
     if not available_threats:
         return None, None  # Indicates no available threats not in excluded list
     random_threat_key = random.choice(list(available_threats.keys()))
-    #return available_threats[random_threat_key]['name'], random_threat_key
-    #random_threat_key = 't6'
     return available_threats, random_threat_key
 
 
 def get_all_threats(db):
-    document = db.threats.find_one()
-    if document and 'threats' in document:
-        return document['threats']
-    else:
+    try:
+        return get_threats(db)
+    except (KeyError, TypeError):
         return {}
     
 def get_game_status(db):
@@ -69,57 +51,23 @@ def get_game_status(db):
     if document:
         game_status = document.get('started', "No data")
         if game_status == "No data":
-            print('game_status collection does not have any data')
+            log.info('game_status collection does not have any data')
             return False
         else:
             return document
     else:
-        print('game_status collection is not found in DB')
+        log.info('game_status collection is not found in DB')
         return False
 
-def get_connection_id(db):
-    document = db.connection_id.find_one()
-    connectionId_doc = document.get('connection_id', False)
-    
-    connection_ids = [connection for connection in connectionId_doc.values()]
-    if connection_ids:
-        return connection_ids
-    else:
-        return "Not Found"
-    
-# Function to post messages to all connections
-def post_to_all_connections(connection_ids, controls_with_cost):
-    for connection_id in connection_ids:
-        response = client.post_to_connection(
-            ConnectionId=connection_id, 
-            Data=json.dumps(controls_with_cost).encode('utf-8')
-        )
-        print(f"Message sent to {connection_id}, response: {response}")
-
-
 def push_attack_websocket(db, attack):
-    connection_ids = get_connection_id(db)
-    if connection_ids == "Not Found":
-        print('Could not find the connectionIDs in the system...')
-        return 
-
-    attack_to_push = json.dumps(attack).encode('utf-8')
-
-    stale_connection_ids = []
-    for connection_id in connection_ids:
-        try:
-            client.post_to_connection(
-                ConnectionId=connection_id,
-                Data=attack_to_push
-            )
-        except client.exceptions.GoneException:
-            # If a GoneException is caught, the connection is stale.
-            stale_connection_ids.append(connection_id)
-    
-    print(f'list of stale connections: {stale_connection_ids}')
+    metrics = fan_out(get_management_client(MANAGEMENT_API_URL), iter_connection_ids(db), attack, label='pushAttack')
+    if not metrics['connections']:
+        log.warning('Could not find the connectionIDs in the system...')
+        return
+    log.info('list of stale connections: %s', metrics['stale'])
+    prune_stale_connections(db, metrics)
 
-    #post_to_all_connections(connection_ids, attack)
-    print('=> returning result: ', attack)
+    log.debug('returning result', attack=attack)
     return
 
 def stop_game(db):
@@ -136,60 +84,49 @@ def stop_game(db):
         collection.update_one({}, update_query, upsert=True)
         return
     except Exception as e:
-            print(f'Stop Game flag is failed to set in DB')
+            log.error('Stop Game flag is failed to set in DB')
             return
 
 
+@traced('pushAttack')
 def lambda_handler(event, context):
-    print('event: ', event)
-
-    #cognito_username = event['requestContext']['authorizer']['claims']['username']
-    #user_id = event.get('requestContext', {}).get('authorizer', {}).get('claims', {}).get('username', None)
-    #user_id = 'dummyuser1'
-
-
+    log.start(event)
 
     # Extract the path from the event
     db = connect_to_database(MONGODB_URI)
-    #user_id = "3" # Replace with actual user ID
     game_status_data = get_game_status(db)
     if game_status_data:
         game_status = game_status_data.get('started', "No Data")
-        print(f'game_status: {game_status}')
+        log.debug('game_status', game_status=game_status)
     else:
         return
     if game_status == "No Data" or game_status == "False":
-        print('Game has not been started by Admin')
+        log.info('Game has not been started by Admin')
         return
     threshold_time = datetime.utcnow() - timedelta(minutes=5)
     game_start_time = game_status_data.get('start_timestamp', datetime.utcnow())
     if game_start_time >= threshold_time:
-        print('Game start time is less than the set threshold time of 2 mins')
+        log.info('Game start time is less than the set threshold time of 2 mins')
         return
 
     attack_data = get_attack_data(db)
 
-    print(f'attack_data:{attack_data}')
+    log.debug('attack_data', attack_data=attack_data)
 
-    # threat_name, threat_key = random_threat(db)
-    # print (threat_name)
-    #threat_list = set(user_data.get("threats", []))  # Convert list to set for efficiency
-    #threat_list = set([threat.get("name") for threat in attack_data if threat.get("name") is not None])
     attack_list = set([attack.get("name") for attack in attack_data.get('attacks_taken_place', {}) if attack.get("name") is not None])
-    print(f"attack_list:{attack_list}")
+    log.debug('attack_list', attack_list=attack_list)
     all_threats = get_all_threats(db)
     while True:
         available_threats, threat_key = random_threat(all_threats, attack_list)
-        #[random_threat_key]['name']
         if available_threats is None:
-            print("All the available attacks are simulated")
+            log.info('All the available attacks are simulated')
             attack = {
                 "attack": "Game has ended." }
             push_attack_websocket(db, attack)
             stop_game(db)
             return
         else:
-            print(f"Selected threat: {available_threats[threat_key]['name']} (Key: {threat_key})")
+            log.info('Selected threat: %s (Key: %s)', available_threats[threat_key]['name'], threat_key)
             break 
     
     
@@ -204,40 +141,14 @@ def lambda_handler(event, context):
     }
     
     push_attack_websocket(db, attack)
-    # connection_ids = get_connection_id(db)
-    # if connection_ids == "Not Found":
-    #     print('Could not find the connectionIDs in the system...')
-    
-    # attack = {
-    #     "attack": available_threats[threat_key]['name']
-    # }
 
-    # attack_to_push = json.dumps(attack).encode('utf-8')
-
-    # stale_connection_ids = []
-    # for connection_id in connection_ids:
-    #     try:
-    #         client.post_to_connection(
-    #             ConnectionId=connection_id,
-    #             Data=attack_to_push
-    #         )
-    #     except client.exceptions.GoneException:
-    #         # If a GoneException is caught, the connection is stale.
-    #         stale_connection_ids.append(connection_id)
-    
-    # print(f'list of stale connections: {stale_connection_ids}')
-
-    # #post_to_all_connections(connection_ids, attack)
-    # print('=> returning result: ', attack)
-
-        
     function_input = {"attack_name": available_threats[threat_key]['name'], 
                       "attack_down_time": available_threats[threat_key]['downtime'], 
                       "attack_key":threat_key
                       }
     # Convert the payload dictionary to a JSON string format
     function_input_str = json.dumps(function_input)
-    response = lambda_client.invoke(
+    response = get_lambda_client().invoke(
                             FunctionName=function_arn,
                             InvocationType='Event',  # Set to 'Event' for asynchronous execution
                             Payload=function_input_str.encode('utf-8')  # Convert string payload to bytes 
@@ -245,15 +156,12 @@ def lambda_handler(event, context):
 
     # The response from an asynchronous invoke does not contain the function's response
     # It will include a status code and function ARN if the request was successful
-    print('Status Code:', response['StatusCode'])
-    print('response', response)
-    print('=> returning from  mainfunction ')
+    log.info('updatePostAttackStats invoked with status %s', response['StatusCode'])
+    log.debug('response', response=response)
+    log.info('returning from main function')
     return
 
 
-#current_timestamp = datetime.now().strftime("%d-%m-%Y %H:%M:%S")
-
-
 def update_attack_in_database(db, available_threats, threat_key):
     try:
         db.attacks.update_one(
@@ -269,7 +177,7 @@ def update_attack_in_database(db, available_threats, threat_key):
     ,upsert=True)
     except Exception as e:
             # Handle exceptions and possible S3 errors or MongoDB deletion errors
-            print(f'Attack update to the DB failed')
+            log.error('Attack update to the DB failed')
             return "Update to DB failed"
     
     try:
@@ -282,6 +190,6 @@ def update_attack_in_database(db, available_threats, threat_key):
         collection.update_one({}, update_query, upsert=True)
         return 'update_attack_stats flag is set successfully'
     except Exception as e:
-            print(f'update_attack_stats flag is failed to set in DB')
+            log.error('update_attack_stats flag is failed to set in DB')
             return 'update_attack_stats flag is failed to set in DB'
     
\ No newline at end of file
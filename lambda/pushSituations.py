@@ -1,30 +1,22 @@
 import os
-import json
-from pymongo import MongoClient
 import random
 from datetime import datetime, timedelta
-import boto3
+from gamecore.db import connect_to_database, warm_up
+from gamecore.catalog import get_situations
+from gamecore.broadcast import fan_out
+from gamecore.connections import iter_connection_ids, prune_stale_connections
+from gamecore.clients import get_management_client
+from gamecore.log import get_logger
+from gamecore.tracing import traced
 
-client = boto3.client('apigatewaymanagementapi', endpoint_url="https://xxxxxxxxxxxxxx.us-east-1.amazonaws.com/production")
+MANAGEMENT_API_URL = "https://xxxxxxxxxxxxxx.us-east-1.amazonaws.com/production"
 
 
 
 # Environment variable: MongoDB URI
 MONGODB_URI = os.environ['MONGODB_URI']
-cached_db = None
-
-def connect_to_database(uri):
-    global cached_db
-    print('=> connect to database')
-    if cached_db is not None:
-        print('=> using cached database instance')
-        return cached_db
-    client = MongoClient(uri)
-    print(client)
-    cached_db = client.test 
-    #db = client['test']
-    return cached_db
-
+warm_up(MONGODB_URI)
+log = get_logger('pushSituations')
 
 def get_past_situations_data(db):
     # Assuming there's only one document in control_data collection
@@ -50,10 +42,9 @@ def random_situation(all_situations, past_situations_list):
 
 
 def get_all_situations(db):
-    document = db.situations.find_one()
-    if document and 'situations' in document:
-        return document['situations']
-    else:
+    try:
+        return get_situations(db)
+    except (KeyError, TypeError):
         return {}
     
 def get_game_status(db):
@@ -61,48 +52,23 @@ def get_game_status(db):
     if document:
         game_status = document.get('started', "No data")
         if game_status == "No data":
-            print('game_status collection does not have any data')
+            log.info('game_status collection does not have any data')
             return False
         else:
             return document
     else:
-        print('game_status collection is not found in DB')
+        log.info('game_status collection is not found in DB')
         return False
 
-def get_connection_id(db):
-    document = db.connection_id.find_one()
-    connectionId_doc = document.get('connection_id', False)
-    
-    connection_ids = [connection for connection in connectionId_doc.values()]
-    if connection_ids:
-        return connection_ids
-    else:
-        return "Not Found"
-    
-
-
 def push_situation_websocket(db, situation):
-    connection_ids = get_connection_id(db)
-    if connection_ids == "Not Found":
-        print('Could not find the connectionIDs in the system...')
-        return 
-
-    situation_to_push = json.dumps(situation).encode('utf-8')
-
-    stale_connection_ids = []
-    for connection_id in connection_ids:
-        try:
-            client.post_to_connection(
-                ConnectionId=connection_id,
-                Data=situation_to_push
-            )
-        except client.exceptions.GoneException:
-            # If a GoneException is caught, the connection is stale.
-            stale_connection_ids.append(connection_id)
-    
-    print(f'list of stale connections: {stale_connection_ids}')
+    metrics = fan_out(get_management_client(MANAGEMENT_API_URL), iter_connection_ids(db), situation, label='pushSituations')
+    if not metrics['connections']:
+        log.warning('Could not find the connectionIDs in the system...')
+        return
+    log.info('list of stale connections: %s', metrics['stale'])
+    prune_stale_connections(db, metrics)
 
-    print('=> returning result: ', situation)
+    log.debug('returning result', situation=situation)
     return
 
 
@@ -121,12 +87,13 @@ def update_situation_in_database(db, available_situations_key):
         }
     ,upsert=True)
     except Exception as e:
-            print(f'Situation update to the DB failed')
+            log.error('Situation update to the DB failed')
             return "Update to DB failed"
     
+@traced('pushSituations')
 def lambda_handler(event, context):
     # Handler for AWS Lambda: processes the event and executes game logic
-    print('event: ', event)
+    log.start(event)
 
     # Establish database connection
     db = connect_to_database(MONGODB_URI)
@@ -139,7 +106,7 @@ def lambda_handler(event, context):
     # Extract game status and check if the game has been started
     game_status = game_status_data.get('started', "No Data")
     if game_status in ["No Data", "False"]:
-        print('Game has not been started by Admin')
+        log.info('Game has not been started by Admin')
         return
 
     # Define time thresholds for checking the attack timing
@@ -149,7 +116,7 @@ def lambda_handler(event, context):
 
     # Validate if the current attack time is within the specified window
     if not (threshold_time_2 <= attack_time < threshold_time_1):
-        print('Game attack time is not within 2 and 3 mins')
+        log.info('Game attack time is not within 2 and 3 mins')
         return
 
     # Retrieve past situations and prepare for new situation selection
@@ -161,9 +128,9 @@ def lambda_handler(event, context):
     while True:
         available_situations, available_situations_key = random_situation(all_situations, past_situations_list)
         if available_situations is None:
-            print("All available situations are simulated")
+            log.info('All available situations are simulated')
             return
-        print(f"Selected situation: (Key: {available_situations_key})")
+        log.info('Selected situation: (Key: %s)', available_situations_key)
         break 
 
     # Update the situation in database and push to WebSocket
@@ -174,5 +141,5 @@ def lambda_handler(event, context):
     # Define the situation to push
     situation = {"situation": available_situations[available_situations_key]}
     push_situation_websocket(db, situation)
-    print('=> returning from main function')
+    log.info('returning from main function')
     return
\ No newline at end of file
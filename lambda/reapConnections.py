@@ -0,0 +1,30 @@
+import os
+from gamecore.db import connect_to_database, warm_up
+from gamecore.connections import get_connection_ids, find_dead_connections, prune_connections
+from gamecore.clients import get_management_client
+from gamecore.log import get_logger
+from gamecore.tracing import traced
+
+# Environment variable: MongoDB URI
+MONGODB_URI = os.environ['MONGODB_URI']
+warm_up(MONGODB_URI)
+log = get_logger('reapConnections')
+MANAGEMENT_API_URL = "https://xxxxxxxxxxxxxx.us-east-1.amazonaws.com/production"
+
+
+# Scheduled (e.g. EventBridge rate(10 minutes)) sweep that keeps the fan-out
+# set down to live connections even when no broadcast has run recently.
+@traced('reapConnections')
+def lambda_handler(event, context):
+    log.start(event)
+
+    db = connect_to_database(MONGODB_URI)
+    connection_ids = get_connection_ids(db)
+    if not connection_ids:
+        log.info('No connection ids registered')
+        return {'checked': 0, 'pruned': 0}
+
+    dead_connection_ids = find_dead_connections(get_management_client(MANAGEMENT_API_URL), connection_ids)
+    pruned = prune_connections(db, dead_connection_ids)
+    log.info('checked=%s dead=%s', len(connection_ids), len(dead_connection_ids))
+    return {'checked': len(connection_ids), 'pruned': pruned}
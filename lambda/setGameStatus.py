@@ -1,57 +1,20 @@
 import json
-from pymongo import MongoClient
 import os
 from datetime import datetime
-import boto3
+from gamecore.db import connect_to_database, warm_up
+from gamecore.responses import return_success, return_error
+from gamecore.clients import get_lambda_client
+from gamecore.log import get_logger
+from gamecore.tracing import traced
 
 # Environment variable: MongoDB URI
 MONGODB_URI = os.environ['MONGODB_URI']
-cached_db = None
+warm_up(MONGODB_URI)
+log = get_logger('setGameStatus')
 
-lambda_client = boto3.client('lambda')
 function_arn = 'pushControls'
 
 
-def return_success(response_data):
-    return {
-            'statusCode': 200,
-            #'headers': { 'Content-Type': 'application/json' },
-            'headers': {
-            'Access-Control-Allow-Origin': '*',  # Allows requests from any origin
-            'Access-Control-Allow-Methods': 'GET',  # Adjust as needed
-            'Access-Control-Allow-Headers': 'Content-Type',  # Adjust as needed
-            'Content-Type': 'application/json'
-            },
-            
-            'body': json.dumps(response_data)
-        }
-
-def return_error(status_code, error):
-    return {
-            'statusCode': status_code,
-            #'headers': { 'Content-Type': 'application/json' },
-            'headers': {
-            'Access-Control-Allow-Origin': '*',  # Allows requests from any origin
-            'Access-Control-Allow-Methods': 'GET',  # Adjust as needed
-            'Access-Control-Allow-Headers': 'Content-Type',  # Adjust as needed
-            'Content-Type': 'application/json'
-            },
-            
-            'body': json.dumps({'error': str(error)})
-        }
-
-def connect_to_database(uri):
-    global cached_db
-    print('=> connect to database')
-    if cached_db is not None:
-        print('=> using cached database instance')
-        return cached_db
-    client = MongoClient(uri)
-    print(client)
-    cached_db = client.test 
-    #db = client['test']
-    return cached_db
-
 #update start game time
 def start_game(db):
     try:
@@ -65,7 +28,7 @@ def start_game(db):
         collection.update_one({}, update_query, upsert=True)
         return return_success('Start Game flag is set successfully')
     except Exception as e:
-            print(f'Start Game flag is failed to set in DB')
+            log.error('Start Game flag is failed to set in DB')
             return return_error(400, 'Start Game flag is failed to set in DB')
 
 #update Stop game time   
@@ -81,7 +44,7 @@ def stop_game(db):
         collection.update_one({}, update_query, upsert=True)
         return return_success('Stop Game flag is set successfully')
     except Exception as e:
-            print(f'Stop Game flag is failed to set in DB')
+            log.error('Stop Game flag is failed to set in DB')
             return return_error(400, 'Stop Game flag is failed to set in DB')
 
     
@@ -95,12 +58,13 @@ def verify_admin_user(db, user_id):
         return return_error(400, "Invalid User")
     else:
         # If found, print a confirmation message
-        print(f'Found user {user_id} in DB')
+        log.info('Found user %s in DB', user_id)
 
 
 
+@traced('setGameStatus')
 def lambda_handler(event, context):
-    print(event)
+    log.start(event)
     # Parse the incoming JSON payload from the event body   
     
     path = event.get('path')
@@ -122,15 +86,15 @@ def lambda_handler(event, context):
                       }
         # Convert the payload dictionary to a JSON string format
         function_input_str = json.dumps(function_input)
-        lambda_response = lambda_client.invoke(
+        lambda_response = get_lambda_client().invoke(
                                 FunctionName=function_arn,
                                 InvocationType='Event',  # Set to 'Event' for asynchronous execution
                                 Payload=function_input_str.encode('utf-8')  # Convert string payload to bytes 
                                 )
-        print("invoked pushControls lambda function")
-        print('Status Code:', lambda_response['StatusCode'])
-        print('response', lambda_response)
-        print('=> returning from  mainfunction ')
+        log.info('invoked pushControls lambda function')
+        log.info('pushControls invoked with status %s', lambda_response['StatusCode'])
+        log.debug('response', lambda_response=lambda_response)
+        log.info('returning from main function')
 
         return response
     
@@ -1,87 +1,49 @@
 # Standard library imports
 import os
-import json
-from pymongo import MongoClient
-import random
-from datetime import datetime, timedelta
+from datetime import datetime
+from pymongo import UpdateOne
+from gamecore.db import connect_to_database, warm_up, bulk_write_chunked
+from gamecore.effectiveness import get_effectiveness_model, build_cohort, resolve_attack, describe_outcomes
+from gamecore.broadcast import deliver
+from gamecore.connections import iter_user_connections, prune_stale_connections
+from gamecore.events import USER_EVENTS_COLLECTION, ensure_event_indexes, event_insert
+from gamecore.clients import get_management_client
+from gamecore.log import get_logger
+from gamecore.tracing import traced
 
 # Setting up environment variables and initial values
-MONGODB_URI = os.environ['MONGODB_URI'] 
-cached_db = None  # Caching mechanism to avoid reconnecting to DB
+MONGODB_URI = os.environ['MONGODB_URI']
+warm_up(MONGODB_URI)
+log = get_logger('updatePostAttackStats')
 per_hour_earning = 10000  # Set the hourly earning rate
-
-# Function to connect to MongoDB database using the URI
-def connect_to_database(uri):
-    global cached_db
-    print('=> connect to database')
-    if cached_db is not None:
-        print('=> using cached database instance')
-        return cached_db
-    client = MongoClient(uri)
-    print(client)
-    cached_db = client.test  # Test is the database name
-    return cached_db
-
-# Function to retrieve control data from the database
-def get_controls_data(db):
-    document = db.controls_data.find_one()
-    controls_data = document['info']['controls']
-    return controls_data
-
-# Function to retrieve tasks data from the database
-def get_tasks_data(db):
-    document = db.specialProjects.find_one()
-    tasks_data = document['projects']
-    print(f'tasks data is {tasks_data}')
-    return tasks_data
-
-# Function to retrieve user data from the database based on user ID
-def get_user_data(db, user_id):
-    user_document = db.usersData.find_one({"user_id": user_id})
-    if user_document:
-        user_document.pop('_id', None)  # Remove the MongoDB unique ID before returning
-        return True, user_document
-    else:
-        return False, "'message': 'UserData is not found, Click on PLAY button to start the game'"
-
-# Function to calculate the combined effectiveness of chosen controls and completed tasks
-def calculate_combined_effectiveness(chosen_controls, controls_data, threat_key, tasks_data, tasks_completed, situations_completed_controls):
-    controls_effectiveness_list = {}
-    task_effectiveness_list = {}
-    combined_effectiveness = 1
-
-    # Mapping controls and tasks for quick lookup
-    controls_dict = {control['control']: control['effectiveness'].get(threat_key, '0%') for control in controls_data.values()}
-    tasks_dict = {task['name']: task['effectiveness'].get(threat_key, '0') for task in tasks_data.values()}
-
-    # Process controls for effectiveness calculation
-    for chosen_control in chosen_controls:
-        if chosen_control not in situations_completed_controls:
-            effectiveness_str = controls_dict.get(chosen_control, '0%')
-            effectiveness = float(effectiveness_str.strip('%')) / 100
-            if effectiveness > 0:
-                controls_effectiveness_list[chosen_control] = effectiveness_str
-                combined_effectiveness *= (1 - effectiveness)
-
-    # Process tasks for effectiveness calculation
-    for task_completed in tasks_completed:
-        effectiveness_str = tasks_dict.get(task_completed, '0%')
-        effectiveness = float(effectiveness_str.strip('%')) / 100
-        if effectiveness > 0:
-            task_effectiveness_list[task_completed] = effectiveness_str
-            combined_effectiveness *= (1 - effectiveness)
-
-    combined_effectiveness = 1 - combined_effectiveness
-    controls_tasks_combined_effectiveness = f"{combined_effectiveness * 100:.2f}%"
-    print(f"controls and tasks effectiveness: {combined_effectiveness * 100:.2f}%")
-    print(f"Controls effectiveness list: {controls_effectiveness_list}")
-    print(f"Task effectiveness list: {task_effectiveness_list}")
-
-    return controls_tasks_combined_effectiveness, controls_effectiveness_list, task_effectiveness_list
-
-
-
-# functions handle user interaction and data manipulation within the MongoDB database, focusing on user controls, tasks, and the impacts of attack scenarios on user performance metrics. 
+cursor_batch_size = int(os.environ.get('PLAYER_CURSOR_BATCH_SIZE', 1000))
+MANAGEMENT_API_URL = "https://xxxxxxxxxxxxxx.us-east-1.amazonaws.com/production"
+
+# Only the fields needed to resolve an attack are streamed from usersData.
+# The attack's level and threat entries are appended to userEvents.
+PLAYER_PIPELINE = [
+    {'$match': {'player_start_time': {'$type': 'date'}}},
+    {'$project': {
+        '_id': 0,
+        'user_id': 1,
+        'player_start_time': 1,
+        'downtime': 1,
+        'controls.control': 1,
+        'tasks_completed': 1,
+        'degraded_controls.effected_controls': 1,
+        'degraded_controls.effected_controls_upgrade_time_expired': 1,
+        'level_count': 1,
+        'budget_left': 1,
+        'initial_budget': 1,
+        'apply_for_budget': 1
+    }}
+]
+
+# Function to stream every player through a single projected cursor
+def iter_players(db):
+    return db.usersData.aggregate(PLAYER_PIPELINE, batchSize=cursor_batch_size)
+
+# functions handle user interaction and data manipulation within the MongoDB database, focusing on user controls, tasks, and the impacts of attack scenarios on user performance metrics.
 def get_user_controls(user_data):
     controls = user_data.get('controls', "Not Present")
     if controls == "Not Present":
@@ -91,262 +53,224 @@ def get_user_controls(user_data):
     return chosen_controls
 
 def get_user_tasks(user_data):
-    tasks = user_data.get('tasks', "Not Present")
-    if tasks == "Not Present":
-        tasks_completed = []
-    else:
-        tasks_completed = [task['completed_task'] for task in tasks]
-    return tasks_completed
+    return user_data.get('tasks_completed', [])
 
 def get_user_situations_controls(user_data):
-    situations = user_data.get('situations', "Not Present")
+    situations = user_data.get('degraded_controls', "Not Present")
     if situations == "Not Present":
         situations_completed_controls = []
     else:
-        situations_completed_controls = [control for situation in situations 
+        situations_completed_controls = [control for situation in situations
                         if situation.get('effected_controls_upgrade_time_expired', 1) == 0
                         for control in situation['effected_controls']]
-        print(f"situations_completed_controls:{situations_completed_controls}")
         situations_completed_controls = list(set(situations_completed_controls))
     return situations_completed_controls
 
 
-
-def get_userIds(db):
-    user_ids = [doc['user_id'] for doc in db.usersData.find({}, {'_id': 0, 'user_id': 1})]
-    return user_ids
-
-    
 # The `lambda_handler` function serves as the entry point for AWS Lambda execution
+@traced('updatePostAttackStats')
 def lambda_handler(event, context):
-    print('event: ', event)
-
-    #cognito_username = event['requestContext']['authorizer']['claims']['username']
-    #user_id = event.get('requestContext', {}).get('authorizer', {}).get('claims', {}).get('username', None)
-    #user_id = 'dummyuser1'
-    #attack = 'Phishing'
-    #threat_key = 't3'
-    #attack_downtime = 8
+    log.start(event)
+
     attack = event.get('attack_name', 'Not Found')
     threat_key = event.get('attack_key', 'Not Found')
     attack_downtime = event.get('attack_down_time', 'Not Found')
-    
+
 
     if 'Not Found' in [attack, threat_key, attack_downtime]:
-        print('Attack information is not present in the function invocation')
+        log.warning('Attack information is not present in the function invocation')
         return
     attack_downtime = int(attack_downtime)
     db = connect_to_database(MONGODB_URI)
-    user_ids = get_userIds(db)
-
-    if user_ids:
-        for user_id in user_ids:
-            #user_id = "3" # Replace with actual user ID
-            status, response = get_user_data(db, user_id)
-            if status:
-                print(f'status:{status}')
-                user_data = response
-            else:
-                #print(response)
-                return
-            #print(f'response:{response}')
-            #print(f'user_data:{user_data}, type:{type(user_data)}')
-            chosen_controls = get_user_controls(user_data)
-            tasks_completed = get_user_tasks(user_data)
-            situations_completed_controls = get_user_situations_controls(user_data)
-
-            controls_data = get_controls_data(db)
-            tasks_data = get_tasks_data(db)
-
-            controls_tasks_combined_effectiveness, controls_effectiveness_list, task_effectiveness_list = calculate_combined_effectiveness(chosen_controls, controls_data, threat_key, tasks_data, tasks_completed, situations_completed_controls)        
-            
-            response = set_choices_database_level(db, user_id, chosen_controls, controls_tasks_combined_effectiveness, controls_effectiveness_list, threat_key, user_data, attack, attack_downtime, task_effectiveness_list)
 
-    else:
-        print('Userid cannot be found in the DB')
-
-    print('=> returning result: ')
+    # Catalog and game status are loaded once per attack, not once per player
+    game_status = get_game_start_time(db)
+    if game_status == "error" or not game_status or not game_status.get('start_timestamp'):
+        log.error('Game start time cannot be found in the game_status collection')
+        return
+    model = get_effectiveness_model(db)
+
+    attack_context = {
+        'attack': attack,
+        'threat_key': threat_key,
+        'attack_downtime': attack_downtime,
+        'game_start_time': game_status['start_timestamp'],
+        'current_time': datetime.now(),
+        'level_timestamp': datetime.now().strftime("%d-%m-%Y %H:%M:%S"),
+        'event_time': datetime.utcnow()
+    }
+
+    # Each cursor batch is written, logged to userEvents and pushed before the
+    # next one is read, so memory stays at one batch and a timeout keeps the
+    # events and outcomes of every batch already written.
+    ensure_event_indexes(db)
+    modified_count = 0
+    for requests, outcomes, events in iter_attack_updates(iter_players(db), model, attack_context):
+        modified_count += bulk_write_chunked(db.usersData, requests)
+        bulk_write_chunked(db[USER_EVENTS_COLLECTION], events)
+        push_attack_outcomes(db, outcomes)
+    log.info('Users attack stats has been updated for %s players', modified_count)
+
+    reset_update_attack_stats_flag(db)
+    log.info('returning result')
     return
 
 
-def calculate_loss(user_data, is_attack_successfull):
-    no_of_attacks_successfull = 0
-    no_of_attacks_mitigated = 0
-    if is_attack_successfull:
-        no_of_attacks_successfull = 1 
-    else:
-        no_of_attacks_mitigated = 1
-    # return f"{production_of_day}$", f"{loss}$", f"{production_amount}$"
-    
-    # total_earning = sum([int(threat.get("actual_earning")) for threat in user_data["threats"]])
-    # expected_total_earning = production_amount * len(user_data["threats"])
-    # total_loss = sum([int(threat.get("loss")) for threat in user_data["threats"]])
-
-    no_of_attacks_successfull = int(user_data.get("no_of_attacks_successfull", 0)) + no_of_attacks_successfull
-    no_of_attacks_mitigated = int(user_data.get("no_of_attacks_mitigated", 0)) + no_of_attacks_mitigated
-
-    return no_of_attacks_successfull, no_of_attacks_mitigated
-
-
-def check_attack_successfulness(controls_tasks_combined_effectiveness, controls_effectiveness_list):
-    max_effectiveness_control= ""
-    random_int = 0
-    max_effectiveness = 0
-    controls_effectiveness = int(float(controls_tasks_combined_effectiveness.strip('%')))
-    print(f'controls_effectiveness: {controls_effectiveness}')
-    if controls_effectiveness:
-        random_int = random.randint(0, 99)
-        print(random_int)
-        attack_successful = random_int > controls_effectiveness
-    else:
-        attack_successful = True
-
-    print(f'attack_successful: {attack_successful}')
-    #if not attack_successful:
-    if controls_effectiveness_list:
-        for control , effectiveness in controls_effectiveness_list.items():
-            effectiveness = int(effectiveness.strip('%'))
-            if effectiveness > max_effectiveness:
-                max_effectiveness = effectiveness
-                max_effectiveness_control = control
-
-    return attack_successful, max_effectiveness_control
-        
-
 def get_game_start_time(db):
     try:
         game_status= db.game_status.find_one()
         return game_status
     except Exception as e:
-            print(f'Failed to get data from game_status collection')
+            log.error('Failed to get data from game_status collection')
             return "error"
 
 
-def set_choices_database_level(db, user_id, chosen_controls, controls_tasks_combined_effectiveness, controls_effectiveness_list, threat_key, user_data, attack, attack_downtime, task_effectiveness_list):
-    # Find the current user document
-    #user_data = get_user_data(db, user_id)
-    #user_document = db.usersData.find_one({"user_id": user_id})
-    is_playing_status = False
-    apply_for_budget = user_data.get('apply_for_budget', False)
-    current_levels = user_data.get("levels", {})
-    
-    next_level = max([int(lvl) for lvl in current_levels.keys()], default=0) + 1
-    update_path = f"levels.{next_level}"
-    
-    
-    is_attack_successfull, control = check_attack_successfulness(controls_tasks_combined_effectiveness, controls_effectiveness_list)
-    no_of_attacks_successfull, no_of_attacks_mitigated = calculate_loss(user_data, is_attack_successfull)
-
-    #current_timestamp = datetime.now().strftime("%d-%m-%Y %H:%M:%S")
-    # uptime = int(total_earning/1000)
-    # downtime = int(total_loss/1000)
-    
+def iter_attack_updates(players, model, attack_context):
+    """Resolves the attack one cursor batch at a time.
+
+    Yields (requests, outcomes, events) per batch: the bulk write request for
+    each player, their outcome notices keyed by user_id and their attack events.
+    """
+    batch = []
+    for user_data in players:
+        batch.append(user_data)
+        if len(batch) >= cursor_batch_size:
+            yield resolve_batch(batch, model, attack_context)
+            batch = []
+    if batch:
+        yield resolve_batch(batch, model, attack_context)
+
+
+def resolve_batch(batch, model, attack_context):
+    """Computes effectiveness and success draws for a batch with a few array operations."""
+    cohort = [
+        {
+            'controls': get_user_controls(user_data),
+            'tasks': get_user_tasks(user_data),
+            'degraded_controls': get_user_situations_controls(user_data)
+        }
+        for user_data in batch
+    ]
+    owned, completed, purchase_order = build_cohort(model, cohort)
+    outcome = resolve_attack(model, owned, completed, attack_context['threat_key'], purchase_order)
+    requests, outcomes, events = [], {}, []
+    for row, player_outcome in enumerate(describe_outcomes(model, outcome)):
+        request, notice, event = resolve_player_attack(batch[row], cohort[row]['controls'], player_outcome, attack_context)
+        requests.append(request)
+        outcomes[batch[row]['user_id']] = notice
+        events.append(event)
+    return requests, outcomes, events
+
+
+def resolve_player_attack(user_data, chosen_controls, outcome, attack_context):
+    """Turns one player's attack outcome into its bulk write request, notice and event."""
+    attack = attack_context['attack']
+    attack_downtime = attack_context['attack_downtime']
+    game_start_time = attack_context['game_start_time']
+    current_timestamp = attack_context['current_time']
+
+    is_attack_successfull = outcome['is_attack_successfull']
+    control = outcome['max_effective_control']
+    controls_effectiveness_list = outcome['controls_effectiveness_list']
+    task_effectiveness_list = outcome['task_effectiveness_list']
+    controls_tasks_combined_effectiveness = outcome['controls_tasks_combined_effectiveness']
+
+    next_level = user_data.get('level_count', 0) + 1
 
-    game_status = get_game_start_time(db)
-    if game_status != "error":
-        current_timestamp = datetime.now()
-        game_start_time = game_status.get('start_timestamp') 
-    
     user_game_start_time = user_data['player_start_time']
     if user_game_start_time > game_start_time:
-        #expected_uptime = int(game_start_time - current_timestamp)
-        # Calculate the difference between game_start_time and current_timestamp
+        # Player started his game after admin gave go ahead
         time_difference = current_timestamp - user_game_start_time
-        print('Player started his game after admin gave go ahead')
-    else: 
+    else:
+        # Player started his game before admin gave go ahead
         time_difference = current_timestamp - game_start_time
-        print('Player started his game before admin gave go ahead')
 
-    
     expected_uptime = int(time_difference.total_seconds() / 60)
-    print(f'expected_uptime:{expected_uptime}')
-    print(f'is_attack_successfull:{is_attack_successfull}')
+    previous_downtime = user_data.get('downtime', 0)
     if is_attack_successfull:
-        if expected_uptime:
-            if expected_uptime > (user_data.get('downtime', 0) + attack_downtime):
-                uptime = expected_uptime - (user_data.get('downtime', 0) + attack_downtime)
-            else:
-                uptime = 0
-        else:
-            uptime = 0
-        downtime = user_data.get('downtime', 0) + attack_downtime
+        downtime = previous_downtime + attack_downtime
     else:
-        if expected_uptime > (user_data.get('downtime', 0)):
-            uptime = expected_uptime - (user_data.get('downtime', 0))
-        else:
-            uptime = 0
-        downtime = user_data.get('downtime', 0)
-    print(f'uptime:{uptime}')
-    print(f'downtime:{downtime}')
+        downtime = previous_downtime
+    uptime = expected_uptime - downtime if expected_uptime > downtime else 0
+
     total_earning = per_hour_earning * uptime
-    print(f'total_earning:{total_earning}')
     expected_total_earning = per_hour_earning * expected_uptime
-    print(f'expected_total_earning:{expected_total_earning}')
     total_loss = per_hour_earning * downtime
-    print(f'total_loss:{total_loss}')
-    if is_attack_successfull:
-        loss_due_to_attack = per_hour_earning * attack_downtime
-    else:
-        loss_due_to_attack = 0
-    print(f'loss_due_to_attack:{loss_due_to_attack}')
-
-    #chosen_controls_with_timestamp = [{"control": control, "timestamp": datetime.utcnow()} for control in chosen_controls]
-    
-    # Current timestamp in the format DD-MM-YYYY hh:mm:ss
-    current_timestamp = datetime.now().strftime("%d-%m-%Y %H:%M:%S")
+    loss_due_to_attack = per_hour_earning * attack_downtime if is_attack_successfull else 0
+
+    set_fields = {
+        "is_playing_status": False,
+        "expected_uptime": expected_uptime,
+        "uptime": uptime,
+        "downtime": downtime,
+        "accumulated_production_amount": total_earning,
+        "accumulated_production_loss": total_loss,
+        "expected_production_amount": expected_total_earning
+    }
+    inc_fields = {
+        "no_of_attacks_successfull": 1 if is_attack_successfull else 0,
+        "no_of_attacks_mitigated": 0 if is_attack_successfull else 1,
+        "level_count": 1,
+        "version": 1
+    }
+    level = {
+        "controls": {
+            "chosen": chosen_controls,
+            "max_effective_control": control,
+            "max_effective_control_effectiveness": controls_effectiveness_list.get(control, 0)
+        },
+        "controls_tasks_combined_effectiveness": controls_tasks_combined_effectiveness,
+        "controls_effectiveness": controls_effectiveness_list,
+        "tasks_effectiveness": task_effectiveness_list,
+        "attack": attack,
+        "timestamp": attack_context['level_timestamp']
+    }
+    threat = {
+        'name': attack,
+        'is_attack_successfull': is_attack_successfull,
+        'actual_earning': total_earning,
+        'expected_earning': expected_total_earning,
+        'loss_due_to_attack': loss_due_to_attack
+    }
+
+    budget_left = user_data.get('budget_left', user_data.get('initial_budget', 0))
+    notice = {
+        'attack_outcome': {
+            'attack': attack,
+            'level': next_level,
+            'is_attack_successfull': is_attack_successfull,
+            'uptime': uptime,
+            'downtime': downtime,
+            'budget_left': budget_left,
+            'apply_for_budget': user_data.get('apply_for_budget', False)
+        }
+    }
 
-    #new_controls, degraded_controls = get_degraded_controls(user_data, chosen_controls_with_timestamp)
+    event = event_insert(user_data['user_id'], 'attack', {'seq': next_level, 'level': level, 'threat': threat},
+                         ts=attack_context['event_time'])
+    return UpdateOne(
+        {"user_id": user_data['user_id']},
+        {
+            '$set': set_fields,
+            '$inc': inc_fields
+        }
+    ), notice, event
 
 
+def push_attack_outcomes(db, outcomes):
+    # Each connected player gets their own outcome, so clients need not poll /getUserStats
+    if not outcomes:
+        return
     try:
-        db.usersData.update_one(
-        {"user_id": user_id},
-        {
-            '$push': {
-                # Update the 'threats' field to include an array that represents the tuple
-                'threats': {
-                    '$each': [
-                        {
-                            'name': attack,
-                            'is_attack_successfull': is_attack_successfull,
-                            'actual_earning': total_earning,
-                            'expected_earning': expected_total_earning,
-                            'loss_due_to_attack': loss_due_to_attack
-                        }
-                    ]
-                }
-            },
-            
-            '$set': {
-                #'degraded_controls_list': degraded_controls_list,
-                "is_playing_status": is_playing_status,
-                "expected_uptime": expected_uptime,
-                "uptime": uptime,
-                "downtime": downtime,
-                "no_of_attacks_successfull": no_of_attacks_successfull,
-                "no_of_attacks_mitigated": no_of_attacks_mitigated,
-                "accumulated_production_amount": total_earning,
-                "accumulated_production_loss": total_loss,
-                "expected_production_amount": expected_total_earning,
-                f"{update_path}.controls.chosen": chosen_controls,
-                f"{update_path}.controls.max_effective_control": control,
-                f"{update_path}.controls.max_effective_control_effectiveness": controls_effectiveness_list.get(control, 0),
-                f"{update_path}.controls_tasks_combined_effectiveness": controls_tasks_combined_effectiveness,
-                f"{update_path}.controls_effectiveness": controls_effectiveness_list,
-                f"{update_path}.tasks_effectiveness": task_effectiveness_list,
-                f"{update_path}.attack": attack,
-                # f"{update_path}.expected_earning": production_amount,
-                # f"{update_path}.actual_earning": production_of_day,
-                # f"{update_path}.loss": loss,
-                f"{update_path}.timestamp": current_timestamp  # Adding the timestamp
-            }
-        }
-    )
-        print(f'Users attack stats has been updated successfully')
+        messages = ((connection_id, outcomes[user_id])
+                    for connection_id, user_id in iter_user_connections(db, outcomes))
+        metrics = deliver(get_management_client(MANAGEMENT_API_URL), messages, label='attackOutcome')
+        prune_stale_connections(db, metrics)
     except Exception as e:
-        print(f'Users attack stats has failed to update in DB: {e}')
-        return
-    
+        log.error('Attack outcome push failed', error=e)
+
+
+def reset_update_attack_stats_flag(db):
     try:
         collection = db['game_status']
         update_query = {
@@ -355,10 +279,6 @@ def set_choices_database_level(db, user_id, chosen_controls, controls_tasks_comb
                         }
                     }
         collection.update_one({}, update_query, upsert=True)
-        print('update_attack_stats flag is unset successfully')
+        log.info('update_attack_stats flag is unset successfully')
     except Exception as e:
-            print(f'update_attack_stats flag is failed to unset in DB: {e}')
-
-
-    print('=> returning after update to DB....')
-    return
\ No newline at end of file
+            log.error('update_attack_stats flag is failed to unset in DB', error=e)
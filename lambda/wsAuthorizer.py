@@ -0,0 +1,75 @@
+import os
+import json
+import base64
+from botocore.exceptions import ClientError
+from gamecore.clients import get_cognito_client
+from gamecore.log import get_logger
+from gamecore.tracing import traced
+
+# REQUEST authorizer of the WebSocket $connect route. The player's Cognito
+# access token arrives in the `token` query string parameter; the user it
+# belongs to is passed to connect.py as principalId and context.user_id.
+COGNITO_USER_POOL_ID = os.environ.get('COGNITO_USER_POOL_ID', '')
+# Comma-separated app client ids whose tokens may connect; empty allows any client of the pool
+COGNITO_CLIENT_IDS = {client_id for client_id in os.environ.get('COGNITO_CLIENT_IDS', '').split(',') if client_id}
+log = get_logger('wsAuthorizer')
+
+
+def get_issuer(user_pool_id):
+    region = user_pool_id.split('_', 1)[0]
+    return f'https://cognito-idp.{region}.amazonaws.com/{user_pool_id}'
+
+
+def read_claims(token):
+    """The unverified payload of a JWT, or None if token is not one."""
+    try:
+        payload = token.split('.')[1]
+        return json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+    except (IndexError, ValueError):
+        return None
+
+
+def is_pool_access_token(claims):
+    # GetUser accepts tokens of any user pool, so the issuer is checked first
+    return (isinstance(claims, dict)
+            and claims.get('token_use') == 'access'
+            and bool(COGNITO_USER_POOL_ID) and claims.get('iss') == get_issuer(COGNITO_USER_POOL_ID)
+            and (not COGNITO_CLIENT_IDS or claims.get('client_id') in COGNITO_CLIENT_IDS))
+
+
+def get_token_user(token):
+    """The username of a valid access token of our user pool, or None.
+
+    Cognito's GetUser checks the signature and expiry, and also rejects
+    tokens that were revoked or belong to a signed-out user.
+    """
+    if not token or not is_pool_access_token(read_claims(token)):
+        return None
+    try:
+        return get_cognito_client(COGNITO_USER_POOL_ID).get_user(AccessToken=token)['Username']
+    except ClientError as e:
+        log.info('token rejected: %s', e.response.get('Error', {}).get('Code'))
+        return None
+
+
+def allow_policy(user_id, method_arn):
+    return {
+        'principalId': user_id,
+        'policyDocument': {
+            'Version': '2012-10-17',
+            'Statement': [{'Action': 'execute-api:Invoke', 'Effect': 'Allow', 'Resource': method_arn}]
+        },
+        'context': {'user_id': user_id}
+    }
+
+
+@traced('wsAuthorizer')
+def lambda_handler(event, context):
+    log.start(event)
+    token = (event.get('queryStringParameters') or {}).get('token')
+    user_id = get_token_user(token)
+    if not user_id:
+        # API Gateway answers the $connect with 401
+        raise Exception('Unauthorized')
+    log.info('Connection authorized for %s', user_id)
+    return allow_policy(user_id, event['methodArn'])
@@ -6,6 +6,7 @@ import os
 import logging
 import random
 import urllib.parse
+import uuid
 from cognito_auth import get_access_token
 import argparse 
 
@@ -28,6 +29,10 @@ SELECT_CONTROLS_URL = 'https://XXXXXXXXXXXXXXXXXXXXXXXXXXXX.amazonaws.com/produc
 GET_USER_STATS_URL = 'https://XXXXXXXXXXXXXXXXXXXXXXXXXXXX.amazonaws.com/production/getUserStats'
 SELECT_PROJECT_URL = 'https://XXXXXXXXXXXXXXXXXXXXXXXXXXXX.amazonaws.com/production/task?task='
 SOLVE_SITUATIONS_URL = 'https://XXXXXXXXXXXXXXXXXXXXXXXXXXXX.amazonaws.com/production/situation?situation='
+CONTROLS_CATALOG_URL = 'https://XXXXXXXXXXXXXXXXXXXXXXXXXXXX.amazonaws.com/production/controlsCatalog?v='
+# Spending and budget calls are retried with the same Idempotency-Key, so a
+# retry never applies twice
+MUTATING_API_ATTEMPTS = 3
 
 sorted_controls = []
 available_controls = {}
@@ -71,40 +76,93 @@ logging.basicConfig(level=logging.INFO, filename=log_file_path, filemode='a',
 # Global variable to store the access token
 access_token = ''
 
-async def listen(uri):
+# Last ETag seen per GET url, sent back as If-None-Match
+response_etags = {}
+
+# Attack outcomes arrive over the WebSocket, so /getUserStats is only a slow fallback poll
+USER_STATS_POLL_SECONDS = (45, 75)
+
+def load_cached_catalog():
+    # The controls catalog is cached on disk as {'name', 'version', 'hash', 'controls'}
+    if os.path.exists(TEMP_FILE_PATH):
+        with open(TEMP_FILE_PATH, 'r') as temp_file:
+            cached = json.load(temp_file)
+        if isinstance(cached, dict) and 'hash' in cached:
+            return cached
+    return None
+
+def save_cached_catalog(catalog):
+    with open(TEMP_FILE_PATH, 'w') as temp_file:
+        json.dump(catalog, temp_file)
+
+def index_controls(catalog):
+    # Numbered options in key order, as shown to the player
+    sorted_items = sorted(catalog.get('controls', {}).items(), key=lambda x: x[0])
+    return {str(idx + 1): control for idx, (key, control) in enumerate(sorted_items)}
+
+async def sync_controls_catalog(reference):
+    # Only fetches the catalog body when the cached copy has a different hash
+    cached = load_cached_catalog()
+    if cached and cached['hash'] == reference.get('hash'):
+        logging.info(f"sync_controls_catalog: cached catalog {cached['hash']} is current")
+        return cached
+    catalog, status = await call_api(CONTROLS_CATALOG_URL + urllib.parse.quote(reference.get('hash', '')))
+    if status != 200:
+        logging.error(f"sync_controls_catalog: catalog fetch failed with status {status}")
+        return cached
+    save_cached_catalog(catalog)
+    return catalog
+
+async def apply_catalog_delta(delta):
+    # Applies a delta when it is based on our cached version, otherwise refetches
+    cached = load_cached_catalog()
+    if not cached or cached['hash'] != delta.get('base_hash'):
+        return await sync_controls_catalog(delta)
+    controls = dict(cached['controls'])
+    controls.update(delta.get('upserted', {}))
+    for key in delta.get('removed', []):
+        controls.pop(key, None)
+    catalog = {'name': cached['name'], 'version': delta['version'], 'hash': delta['hash'], 'controls': controls}
+    save_cached_catalog(catalog)
+    return catalog
+
+def use_catalog(catalog):
     global available_controls
     global sorted_controls
+    available_controls = index_controls(catalog) if catalog else {}
+    formatted_controls = [f"{idx}. {control['control']}, {control['cost']}" for idx, control in available_controls.items()]
+    logging.info(f"WebSocket listen: formatted Controls data: {chr(10).join(formatted_controls)}")
+    sorted_controls = [item['control'] for item in available_controls.values()]
+    logging.info(f"WebSocket listen: Available controls are {sorted_controls}")
+
+async def listen(uri):
     global connection_established
+    global budget_left
+    global apply_for_budget
     logging.info("WebSocket listen: Attempting to open WebSocket connection.")
-    async with websockets.connect(uri) as websocket:
+    # The token identifies this player to the $connect authorizer for targeted pushes
+    async with websockets.connect(f"{uri}?token={urllib.parse.quote(access_token)}") as websocket:
         try:
             while True:
                 message = await websocket.recv()
                 data = json.loads(message)
                 #logging.info(f"Received data from WebSocket: {data}")
                 if data.get('budget', False):
-                    connection_established = True 
-                    # Sorting and formatting the controls.
-                    sorted_controls = sorted(data['controls'].items(), key=lambda x: x[0])
-                    formatted_controls = [f"{idx+1}. {control['control']}, {control['cost']}" for idx, (_, control) in enumerate(sorted_controls)]
-                    formatted_message = "\n".join(formatted_controls)                     
-                    # Printing formatted message.
-                    logging.info(f"WebSocket listen: formatted Controls data: {formatted_message}")
-                    if sorted_controls:
-                        available_controls = {str(idx + 1): control for idx, (key, control) in enumerate(sorted_controls)}
-                        with open(TEMP_FILE_PATH, 'w') as temp_file:
-                            json.dump(available_controls, temp_file)
-                        
-                    if not available_controls:
-                        logging.info(f'WebSocket listen:  inside websocket available_controls:{available_controls}')
-                        logging.info("WebSocket listen:  No controls available. Admin has not started the game.") 
-                        if os.path.exists(TEMP_FILE_PATH):
-                            with open(TEMP_FILE_PATH, 'r') as temp_file:
-                                available_controls = json.load(temp_file)                   
-                    sorted_controls = [ item['control'] for item in available_controls.values()] 
-                    logging.info(f"WebSocket listen: Available controls are {sorted_controls}")       
-                    # else:
-                    #     continue    
+                    connection_established = True
+                    catalog = await sync_controls_catalog(data.get('catalog', {}))
+                    if not catalog or not catalog.get('controls'):
+                        logging.info("WebSocket listen:  No controls available. Admin has not started the game.")
+                    use_catalog(catalog)
+                elif data.get('catalog_delta', False):
+                    catalog = await apply_catalog_delta(data['catalog_delta'])
+                    logging.info(f"WebSocket listen: controls catalog updated to version {data['catalog_delta'].get('version')}")
+                    use_catalog(catalog)
+                elif data.get('attack_outcome', False):
+                    # Own result of the last attack, pushed instead of polled from /getUserStats
+                    outcome = data['attack_outcome']
+                    budget_left = outcome.get('budget_left', budget_left)
+                    apply_for_budget = outcome.get('apply_for_budget', apply_for_budget)
+                    logging.info(f"WebSocket listen: Attack outcome: {outcome}")
                 elif data.get('attack', False):
                     # Printing formatted message.
                     logging.info(f"WebSocket listen: Attacks data: {data}")
@@ -115,12 +173,16 @@ async def listen(uri):
         except websockets.exceptions.ConnectionClosed as e:
             logging.error(f"WebSocket listen: WebSocket connection closed with exception: {e}")
 
-async def call_api(url, method='GET', payload=None):
+async def call_api(url, method='GET', payload=None, extra_headers=None):
     global access_token
-    headers = {'Authorization': f'Bearer {access_token}'}
+    headers = {'Authorization': f'Bearer {access_token}', **(extra_headers or {})}
     async with aiohttp.ClientSession() as session:
         if method == 'GET':
             async with session.get(url, headers=headers) as response:
+                if response.status == 304:
+                    return None, response.status
+                if response.headers.get('ETag'):
+                    response_etags[url] = response.headers['ETag']
                 response_data = await response.json()
                 #logging.info(f"API GET Response from {url}: Status {response.status}, Data {response_data}")
                 # if response.status != 200:
@@ -137,6 +199,19 @@ async def call_api(url, method='GET', payload=None):
                     logging.error(f"call_api: API POST Response from {url}: Status {response.status}, Data {response_data}")
                 return response_data, response.status
 
+async def call_mutating_api(url):
+    headers = {'Idempotency-Key': str(uuid.uuid4())}
+    for attempt in range(1, MUTATING_API_ATTEMPTS + 1):
+        try:
+            api_response, response_status = await call_api(url, extra_headers=headers)
+            if response_status < 500 or attempt == MUTATING_API_ATTEMPTS:
+                return api_response, response_status
+        except aiohttp.ClientError as e:
+            if attempt == MUTATING_API_ATTEMPTS:
+                raise
+            logging.error(f"call_mutating_api: {url} failed with {e}")
+        await asyncio.sleep(0.5 * attempt)
+
 async def user_interaction():
     continue_program = True
     play_game = True
@@ -167,10 +242,10 @@ async def user_interaction():
 
                 if not play_game:
                     if not available_controls:
-                        if os.path.exists(TEMP_FILE_PATH):
+                        cached_catalog = load_cached_catalog()
+                        if cached_catalog:
                             logging.info(f"user_interaction: Reading the controls from the file, seems admin has not started the game")
-                            with open(TEMP_FILE_PATH, 'r') as temp_file:
-                                available_controls = json.load(temp_file)
+                            available_controls = index_controls(cached_catalog)
                             #sorted_controls = [item['control'] for item in available_controls]
                             # for item in available_controls.values():
                             #     print(item)
@@ -222,7 +297,7 @@ async def user_interaction():
                     safe_control = urllib.parse.quote(selected_control)
                     url = SELECT_CONTROLS_URL + safe_control
                     #controls_query = ','.join(selected_controls)
-                    api_response, response_status = await call_api(url)
+                    api_response, response_status = await call_mutating_api(url)
                     logging.info(f"user_interaction: Select control API called. Response status: {response_status}")
 
                     if response_status == 200:
@@ -294,7 +369,7 @@ async def complete_project():
                     safe_project = urllib.parse.quote(selected_project)
                     url = SELECT_PROJECT_URL + safe_project
                     #controls_query = ','.join(selected_controls)
-                    api_response, response_status = await call_api(url)
+                    api_response, response_status = await call_mutating_api(url)
                     logging.info(f"complete_project:Select project API called. Response status: {response_status}")
 
                     if response_status == 200:
@@ -350,7 +425,7 @@ async def solve_situations():
                     safe_situation = urllib.parse.quote(f"situation{selected_situation_id},{selected_option}")
                     url = SOLVE_SITUATIONS_URL + safe_situation
                     #controls_query = ','.join(selected_controls)
-                    api_response, response_status = await call_api(url)
+                    api_response, response_status = await call_mutating_api(url)
                     logging.info(f"solve_situations: Selected situation API called with params situation{selected_situation_id},{selected_option}. Response status: {response_status}")
 
                     if response_status == 200:
@@ -391,7 +466,7 @@ async def request_budget():
             if connection_established:
                 # if apply_for_budget:
                 #     if request_budget_flag:
-                api_response, response_status = await call_api(REQUEST_BUDGET_URL)
+                api_response, response_status = await call_mutating_api(REQUEST_BUDGET_URL)
                 logging.info(f'request_budget: Request Budget api response after the apply_for_budget flag is True ')
                 logging.info(f"request_budget: Request budget API called. Response status: {response_status}")
                     # else:
@@ -436,10 +511,12 @@ async def get_user_stats():
     global budget_left
     logging.info("get_user_stats: Starting periodic user stats retrieval.")
     while True:
-        await asyncio.sleep(random.uniform(0, 6))
+        await asyncio.sleep(random.uniform(*USER_STATS_POLL_SECONDS))
         try:
             if connection_established:
-                api_response, response_status = await call_api(GET_USER_STATS_URL)
+                # Conditional poll: 304 means nothing changed since the last response
+                etag = response_etags.get(GET_USER_STATS_URL)
+                api_response, response_status = await call_api(GET_USER_STATS_URL, extra_headers={'If-None-Match': etag} if etag else None)
                 logging.info(f"get_user_stats: Received user stats: {api_response}")
                 if response_status == 200:
                     apply_for_budget = api_response.get('apply_for_budget', False)
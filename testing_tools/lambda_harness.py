@@ -0,0 +1,462 @@
+"""Runs the Lambda handlers in ../lambda in-process, without AWS.
+
+Events are built the way API Gateway builds them: REST events with Cognito
+claims in requestContext.authorizer, WebSocket events with a connectionId.
+Handlers read and write either an in-memory mongomock database seeded from
+DB/*.mongodb, or a local mongod when one is given. The management API,
+Lambda and S3 clients are recording fakes installed through gamecore.clients,
+so pushes and invocations can be inspected after each call.
+
+    from lambda_harness import LambdaHarness
+    with LambdaHarness() as harness:               # or LambdaHarness('mongodb://localhost:27017')
+        harness.connect('conn-1', 'player1')
+        harness.call('/play', 'player1')
+        harness.call('/selectControls', 'player1', {'controls': 'Secure Web Gateway'})
+        harness.invoke('pushSituations')
+        harness.management.messages_for('conn-1')
+
+Per-invocation DB traces are collected in harness.traces. mongomock sends no
+command events, so with it each collection call is counted as one command;
+only a real mongod gives wire-level round trips and server times.
+"""
+import os
+import io
+import re
+import sys
+import json
+import glob
+import contextlib
+import uuid
+import time
+import threading
+import importlib
+from datetime import datetime, timedelta
+from botocore.exceptions import ClientError
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda')
+DB_SEED_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'DB')
+sys.path.insert(0, LAMBDA_DIR)
+
+# Handlers read MONGODB_URI at import; the harness injects its database first
+os.environ.setdefault('MONGODB_URI', 'mongodb://harness.invalid')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+from gamecore import db as gamedb
+from gamecore import broadcast, catalog, connections, events, idempotency, ledger
+from gamecore.clients import set_client, reset_clients
+from gamecore.broadcast import create_local_invoker, set_shard_invoker
+from gamecore.tracing import InMemoryExporter, set_exporter
+
+# API Gateway resource path -> handler module
+ROUTES = {
+    '/play': 'gamePlay',
+    '/selectControls': 'gameSelectControls',
+    '/specialProject': 'gameSpecialProject',
+    '/situation': 'gameSituations',
+    '/requestBudget': 'gameRequestBudget',
+    '/getUserStats': 'gameGetUserStats',
+    '/startGame': 'setGameStatus',
+    '/stopGame': 'setGameStatus',
+    '/remove': 'game-store-user-data-to-s3',
+    '/addControl': 'manage_game_data',
+    '/addThreat': 'manage_game_data',
+    '/getThreats': 'manage_game_data',
+    '/getControls': 'manage_game_data',
+    '/controlsCatalog': 'manage_game_data',
+    '/deleteThreats': 'manage_game_data',
+    '/deleteControls': 'manage_game_data',
+    '/resetGame': 'manage_game_data'
+}
+
+
+def rest_event(path, user_id=None, params=None, headers=None, method='GET', body=None):
+    """An API Gateway REST proxy event; params values may be strings or lists."""
+    multi_value_params = {key: value if isinstance(value, list) else [value] for key, value in (params or {}).items()}
+    headers = dict(headers or {})
+    claims = {'token_use': 'access', 'scope': 'https://api_userpool_resource_server.com/Read'}
+    if user_id:
+        claims['username'] = user_id
+    return {
+        'resource': path,
+        'path': path,
+        'httpMethod': method,
+        'headers': headers or None,
+        'multiValueHeaders': {key: [value] for key, value in headers.items()} or None,
+        'queryStringParameters': {key: value[-1] for key, value in multi_value_params.items()} or None,
+        'multiValueQueryStringParameters': multi_value_params or None,
+        'requestContext': {
+            'resourcePath': path,
+            'httpMethod': method,
+            'requestId': str(uuid.uuid4()),
+            'stage': 'production',
+            'authorizer': {'claims': claims}
+        },
+        'body': body if body is None or isinstance(body, str) else json.dumps(body),
+        'isBase64Encoded': False
+    }
+
+
+def websocket_event(route_key, connection_id, user_id=None, body=None):
+    """An API Gateway WebSocket event for $connect, $disconnect or $default."""
+    return {
+        'requestContext': {
+            'routeKey': route_key,
+            'eventType': {'$connect': 'CONNECT', '$disconnect': 'DISCONNECT'}.get(route_key, 'MESSAGE'),
+            'connectionId': connection_id,
+            'requestId': str(uuid.uuid4()),
+            'stage': 'production',
+            'authorizer': {'principalId': user_id, 'user_id': user_id} if user_id else None
+        },
+        'body': body if body is None or isinstance(body, str) else json.dumps(body),
+        'isBase64Encoded': False
+    }
+
+
+def client_error(code, operation, status=400):
+    return ClientError({'Error': {'Code': code, 'Message': code}, 'ResponseMetadata': {'HTTPStatusCode': status}}, operation)
+
+
+class RecordingManagementClient:
+    """Stands in for apigatewaymanagementapi; connections in `gone` answer GoneException."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.posts = []
+        self.gone = set()
+
+    def post_to_connection(self, ConnectionId, Data):
+        if ConnectionId in self.gone:
+            raise client_error('GoneException', 'PostToConnection', 410)
+        with self.lock:
+            self.posts.append((ConnectionId, Data))
+        return {}
+
+    def get_connection(self, ConnectionId):
+        if ConnectionId in self.gone:
+            raise client_error('GoneException', 'GetConnection', 410)
+        return {'ConnectedAt': datetime.utcnow(), 'Identity': {'SourceIp': '127.0.0.1'}}
+
+    def delete_connection(self, ConnectionId):
+        self.gone.add(ConnectionId)
+        return {}
+
+    def messages_for(self, connection_id):
+        """The decoded messages posted to connection_id, oldest first."""
+        return [json.loads(data) for posted_to, data in self.posts if posted_to == connection_id]
+
+    def clear(self):
+        with self.lock:
+            self.posts.clear()
+
+
+class RecordingLambdaClient:
+    """Stands in for the Lambda client and runs invoked functions in-process.
+
+    RequestResponse invocations run at once; Event (asynchronous) ones are
+    queued until run_pending(), as they would run after the caller returns.
+    """
+
+    def __init__(self, run_function):
+        self.run_function = run_function
+        self.invocations = []
+        self.pending = []
+
+    def invoke(self, FunctionName, InvocationType='RequestResponse', Payload=b'', **kwargs):
+        payload = json.loads(Payload or b'null')
+        self.invocations.append({'function': FunctionName, 'type': InvocationType, 'payload': payload})
+        if InvocationType == 'Event':
+            self.pending.append((FunctionName, payload))
+            return {'StatusCode': 202, 'Payload': io.BytesIO(b'')}
+        try:
+            result = self.run_function(FunctionName, payload)
+        except Exception as e:
+            error = {'errorMessage': str(e), 'errorType': type(e).__name__}
+            return {'StatusCode': 200, 'FunctionError': 'Unhandled', 'Payload': io.BytesIO(json.dumps(error).encode('utf-8'))}
+        return {'StatusCode': 200, 'Payload': io.BytesIO(json.dumps(result, default=str).encode('utf-8'))}
+
+    def run_pending(self):
+        """Runs queued Event invocations, including any they queue; returns their results."""
+        results = []
+        while self.pending:
+            function_name, payload = self.pending.pop(0)
+            results.append((function_name, self.run_function(function_name, payload)))
+        return results
+
+
+class RecordingS3Client:
+    """Stands in for the S3 client; uploaded files are kept in `objects`."""
+
+    def __init__(self):
+        self.objects = {}
+
+    def upload_file(self, Filename, Bucket, Key, **kwargs):
+        with open(Filename, 'rb') as f:
+            self.objects[(Bucket, Key)] = f.read()
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[(Bucket, Key)] = Body if isinstance(Body, bytes) else Body.encode('utf-8')
+        return {}
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise client_error('404', 'HeadObject', 404)
+        return {'ContentLength': len(self.objects[(Bucket, Key)])}
+
+
+# --- Seed data -----------------------------------------------------------------
+
+JS_TOKEN = re.compile(r"""\s*(?:('(?:[^'\\]|\\.)*')|("(?:[^"\\]|\\.)*")|([A-Za-z_$][\w$]*)|(-?\d+(?:\.\d+)?)|([{}\[\]:,]))""")
+JS_INSERT = re.compile(r'db\.(\w+)\.insertOne\(\s*(.*)\)\s*;?\s*$', re.S)
+
+
+def parse_js_literal(text):
+    """Parses the object literals of the DB/*.mongodb scripts (bare keys, quotes, trailing commas)."""
+    tokens = []
+    position = 0
+    while position < len(text.rstrip()):
+        match = JS_TOKEN.match(text, position)
+        if not match:
+            raise ValueError(f'unexpected {text[position:position + 20]!r}')
+        single, double, name, number, punct = match.groups()
+        if single or double:
+            tokens.append(('value', json.loads('"' + (single or double)[1:-1].replace("\\'", "'").replace('"', '\\"') + '"')
+                           if single else json.loads(double)))
+        elif name:
+            tokens.append(('value', {'true': True, 'false': False, 'null': None}.get(name, name)))
+        elif number:
+            tokens.append(('value', float(number) if '.' in number else int(number)))
+        else:
+            tokens.append((punct, punct))
+        position = match.end()
+
+    def parse(i):
+        kind, value = tokens[i]
+        if kind == 'value':
+            return value, i + 1
+        closing = '}' if kind == '{' else ']'
+        result = {} if kind == '{' else []
+        i += 1
+        while tokens[i][0] != closing:
+            if kind == '{':
+                key, i = parse(i)
+                i += 1  # ':'
+                result[key], i = parse(i)
+            else:
+                item, i = parse(i)
+                result.append(item)
+            if tokens[i][0] == ',':
+                i += 1
+        return result, i + 1
+
+    return parse(0)[0]
+
+
+def load_seed_file(path):
+    """(collection, document) of a `db.<collection>.insertOne({...})` script."""
+    with open(path) as f:
+        match = JS_INSERT.search(f.read())
+    if not match:
+        raise ValueError(f'{path} is not a db.<collection>.insertOne() script')
+    return match.group(1), parse_js_literal(match.group(2))
+
+
+# --- mongomock -----------------------------------------------------------------
+
+def patch_mongomock(mongomock):
+    """Makes mongomock's find_one_and_update(AFTER) match the server.
+
+    mongomock re-applies the filter after the update, so a guarded update such
+    as {budget_left: {$gte: cost}} + {$inc: {budget_left: -cost}} returns None
+    once the guard no longer holds. MongoDB returns the updated document. Calls
+    are also serialized, as the server makes the match and update one atomic
+    step, so concurrent guarded updates can be tested.
+    """
+    from pymongo import ReturnDocument
+    collection_class = mongomock.collection.Collection
+    original = collection_class.find_one_and_update
+    lock = threading.RLock()
+
+    def find_one_and_update(self, filter, update, projection=None, return_document=ReturnDocument.BEFORE, **kwargs):
+        with lock:
+            if return_document != ReturnDocument.AFTER:
+                return original(self, filter, update, projection, return_document, **kwargs)
+            before = original(self, filter, update, {'_id': 1}, ReturnDocument.BEFORE, **kwargs)
+            if before is None:
+                # An upsert inserted the document; it is the only one the filter matches
+                return self.find_one(filter, projection) if kwargs.get('upsert') else None
+            return self.find_one({'_id': before['_id']}, projection)
+
+    collection_class.find_one_and_update = find_one_and_update
+
+
+# mongomock Collection method -> the command pymongo would send for it
+MONGOMOCK_COMMANDS = {
+    'find': 'find', 'find_one': 'find', 'count_documents': 'aggregate', 'distinct': 'distinct',
+    'aggregate': 'aggregate', 'insert_one': 'insert', 'insert_many': 'insert', 'update_one': 'update',
+    'update_many': 'update', 'replace_one': 'update', 'delete_one': 'delete', 'delete_many': 'delete',
+    'bulk_write': 'bulkWrite', 'find_one_and_update': 'findAndModify', 'find_one_and_delete': 'findAndModify',
+    'create_index': 'createIndexes'
+}
+
+
+def trace_mongomock(mongomock):
+    """Reports each mongomock collection call to command_tracer as one command.
+
+    mongomock publishes no command events, so this stands in for them: a call
+    counts as one round trip and its time is the in-memory work. Cursor
+    batches after the first are not counted.
+    """
+    from types import SimpleNamespace
+    from gamecore.tracing import command_tracer
+    collection_class = mongomock.collection.Collection
+    depth = threading.local()
+
+    def wrap(method, command_name):
+        def traced_method(self, *args, **kwargs):
+            # Only the outermost call counts; some methods call others
+            if getattr(depth, 'value', 0):
+                return method(self, *args, **kwargs)
+            depth.value = 1
+            start = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                depth.value = 0
+                command_tracer.succeeded(SimpleNamespace(
+                    command_name=command_name, duration_micros=int((time.perf_counter() - start) * 1e6), reply=None))
+        return traced_method
+
+    for method_name, command_name in MONGOMOCK_COMMANDS.items():
+        setattr(collection_class, method_name, wrap(getattr(collection_class, method_name), command_name))
+
+
+@contextlib.contextmanager
+def patched_mongomock(mongomock):
+    """Applies patch_mongomock() and trace_mongomock() until the block exits.
+
+    Both replace methods of mongomock's Collection class, so they are undone on
+    exit rather than left in place for other mongomock users in the process.
+    """
+    collection_class = mongomock.collection.Collection
+    originals = {name: collection_class.__dict__[name] for name in MONGOMOCK_COMMANDS}
+    patch_mongomock(mongomock)
+    trace_mongomock(mongomock)
+    try:
+        yield
+    finally:
+        for name, method in originals.items():
+            setattr(collection_class, name, method)
+
+
+# gamecore modules that remember, per process, that their indexes exist
+INDEXED_MODULES = (connections, events, idempotency, ledger)
+
+
+def restore_database(client, db):
+    gamedb.cached_client, gamedb.cached_db = client, db
+
+
+@contextlib.contextmanager
+def fresh_process_state():
+    """Starts gamecore with a cold catalog cache and no indexes ensured.
+
+    Both belong to the database they were filled from, so a harness must not
+    inherit them from an earlier one; the previous state comes back on exit.
+    """
+    cache = dict(catalog.catalog_cache)
+    flags = {module: module.indexes_ensured for module in INDEXED_MODULES}
+    catalog.catalog_cache.update(version=None, checked_at=0.0, entries={})
+    for module in INDEXED_MODULES:
+        module.indexes_ensured = False
+    try:
+        yield
+    finally:
+        catalog.catalog_cache.update(cache)
+        for module, ensured in flags.items():
+            module.indexes_ensured = ensured
+
+
+class LambdaHarness:
+    """One game backend, in-process: database, AWS fakes and handler modules.
+
+    close() (or leaving a `with LambdaHarness() as harness:` block) undoes the
+    mongomock patches and gives gamecore back its database, clients, exporter,
+    catalog cache and index flags.
+    """
+
+    def __init__(self, mongodb_uri=None, seed=True, database_name=gamedb.DATABASE_NAME):
+        self.cleanup = contextlib.ExitStack()
+        if mongodb_uri:
+            self.db = gamedb.create_client(mongodb_uri)[database_name]
+            self.cleanup.callback(self.db.client.close)
+        else:
+            import mongomock
+            self.cleanup.enter_context(patched_mongomock(mongomock))
+            self.db = mongomock.MongoClient()[database_name]
+        self.cleanup.callback(restore_database, gamedb.cached_client, gamedb.cached_db)
+        gamedb.set_database(self.db)
+        self.cleanup.enter_context(fresh_process_state())
+
+        self.management = RecordingManagementClient()
+        self.lambda_client = RecordingLambdaClient(self.invoke)
+        self.s3 = RecordingS3Client()
+        self.cleanup.callback(reset_clients)
+        reset_clients()
+        set_client('apigatewaymanagementapi', self.management)
+        set_client('lambda', self.lambda_client)
+        set_client('s3', self.s3)
+        self.cleanup.callback(set_shard_invoker, broadcast.shard_invoker)
+        set_shard_invoker(create_local_invoker(self.management))
+        self.traces = InMemoryExporter()
+        self.cleanup.callback(set_exporter, set_exporter(self.traces))
+        if seed:
+            self.seed()
+
+    def close(self):
+        self.cleanup.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def seed(self, seed_dir=DB_SEED_DIR):
+        """Inserts the DB/ catalogs into collections that are still empty."""
+        for path in sorted(glob.glob(os.path.join(seed_dir, '*.mong*db'))):
+            collection, document = load_seed_file(path)
+            if self.db[collection].count_documents({}, limit=1) == 0:
+                self.db[collection].insert_one(document)
+
+    def handler(self, function_name):
+        return importlib.import_module(function_name).lambda_handler
+
+    def invoke(self, function_name, event=None):
+        """Invokes a function by name, e.g. a scheduled one: invoke('pushAttack')."""
+        return self.handler(function_name)(event or {}, None)
+
+    def call(self, path, user_id=None, params=None, headers=None, method='GET', body=None):
+        """Sends a REST request to the handler behind path and returns its response."""
+        return self.invoke(ROUTES[path], rest_event(path, user_id, params, headers, method, body))
+
+    def connect(self, connection_id, user_id=None):
+        self.management.gone.discard(connection_id)
+        return self.invoke('connect', websocket_event('$connect', connection_id, user_id))
+
+    def disconnect(self, connection_id):
+        self.management.gone.add(connection_id)
+        return self.invoke('disconnect', websocket_event('$disconnect', connection_id))
+
+    def send(self, connection_id, body):
+        return self.invoke('defaultResponse', websocket_event('$default', connection_id, body=body))
+
+    def start_game(self, started_minutes_ago=0):
+        """Starts the game; pushAttack only attacks games started over 5 minutes ago."""
+        response = self.call('/startGame')
+        if started_minutes_ago:
+            self.db.game_status.update_one({}, {'$set': {
+                'start_timestamp': datetime.utcnow() - timedelta(minutes=started_minutes_ago)}})
+        return response
+
+    def run_pending(self):
+        return self.lambda_client.run_pending()
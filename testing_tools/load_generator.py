@@ -0,0 +1,388 @@
+"""Load generator: thousands of virtual players as asyncio tasks in one process.
+
+Each player plays like bot.py: it keeps one WebSocket open, registers with
+/play once the game-start push arrives, then buys controls, completes
+projects, resolves situations, requests budget and polls /getUserStats.
+All players share one pooled aiohttp session, the controls catalog is
+fetched once per hash for everyone, each player's state lives on its own
+Player object, and log records go through a queue to a background writer.
+
+    python load_generator.py --users users_50.txt --password <password>
+    python load_generator.py --players 10000 --user-prefix loaduser --password <password> --ramp-up 120 --duration 900
+    python load_generator.py --players 500 --auth username --base-url http://localhost:8080 --ws-url ws://localhost:8080/ws
+    python load_generator.py --players 2000 --password <password> --report-json run2.json --report-csv run2.csv --compare run1.json
+
+--auth username sends the username itself as the bearer token, for a local
+stack without Cognito. Raise the open file limit (ulimit -n) above twice
+the player count; the script lifts the soft limit to the hard limit itself.
+Latencies, statuses and requests per second are collected by load_metrics
+and printed as a p50/p95/p99 table at the end.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+import urllib.parse
+import uuid
+import aiohttp
+import websockets
+from cognito_auth import get_access_token
+from load_metrics import LoadMetrics, compare
+
+# Constants
+BASE_URL = 'https://XXXXXXXXXXXXXXXXXXXXXXXXXXXX.amazonaws.com/production'
+WS_URL = 'wss://XXXXXXXXXXXXXXXXXXXXXXXXXXXX.amazonaws.com/production/'
+client_id = 'xxxxxxxxxxxxxxxxxxxxxx'
+client_secret = 'xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx'
+custom_scope = 'https://api_userpool_resource_server.com/Read'
+
+# Spending and budget calls are retried with the same Idempotency-Key
+MUTATING_API_ATTEMPTS = 3
+USER_STATS_POLL_SECONDS = (45, 75)
+WEBSOCKET_RETRY_SECONDS = (1, 30)
+# How often a player picks each action between think times
+ACTION_WEIGHTS = {'selectControls': 4, 'specialProject': 2, 'situation': 2, 'requestBudget': 1}
+# Special projects as seeded in DB/insertSpecialProjects.mongdb
+PROJECTS = [
+    {'project': 'Implement https', 'cost': 500},
+    {'project': 'Setup the VPN for remote login', 'cost': 200},
+    {'project': 'Setup Monitoring Systems', 'cost': 1000},
+    {'project': 'Setup PKI server', 'cost': 500},
+    {'project': 'Conduct security Awareness training', 'cost': 500}
+]
+SITUATIONS = [(1, 1), (1, 2), (2, 1), (2, 2), (2, 3)]
+
+log = logging.getLogger('load_generator')
+
+
+def setup_logging(path, level):
+    """Sends records through a queue so players never wait on the log file."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    records = queue.SimpleQueue()
+    handler = logging.FileHandler(path, mode='a')
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    listener = logging.handlers.QueueListener(records, handler)
+    log.addHandler(logging.handlers.QueueHandler(records))
+    log.setLevel(level)
+    log.propagate = False
+    listener.start()
+    return listener
+
+
+def raise_open_file_limit():
+    """One WebSocket and up to one HTTP connection per player need file descriptors."""
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft < hard:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        return hard
+    except (ImportError, ValueError, OSError):
+        return None
+
+
+class CatalogCache:
+    """Controls catalogs by hash, fetched once for all players."""
+
+    def __init__(self):
+        self.catalogs = {}
+        self.locks = {}
+
+    async def get(self, player, reference):
+        catalog_hash = reference.get('hash', '')
+        if catalog_hash in self.catalogs:
+            return self.catalogs[catalog_hash]
+        async with self.locks.setdefault(catalog_hash, asyncio.Lock()):
+            if catalog_hash not in self.catalogs:
+                catalog, status = await player.call_api('controlsCatalog', '/controlsCatalog', {'v': catalog_hash})
+                if status != 200:
+                    log.error(f'catalog fetch failed with status {status}')
+                    return None
+                self.catalogs[catalog_hash] = catalog
+        return self.catalogs[catalog_hash]
+
+    def apply_delta(self, delta):
+        """The catalog after delta, or None when its base is not cached."""
+        base = self.catalogs.get(delta.get('base_hash'))
+        if base is None:
+            return None
+        if delta['hash'] not in self.catalogs:
+            controls = dict(base['controls'])
+            controls.update(delta.get('upserted', {}))
+            for key in delta.get('removed', []):
+                controls.pop(key, None)
+            self.catalogs[delta['hash']] = {'name': base['name'], 'version': delta['version'],
+                                            'hash': delta['hash'], 'controls': controls}
+        return self.catalogs[delta['hash']]
+
+
+class Player:
+    """One virtual player: its token, WebSocket and game state."""
+
+    def __init__(self, username, session, config, metrics, catalogs):
+        self.username = username
+        self.session = session
+        self.config = config
+        self.metrics = metrics
+        self.catalogs = catalogs
+        self.rng = random.Random(f'{config.seed}:{username}')
+        self.access_token = None
+        self.game_started = asyncio.Event()
+        self.registered = False
+        self.controls = {}
+        self.budget_left = 15000
+        self.apply_for_budget = False
+        self.etags = {}
+
+    async def authenticate(self, auth_slots):
+        if self.config.auth == 'username':
+            self.access_token = self.username
+            return True
+        # boto3 is blocking, so tokens are fetched on executor threads, a few at a time
+        async with auth_slots:
+            loop = asyncio.get_running_loop()
+            self.access_token = await loop.run_in_executor(
+                None, get_access_token, client_id, client_secret, self.username, self.config.password, custom_scope)
+        return bool(self.access_token)
+
+    async def call_api(self, endpoint, path, params=None, extra_headers=None):
+        headers = {'Authorization': f'Bearer {self.access_token}', **(extra_headers or {})}
+        start = time.perf_counter()
+        try:
+            async with self.session.get(self.config.base_url + path, params=params, headers=headers) as response:
+                if response.status == 304:
+                    data = None
+                else:
+                    if response.headers.get('ETag'):
+                        self.etags[path] = response.headers['ETag']
+                    data = await response.json(content_type=None)
+                self.metrics.record(endpoint, response.status, time.perf_counter() - start)
+                if response.status >= 500:
+                    log.error(f'{self.username} {endpoint}: status {response.status}, {data}')
+                return data, response.status
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.metrics.record_error(endpoint, e)
+            raise
+
+    async def call_mutating_api(self, endpoint, path, params=None):
+        headers = {'Idempotency-Key': str(uuid.uuid4())}
+        for attempt in range(1, MUTATING_API_ATTEMPTS + 1):
+            try:
+                data, status = await self.call_api(endpoint, path, params, headers)
+                if status < 500 or attempt == MUTATING_API_ATTEMPTS:
+                    return data, status
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt == MUTATING_API_ATTEMPTS:
+                    raise
+                log.warning(f'{self.username} {endpoint}: attempt {attempt} failed with {e!r}')
+            await asyncio.sleep(0.5 * attempt)
+
+    def use_catalog(self, catalog):
+        if catalog:
+            self.controls = {control['control']: int(str(control['cost']).replace('$', ''))
+                             for control in catalog.get('controls', {}).values()}
+
+    async def handle_message(self, data):
+        self.metrics.record_message()
+        if data.get('budget', False):
+            self.use_catalog(await self.catalogs.get(self, data.get('catalog', {})))
+            self.game_started.set()
+        elif data.get('catalog_delta', False):
+            delta = data['catalog_delta']
+            self.use_catalog(self.catalogs.apply_delta(delta) or await self.catalogs.get(self, delta))
+        elif data.get('attack_outcome', False):
+            outcome = data['attack_outcome']
+            self.budget_left = outcome.get('budget_left', self.budget_left)
+            self.apply_for_budget = outcome.get('apply_for_budget', self.apply_for_budget)
+        elif not data.get('attack', False):
+            log.debug(f'{self.username} unknown WebSocket message {data}')
+
+    async def listen(self):
+        url = f'{self.config.ws_url}?token={urllib.parse.quote(self.access_token)}'
+        delay = WEBSOCKET_RETRY_SECONDS[0]
+        while True:
+            try:
+                async with websockets.connect(url, open_timeout=30, max_queue=64) as websocket:
+                    delay = WEBSOCKET_RETRY_SECONDS[0]
+                    async for message in websocket:
+                        await self.handle_message(json.loads(message))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.metrics.record_error('websocket', e)
+                log.warning(f'{self.username} WebSocket closed with {e!r}, reconnecting in {delay}s')
+            await asyncio.sleep(self.rng.uniform(0, delay))
+            delay = min(delay * 2, WEBSOCKET_RETRY_SECONDS[1])
+
+    async def think(self):
+        await asyncio.sleep(self.rng.uniform(*self.config.think_time))
+
+    async def register(self):
+        while not self.registered:
+            data, status = await self.call_api('play', '/play')
+            # 409: the game state already exists from an earlier run
+            self.registered = status in (200, 409)
+            if not self.registered:
+                await self.think()
+
+    async def select_control(self):
+        affordable = [name for name, cost in self.controls.items() if cost <= self.budget_left]
+        if not affordable:
+            return
+        data, status = await self.call_mutating_api('selectControls', '/selectControls',
+                                                    {'controls': self.rng.choice(affordable)})
+        if status == 200:
+            self.budget_left = data['budget_left']
+            self.apply_for_budget = data['request_for_budget']
+
+    async def complete_project(self):
+        project = self.rng.choice(PROJECTS)
+        if project['cost'] > self.budget_left:
+            return
+        data, status = await self.call_mutating_api('specialProject', '/specialProject', {'project': project['project']})
+        if status == 200 and isinstance(data, dict):
+            self.budget_left = data['budget_left']
+            self.apply_for_budget = data['apply_for_budget']
+
+    async def solve_situation(self):
+        situation, option = self.rng.choice(SITUATIONS)
+        data, status = await self.call_mutating_api('situation', '/situation', {'situation': f'situation{situation},{option}'})
+        if status == 200 and isinstance(data, dict):
+            self.budget_left = data['budget_left']
+            self.apply_for_budget = data['apply_for_budget']
+
+    async def request_budget(self):
+        await self.call_mutating_api('requestBudget', '/requestBudget')
+
+    async def act(self):
+        await self.game_started.wait()
+        await self.register()
+        actions = {'selectControls': self.select_control, 'specialProject': self.complete_project,
+                   'situation': self.solve_situation, 'requestBudget': self.request_budget}
+        names = list(ACTION_WEIGHTS)
+        weights = [ACTION_WEIGHTS[name] for name in names]
+        while True:
+            await self.think()
+            name = self.rng.choices(names, weights)[0]
+            try:
+                await actions[name]()
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                pass
+
+    async def poll_user_stats(self):
+        await self.game_started.wait()
+        while True:
+            await asyncio.sleep(self.rng.uniform(*USER_STATS_POLL_SECONDS))
+            etag = self.etags.get('/getUserStats')
+            try:
+                data, status = await self.call_api('getUserStats', '/getUserStats',
+                                                   extra_headers={'If-None-Match': etag} if etag else None)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                continue
+            if status == 200:
+                self.budget_left = data.get('budget_left', self.budget_left)
+                self.apply_for_budget = data.get('apply_for_budget', False)
+
+    async def run(self, start_delay, auth_slots):
+        await asyncio.sleep(start_delay)
+        if not await self.authenticate(auth_slots):
+            log.error(f'{self.username}: no access token')
+            return
+        await asyncio.gather(self.listen(), self.act(), self.poll_user_stats())
+
+
+def read_usernames(args):
+    if args.users:
+        with open(args.users) as f:
+            return [line.strip() for line in f if line.strip()]
+    return [f'{args.user_prefix}{i}' for i in range(1, args.players + 1)]
+
+
+async def report_progress(metrics, interval):
+    """Prints requests per second over each interval while the run is going."""
+    last = 0
+    while True:
+        await asyncio.sleep(interval)
+        requests = sum(histogram.count for histogram in metrics.latency.values())
+        errors = sum(metrics.errors.values())
+        print(f'{metrics.elapsed():6.0f}s {(requests - last) / interval:8.1f} req/s, {requests} requests, {errors} errors',
+              file=sys.stderr)
+        last = requests
+
+
+async def run_load(args, usernames):
+    metrics = LoadMetrics()
+    catalogs = CatalogCache()
+    auth_slots = asyncio.Semaphore(args.auth_concurrency)
+    connector = aiohttp.TCPConnector(limit=args.max_connections, ttl_dns_cache=300, keepalive_timeout=60)
+    timeout = aiohttp.ClientTimeout(total=args.request_timeout)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        players = [Player(username, session, args, metrics, catalogs) for username in usernames]
+        ramp_step = args.ramp_up / len(players) if players else 0
+        tasks = [asyncio.create_task(player.run(i * ramp_step, auth_slots)) for i, player in enumerate(players)]
+        progress = asyncio.create_task(report_progress(metrics, args.progress_interval)) if args.progress_interval else None
+        await asyncio.wait(tasks, timeout=args.duration)
+        metrics.finish()
+        for task in tasks + ([progress] if progress else []):
+            task.cancel()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        for player, result in zip(players, results):
+            if isinstance(result, Exception) and not isinstance(result, asyncio.CancelledError):
+                log.error(f'{player.username} stopped with {result!r}')
+    return metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    who = parser.add_mutually_exclusive_group(required=True)
+    who.add_argument('--users', help='file with one username per line, e.g. users_50.txt')
+    who.add_argument('--players', type=int, help='number of generated usernames <user-prefix>1..N')
+    parser.add_argument('--user-prefix', default='dummyuser')
+    parser.add_argument('--password', default=os.environ.get('LOAD_PASSWORD'), help='shared password (or LOAD_PASSWORD)')
+    parser.add_argument('--auth', choices=('cognito', 'username'), default='cognito')
+    parser.add_argument('--base-url', default=BASE_URL)
+    parser.add_argument('--ws-url', default=WS_URL)
+    parser.add_argument('--duration', type=float, default=600, help='seconds to run after the first player starts')
+    parser.add_argument('--ramp-up', type=float, default=60, help='seconds over which players start')
+    parser.add_argument('--think-time', type=float, nargs=2, default=(0, 6), metavar=('MIN', 'MAX'))
+    parser.add_argument('--max-connections', type=int, default=1000, help='pooled HTTP connections shared by all players')
+    parser.add_argument('--request-timeout', type=float, default=30)
+    parser.add_argument('--auth-concurrency', type=int, default=20, help='Cognito logins in flight')
+    parser.add_argument('--log-file', default='./logs/load_generator.log')
+    parser.add_argument('--log-level', default='INFO')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--progress-interval', type=float, default=10, help='seconds between progress lines, 0 for none')
+    parser.add_argument('--report-json', help='write the summary, timeline and histograms as JSON')
+    parser.add_argument('--report-csv', help='write per-endpoint percentiles as CSV, and the timeline next to it')
+    parser.add_argument('--compare', help='JSON report of an earlier run to compare percentiles with')
+    args = parser.parse_args()
+    if args.auth == 'cognito' and not args.password:
+        parser.error('--password (or LOAD_PASSWORD) is required with --auth cognito')
+
+    usernames = read_usernames(args)
+    open_files = raise_open_file_limit()
+    if open_files and open_files < 2 * len(usernames):
+        print(f'warning: open file limit {open_files} is low for {len(usernames)} players', file=sys.stderr)
+    listener = setup_logging(args.log_file, args.log_level.upper())
+    try:
+        metrics = asyncio.run(run_load(args, usernames))
+    finally:
+        listener.stop()
+    print(metrics.table())
+    if args.report_json:
+        metrics.write_json(args.report_json)
+    if args.report_csv:
+        metrics.write_csv(args.report_csv)
+    if args.compare:
+        with open(args.compare) as f:
+            print('\n' + compare(metrics.summary(), json.load(f)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,252 @@
+"""Latency histograms, status breakdowns and throughput for load tests.
+
+Latencies are kept per endpoint in HDR-style histograms: values in
+microseconds go into log-linear buckets (64 per power of two above 128us),
+so any percentile is within 1.6% of the recorded value while a run of
+millions of requests needs only a few hundred counters per endpoint.
+Histograms merge by adding counts, so runs and processes can be combined.
+
+    metrics = LoadMetrics()
+    metrics.record('selectControls', 200, 0.041)
+    print(metrics.table())
+    metrics.write_json('run.json'); metrics.write_csv('run.csv')
+"""
+import csv
+import json
+import math
+import time
+
+# Custom statuses returned by the game handlers
+GAME_STATUS_CODES = {
+    432: 'over budget',
+    434: 'control already chosen',
+    435: 'unknown control',
+    436: 'not registered',
+    437: 'not eligible for budget',
+    438: 'no user in token',
+    439: 'unknown situation',
+    440: 'unknown situation option',
+    441: 'situation option data missing',
+    442: 'malformed situation',
+    443: 'project over budget',
+    444: 'project already completed',
+    445: 'unknown project',
+}
+PERCENTILES = (50, 90, 95, 99, 99.9)
+# Values below 2**SUB_BUCKET_BITS microseconds are exact
+SUB_BUCKET_BITS = 7
+SUB_BUCKET_HALF = 1 << (SUB_BUCKET_BITS - 1)
+
+
+def bucket_index(value):
+    if value < (1 << SUB_BUCKET_BITS):
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS
+    return (1 << SUB_BUCKET_BITS) + (shift - 1) * SUB_BUCKET_HALF + (value >> shift) - SUB_BUCKET_HALF
+
+
+def bucket_upper_bound(index):
+    """The highest value that lands in bucket index."""
+    if index < (1 << SUB_BUCKET_BITS):
+        return index
+    shift = (index - (1 << SUB_BUCKET_BITS)) // SUB_BUCKET_HALF + 1
+    sub_bucket = (index - (1 << SUB_BUCKET_BITS)) % SUB_BUCKET_HALF + SUB_BUCKET_HALF
+    return ((sub_bucket + 1) << shift) - 1
+
+
+def status_label(status):
+    if status in GAME_STATUS_CODES:
+        return f'{status} {GAME_STATUS_CODES[status]}'
+    return str(status)
+
+
+class LatencyHistogram:
+    """Log-linear histogram of latencies in microseconds."""
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def record(self, seconds):
+        value = max(0, int(seconds * 1e6))
+        index = bucket_index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percent):
+        """Latency in microseconds at or below which percent of the values lie."""
+        if not self.count:
+            return 0
+        rank = max(1, math.ceil(self.count * percent / 100))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(bucket_upper_bound(index), self.max)
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+    def to_dict(self):
+        return {'count': self.count, 'total_us': self.total, 'min_us': self.min or 0, 'max_us': self.max,
+                'buckets': {str(index): count for index, count in sorted(self.counts.items())}}
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls()
+        histogram.counts = {int(index): count for index, count in data['buckets'].items()}
+        histogram.count = data['count']
+        histogram.total = data['total_us']
+        histogram.min = data['min_us'] if data['count'] else None
+        histogram.max = data['max_us']
+        return histogram
+
+
+class LoadMetrics:
+    """Per-endpoint latency and statuses, and requests per second over time."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.finished = None
+        self.latency = {}
+        self.statuses = {}
+        self.errors = {}
+        # Second since start -> {'requests', 'errors', '2xx', '4xx', ...}
+        self.timeline = {}
+        self.websocket_messages = 0
+
+    def tick(self, key):
+        second = self.timeline.setdefault(int(time.monotonic() - self.started), {})
+        second[key] = second.get(key, 0) + 1
+
+    def record(self, endpoint, status, seconds):
+        self.latency.setdefault(endpoint, LatencyHistogram()).record(seconds)
+        statuses = self.statuses.setdefault(endpoint, {})
+        statuses[status] = statuses.get(status, 0) + 1
+        self.tick('requests')
+        self.tick(f'{status // 100}xx')
+
+    def record_error(self, endpoint, error):
+        """A request or connection that failed without a status code."""
+        key = f'{endpoint}: {type(error).__name__}'
+        self.errors[key] = self.errors.get(key, 0) + 1
+        self.tick('errors')
+
+    def record_message(self):
+        self.websocket_messages += 1
+        self.tick('websocket_messages')
+
+    def finish(self):
+        self.finished = time.monotonic()
+
+    def elapsed(self):
+        return (self.finished or time.monotonic()) - self.started
+
+    def endpoint_summary(self, endpoint):
+        histogram = self.latency[endpoint]
+        elapsed = self.elapsed()
+        summary = {
+            'endpoint': endpoint,
+            'requests': histogram.count,
+            'rps': round(histogram.count / elapsed, 2) if elapsed else 0,
+            'mean_ms': round(histogram.mean() / 1000, 2),
+            'max_ms': round(histogram.max / 1000, 2),
+        }
+        for percent in PERCENTILES:
+            summary[f'p{percent:g}_ms'] = round(histogram.percentile(percent) / 1000, 2)
+        statuses = self.statuses.get(endpoint, {})
+        summary['errors_5xx'] = sum(count for status, count in statuses.items() if status >= 500)
+        summary['statuses'] = {status_label(status): count for status, count in sorted(statuses.items())}
+        return summary
+
+    def summary(self):
+        elapsed = self.elapsed()
+        total = LatencyHistogram()
+        for histogram in self.latency.values():
+            total.merge(histogram)
+        last_second = max(self.timeline, default=-1)
+        return {
+            'duration_s': round(elapsed, 1),
+            'requests': total.count,
+            'rps': round(total.count / elapsed, 2) if elapsed else 0,
+            'p50_ms': round(total.percentile(50) / 1000, 2),
+            'p95_ms': round(total.percentile(95) / 1000, 2),
+            'p99_ms': round(total.percentile(99) / 1000, 2),
+            'websocket_messages': self.websocket_messages,
+            'errors': dict(sorted(self.errors.items())),
+            'endpoints': [self.endpoint_summary(endpoint) for endpoint in sorted(self.latency)],
+            'timeline': [{'second': second, **self.timeline.get(second, {})} for second in range(last_second + 1)],
+            'histograms': {endpoint: histogram.to_dict() for endpoint, histogram in sorted(self.latency.items())}
+        }
+
+    def table(self):
+        """The p50/p95/p99 table printed at the end of a run."""
+        summary = self.summary()
+        lines = [f"{summary['requests']} requests in {summary['duration_s']}s ({summary['rps']}/s), "
+                 f"{summary['websocket_messages']} WebSocket messages",
+                 f"{'endpoint':<16} {'requests':>9} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>9}  statuses"]
+        overall = {'endpoint': 'all', 'requests': summary['requests'], 'rps': summary['rps'], 'p50_ms': summary['p50_ms'],
+                   'p95_ms': summary['p95_ms'], 'p99_ms': summary['p99_ms'], 'statuses': {},
+                   'max_ms': max((row['max_ms'] for row in summary['endpoints']), default=0)}
+        for row in summary['endpoints'] + [overall]:
+            statuses = ', '.join(f'{label}: {count}' for label, count in row['statuses'].items())
+            lines.append(f"{row['endpoint']:<16} {row['requests']:>9} {row['rps']:>8} {row['p50_ms']:>8} "
+                         f"{row['p95_ms']:>8} {row['p99_ms']:>8} {row['max_ms']:>9}  {statuses}")
+        for key, count in summary['errors'].items():
+            lines.append(f'error {key}: {count}')
+        return '\n'.join(lines)
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def write_csv(self, path):
+        """One row per endpoint, plus a <path>.timeline.csv of requests per second."""
+        rows = self.summary()
+        statuses = sorted({label for row in rows['endpoints'] for label in row['statuses']})
+        columns = ['endpoint', 'requests', 'rps', 'mean_ms'] + [f'p{percent:g}_ms' for percent in PERCENTILES] + ['max_ms', 'errors_5xx']
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(columns + [f'status {label}' for label in statuses])
+            for row in rows['endpoints']:
+                writer.writerow([row[column] for column in columns] + [row['statuses'].get(label, 0) for label in statuses])
+        keys = sorted({key for second in rows['timeline'] for key in second if key != 'second'})
+        with open(timeline_path(path), 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['second'] + keys)
+            for second in rows['timeline']:
+                writer.writerow([second['second']] + [second.get(key, 0) for key in keys])
+
+
+def timeline_path(path):
+    base, _, extension = path.rpartition('.')
+    return f'{base}.timeline.{extension}' if base else f'{path}.timeline'
+
+
+def compare(summary, baseline):
+    """Lines comparing the percentiles of two JSON summaries, endpoint by endpoint."""
+    before = {row['endpoint']: row for row in baseline['endpoints']}
+    lines = [f"{'endpoint':<16} {'p50 ms':>15} {'p95 ms':>15} {'p99 ms':>15} {'rps':>15}"]
+    for row in summary['endpoints']:
+        if row['endpoint'] not in before:
+            continue
+        old = before[row['endpoint']]
+        cells = [f"{old[key]:>6}->{row[key]:<7}" for key in ('p50_ms', 'p95_ms', 'p99_ms', 'rps')]
+        lines.append(f"{row['endpoint']:<16} " + ' '.join(f'{cell:>15}' for cell in cells))
+    return '\n'.join(lines)
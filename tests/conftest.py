@@ -0,0 +1,36 @@
+import os
+import sys
+import uuid
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'testing_tools'))
+
+from lambda_harness import LambdaHarness
+
+
+@pytest.fixture
+def harness():
+    """A fresh in-memory backend seeded from DB/, torn down after the test."""
+    with LambdaHarness() as harness:
+        yield harness
+
+
+@pytest.fixture
+def mongod_harness():
+    """A harness on the real mongod at MONGODB_TEST_URI, for behaviour mongomock cannot evaluate."""
+    uri = os.environ.get('MONGODB_TEST_URI')
+    if not uri:
+        pytest.skip('MONGODB_TEST_URI is not set')
+    with LambdaHarness(uri, database_name=f'game_test_{uuid.uuid4().hex[:8]}') as harness:
+        try:
+            yield harness
+        finally:
+            harness.db.client.drop_database(harness.db.name)
+
+
+@pytest.fixture
+def player(harness):
+    """A registered player, 'player1', with the starting budget."""
+    harness.call('/play', 'player1')
+    return 'player1'
@@ -0,0 +1,62 @@
+import json
+
+from gamecore import broadcast
+from gamecore.broadcast import create_management_client, send_one
+from lambda_harness import client_error
+
+
+class FlakyClient:
+    """Fails each connection's first posts with the given errors, then accepts."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.posts = 0
+
+    def post_to_connection(self, ConnectionId, Data):
+        self.posts += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return {}
+
+
+def test_management_client_leaves_retries_to_send_one():
+    client = create_management_client('https://example.execute-api.us-east-1.amazonaws.com/production')
+    assert client.meta.config.retries['total_max_attempts'] == 1
+
+
+def test_throttled_and_5xx_posts_are_retried(monkeypatch):
+    monkeypatch.setattr(broadcast, 'backoff_delay', lambda attempt: 0)
+    client = FlakyClient(client_error('LimitExceededException', 'PostToConnection', 429),
+                         client_error('InternalServerErrorException', 'PostToConnection', 500))
+
+    status, _, retries = send_one(client, 'conn-1', b'{}')
+
+    assert (status, retries, client.posts) == ('sent', 2, 3)
+
+
+def test_posts_stop_after_max_attempts(monkeypatch):
+    monkeypatch.setattr(broadcast, 'backoff_delay', lambda attempt: 0)
+    client = FlakyClient(*[client_error('LimitExceededException', 'PostToConnection', 429)] * 10)
+
+    status, _, _ = send_one(client, 'conn-1', b'{}')
+
+    assert (status, client.posts) == ('failed', broadcast.BROADCAST_MAX_ATTEMPTS)
+
+
+def test_gone_and_client_errors_are_not_retried():
+    assert send_one(FlakyClient(client_error('GoneException', 'PostToConnection', 410)), 'conn-1', b'{}')[0] == 'stale'
+    client = FlakyClient(client_error('ForbiddenException', 'PostToConnection', 403))
+    assert (send_one(client, 'conn-1', b'{}')[0], client.posts) == ('failed', 1)
+
+
+def test_failures_are_logged_once_per_broadcast(capsys):
+    errors = [client_error('GoneException', 'PostToConnection', 410)] * 3 + \
+             [client_error('ForbiddenException', 'PostToConnection', 403)] * 2
+    client = FlakyClient(*errors)
+
+    metrics = broadcast.broadcast(client, [f'conn-{index}' for index in range(6)], {}, label='test[shard 0]')
+
+    records = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert (len(metrics['stale']), metrics['failed']) == (3, 2)
+    assert [(record['level'], record['msg'], record['label']) for record in records if record['level'] != 'INFO'] == \
+        [('WARNING', '2 of 6 posts failed', 'test[shard 0]')]
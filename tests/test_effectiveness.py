@@ -0,0 +1,73 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+
+import bench_effectiveness
+from bench_effectiveness import (make_catalog, make_cohort, legacy_calculate_combined_effectiveness,
+                                 legacy_check_attack_successfulness)
+from gamecore import effectiveness
+from gamecore.effectiveness import compile_effectiveness, build_cohort, resolve_attack, describe_outcomes
+
+
+class FixedDraws:
+    def __init__(self, draw):
+        self.draw = draw
+
+    def integers(self, low, high, size):
+        return np.full(size, self.draw)
+
+
+def legacy_outcomes(cohort, controls, projects, threat_key):
+    outcomes = []
+    for player in cohort:
+        combined, controls_list, tasks_list = legacy_calculate_combined_effectiveness(
+            player['controls'], controls, threat_key, projects, player['tasks'], player['degraded_controls'])
+        successful, max_control = legacy_check_attack_successfulness(combined, controls_list)
+        outcomes.append({
+            'is_attack_successfull': successful,
+            'controls_tasks_combined_effectiveness': combined,
+            'max_effective_control': max_control,
+            'controls_effectiveness_list': controls_list,
+            'task_effectiveness_list': tasks_list
+        })
+    return outcomes
+
+
+def vectorized_outcomes(cohort, controls, projects, threat_key):
+    model = compile_effectiveness(controls, projects)
+    owned, completed, purchase_order = build_cohort(model, cohort)
+    return describe_outcomes(model, resolve_attack(model, owned, completed, threat_key, purchase_order))
+
+
+@pytest.mark.parametrize('draw', [0, 50, 99])
+def test_vectorized_matches_per_player_loop(monkeypatch, draw):
+    controls, projects, threats = make_catalog(20, 12, 5, seed=1)
+    cohort = make_cohort(2000, controls, projects, seed=7)
+    monkeypatch.setattr(bench_effectiveness.random, 'randint', lambda low, high: draw)
+    monkeypatch.setattr(effectiveness, 'rng', FixedDraws(draw))
+
+    for threat_key in threats:
+        assert vectorized_outcomes(cohort, controls, projects, threat_key) == legacy_outcomes(cohort, controls, projects, threat_key)
+
+
+def test_ties_go_to_the_control_bought_first():
+    controls = {
+        'c1': {'control': 'Firewall', 'effectiveness': {'t1': '50%'}},
+        'c2': {'control': 'MFA', 'effectiveness': {'t1': '50%'}},
+        'c3': {'control': 'EDR', 'effectiveness': {'t1': '20%'}}
+    }
+    cohort = [
+        {'controls': ['MFA', 'Firewall', 'EDR']},
+        {'controls': ['EDR', 'Firewall', 'MFA']},
+        {'controls': ['Firewall', 'MFA'], 'degraded_controls': ['Firewall']},
+        {'controls': ['EDR']},
+        {'controls': []}
+    ]
+
+    outcomes = vectorized_outcomes(cohort, controls, {}, 't1')
+
+    assert [outcome['max_effective_control'] for outcome in outcomes] == ['MFA', 'Firewall', 'MFA', 'EDR', '']
@@ -0,0 +1,125 @@
+import json
+import importlib
+from datetime import datetime, timedelta
+
+from gamecore.events import record_event
+
+
+def body(response):
+    return json.loads(response['body'])
+
+
+def play_one_attack(harness, player):
+    harness.call('/selectControls', player, {'controls': 'Secure Web Gateway'})
+    harness.start_game(started_minutes_ago=10)
+    harness.run_pending()
+    harness.invoke('pushAttack')
+    harness.run_pending()
+
+
+def test_default_response_keeps_histories(harness, player):
+    play_one_attack(harness, player)
+    harness.call('/specialProject', player, {'project': 'Implement https'})
+
+    stats = body(harness.call('/getUserStats', player))
+
+    assert list(stats['levels']) == ['1']
+    assert stats['levels']['1']['controls']['chosen'] == ['Secure Web Gateway']
+    assert [threat['name'] for threat in stats['threats']] == [stats['levels']['1']['attack']]
+    assert [task['completed_task'] for task in stats['tasks']] == ['Implement https']
+    assert stats['budget_left'] == harness.db.usersData.find_one({'user_id': player})['budget_left']
+
+
+def test_default_response_returns_first_page_of_each_history(harness, player, monkeypatch):
+    stats_module = importlib.import_module('gameGetUserStats')
+    monkeypatch.setattr(stats_module, 'DEFAULT_PAGE_LIMIT', 2)
+    start = datetime(2024, 1, 1)
+    for seq in (1, 2, 3):
+        record_event(harness.db, player, 'attack', {'seq': seq, 'level': {'attack': f'a{seq}'}, 'threat': {'name': f'a{seq}'}},
+                     ts=start + timedelta(seconds=seq))
+
+    stats = body(harness.call('/getUserStats', player))
+    rest = body(harness.call('/getUserStats', player, {'history': 'threats', 'cursor': stats['next_cursors']['threats']}))
+
+    assert list(stats['levels']) == ['1', '2']
+    assert [threat['name'] for threat in stats['threats']] == ['a1', 'a2']
+    assert set(stats['next_cursors']) == {'levels', 'threats'}
+    assert [threat['name'] for threat in rest['threats']] == ['a3']
+
+
+def test_new_player_has_empty_histories(harness, player):
+    stats = body(harness.call('/getUserStats', player))
+    assert (stats['levels'], stats['threats']) == ({}, [])
+    assert 'situations' not in stats
+
+
+def test_unregistered_player_gets_empty_payload(harness):
+    stats = body(harness.call('/getUserStats', 'player1'))
+    assert (stats['controls'], stats['levels'], stats['threats']) == ([], {}, [])
+
+
+def test_unmigrated_document_keeps_its_arrays(harness):
+    harness.db.usersData.insert_one({'user_id': 'player1', 'initial_budget': 15000, 'threats': [{'name': 'Phishing'}],
+                                     'levels': {'1': {'attack': 'Phishing'}}})
+    stats = body(harness.call('/getUserStats', 'player1'))
+    assert (stats['threats'], stats['levels']) == ([{'name': 'Phishing'}], {'1': {'attack': 'Phishing'}})
+
+
+def test_fields_select_only_those_fields(harness, player):
+    play_one_attack(harness, player)
+
+    stats = body(harness.call('/getUserStats', player, {'fields': 'budget_left,uptime'}))
+
+    assert set(stats) == {'budget_left', 'uptime'}
+
+
+def test_history_is_paged(harness, player):
+    play_one_attack(harness, player)
+    harness.invoke('pushAttack')
+    harness.run_pending()
+
+    first = body(harness.call('/getUserStats', player, {'history': 'threats', 'limit': '1'}))
+    second = body(harness.call('/getUserStats', player, {'history': 'threats', 'limit': '1', 'cursor': first['next_cursor']}))
+
+    assert len(first['threats']) == 1 and first['next_cursor']
+    assert (len(second['threats']), second['next_cursor']) == (1, None)
+    assert first['threats'] != second['threats']
+    assert 'levels' not in first
+
+
+def test_history_pages_do_not_shift_when_events_arrive(harness, player):
+    # two events share a timestamp, so the page boundary falls between equal ts values
+    start = datetime(2024, 1, 1)
+    for budget, seconds in ((1, 0), (2, 1), (3, 1)):
+        record_event(harness.db, player, 'budget', {'budget': {'budget': budget}}, ts=start + timedelta(seconds=seconds))
+
+    first = body(harness.call('/getUserStats', player, {'history': 'assigned_budget', 'limit': '2'}))
+    record_event(harness.db, player, 'budget', {'budget': {'budget': 4}}, ts=start + timedelta(seconds=2))
+    second = body(harness.call('/getUserStats', player, {'history': 'assigned_budget', 'limit': '2', 'cursor': first['next_cursor']}))
+
+    assert [entry['budget'] for entry in first['assigned_budget'] + second['assigned_budget']] == [1, 2, 3, 4]
+    assert second['next_cursor'] is None
+
+
+def test_controls_are_paged(harness, player):
+    for control in ('Secure Web Gateway', 'Endpoint Security'):
+        harness.call('/selectControls', player, {'controls': control})
+
+    first = body(harness.call('/getUserStats', player, {'history': 'controls', 'limit': '1'}))
+    second = body(harness.call('/getUserStats', player, {'history': 'controls', 'limit': '1', 'cursor': first['next_cursor']}))
+
+    assert [control['control'] for control in first['controls'] + second['controls']] == ['Secure Web Gateway', 'Endpoint Security']
+    assert second['next_cursor'] is None
+
+
+def test_malformed_cursor_is_rejected(harness, player):
+    for cursor in ('1', 'not a cursor', 'eyJ0cyI6MX0'):
+        assert harness.call('/getUserStats', player, {'history': 'threats', 'cursor': cursor})['statusCode'] == 400
+
+
+def test_unchanged_stats_answer_304(harness, player):
+    etag = harness.call('/getUserStats', player)['headers']['ETag']
+    assert harness.call('/getUserStats', player, headers={'If-None-Match': etag})['statusCode'] == 304
+
+    harness.call('/selectControls', player, {'controls': 'Secure Web Gateway'})
+    assert harness.call('/getUserStats', player, headers={'If-None-Match': etag})['statusCode'] == 200
@@ -0,0 +1,126 @@
+import json
+import importlib
+
+import mongomock
+
+from lambda_harness import LambdaHarness
+
+
+def body(response):
+    return json.loads(response['body'])
+
+
+def test_close_restores_mongomock():
+    methods = dict(vars(mongomock.collection.Collection))
+    with LambdaHarness():
+        assert vars(mongomock.collection.Collection)['find_one_and_update'] is not methods['find_one_and_update']
+    assert dict(vars(mongomock.collection.Collection)) == methods
+
+
+def test_harnesses_do_not_share_data():
+    with LambdaHarness() as first:
+        first.call('/play', 'player1')
+    with LambdaHarness() as second:
+        assert second.db.usersData.count_documents({}) == 0
+
+
+def test_harnesses_do_not_share_catalogs():
+    with LambdaHarness() as first:
+        first.call('/addControl', 'admin', method='POST',
+                   body={'c99': {'control': 'Ghost', 'cost': '$500', 'effectiveness': {'t1': '10%'}}})
+        assert first.call('/selectControls', 'player1', {'controls': 'Ghost'})['statusCode'] != 435
+    with LambdaHarness() as second:
+        second.call('/play', 'player1')
+        assert second.call('/selectControls', 'player1', {'controls': 'Ghost'})['statusCode'] == 435
+
+
+def test_harnesses_ensure_their_own_indexes():
+    with LambdaHarness() as first:
+        first.call('/play', 'player1')
+    with LambdaHarness() as second:
+        second.call('/play', 'player1')
+        assert 'user_id_1_ts_1' in second.db.budgetLedger.index_information()
+
+
+def test_play_registers_player(harness):
+    response = harness.call('/play', 'player1')
+    assert response['statusCode'] == 200
+    user = harness.db.usersData.find_one({'user_id': 'player1'})
+    assert user['budget_left'] == user['initial_budget']
+
+
+def test_request_without_user_is_rejected(harness):
+    assert harness.call('/play')['statusCode'] == 438
+
+
+def test_select_control_and_read_stats(harness, player):
+    response = harness.call('/selectControls', player, {'controls': 'Secure Web Gateway'})
+    assert response['statusCode'] == 200
+    assert body(response)['chosen_controls'] == ['Secure Web Gateway']
+
+    stats = body(harness.call('/getUserStats', player))
+    assert [control['control'] for control in stats['controls']] == ['Secure Web Gateway']
+    assert stats['budget_left'] == body(response)['budget_left']
+
+
+def test_start_game_pushes_catalog(harness):
+    harness.connect('conn-1', 'player1')
+    assert harness.call('/startGame', 'admin')['statusCode'] == 200
+    assert [invocation['function'] for invocation in harness.lambda_client.invocations] == ['pushControls']
+    harness.run_pending()
+    assert harness.management.messages_for('conn-1')
+
+
+def test_attack_outcome_is_pushed_to_player(harness, player):
+    harness.connect('conn-1', player)
+    harness.start_game(started_minutes_ago=10)
+    harness.run_pending()
+    harness.management.clear()
+
+    harness.invoke('pushAttack')
+    harness.run_pending()
+
+    outcome = harness.management.messages_for('conn-1')[-1]['attack_outcome']
+    assert outcome['level'] == 1
+    assert harness.db.usersData.find_one({'user_id': player})['level_count'] == 1
+
+
+def test_attack_is_written_and_pushed_per_batch(harness, monkeypatch):
+    module = importlib.import_module('updatePostAttackStats')
+    monkeypatch.setattr(module, 'cursor_batch_size', 1)
+    for index, player in enumerate(['player1', 'player2']):
+        harness.call('/play', player)
+        harness.connect(f'conn-{index}', player)
+    harness.start_game(started_minutes_ago=10)
+    harness.run_pending()
+    harness.management.clear()
+    pushes = []
+    push_attack_outcomes = module.push_attack_outcomes
+
+    def record_push(db, outcomes):
+        pushes.append((sorted(outcomes), db.userEvents.count_documents({'kind': 'attack'})))
+        push_attack_outcomes(db, outcomes)
+    monkeypatch.setattr(module, 'push_attack_outcomes', record_push)
+
+    harness.invoke('pushAttack')
+    harness.run_pending()
+
+    assert pushes == [(['player1'], 1), (['player2'], 2)]
+    assert all(harness.management.messages_for(f'conn-{index}') for index in range(2))
+
+
+def test_reap_removes_gone_connections(harness):
+    harness.connect('conn-1', 'player1')
+    harness.connect('conn-2', 'player2')
+    harness.management.gone.add('conn-2')
+
+    harness.invoke('reapConnections')
+
+    assert {connection['_id'] for connection in harness.db.connections.find()} == {'conn-1'}
+
+
+def test_invocations_are_traced(harness, player):
+    harness.traces.clear()
+    harness.call('/getUserStats', player)
+    assert [trace['function'] for trace in harness.traces.traces] == ['gameGetUserStats']
+    assert harness.traces.traces[0]['operations'] >= 1
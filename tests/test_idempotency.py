@@ -0,0 +1,139 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from gamecore.idempotency import IDEMPOTENCY_COLLECTION, IDEMPOTENCY_LOCK_SECONDS, idempotent, get_request_fingerprint
+from lambda_harness import rest_event
+
+
+class CountingHandler:
+    """A handler answering with the given status codes in turn, counting its calls."""
+
+    def __init__(self, *statuses):
+        self.statuses = list(statuses)
+        self.calls = 0
+
+    def __call__(self, event, context):
+        self.calls += 1
+        status = self.statuses.pop(0)
+        return {'statusCode': status, 'headers': {}, 'body': json.dumps({'call': self.calls})}
+
+
+def keyed_event(key='key-1', params=None):
+    return rest_event('/selectControls', 'player1', params or {'controls': 'Secure Web Gateway'},
+                      headers={'Idempotency-Key': key})
+
+
+def key_id(key='key-1'):
+    return f'player1:/selectControls:{key}'
+
+
+def test_replay_returns_stored_response(harness):
+    handler = CountingHandler(200)
+    wrapped = idempotent('test')(handler)
+
+    first = wrapped(keyed_event(), None)
+    second = wrapped(keyed_event(), None)
+
+    assert handler.calls == 1
+    assert second['body'] == first['body']
+    assert second['headers']['Idempotent-Replayed'] == 'true'
+    assert harness.db[IDEMPOTENCY_COLLECTION].find_one({'_id': key_id()})['status'] == 'completed'
+
+
+def test_4xx_responses_are_replayed(harness):
+    handler = CountingHandler(432, 200)
+    wrapped = idempotent('test')(handler)
+
+    assert wrapped(keyed_event(), None)['statusCode'] == 432
+    assert wrapped(keyed_event(), None)['statusCode'] == 432
+    assert handler.calls == 1
+
+
+def test_request_in_progress_gets_409(harness):
+    harness.db[IDEMPOTENCY_COLLECTION].insert_one({
+        '_id': key_id(), 'fingerprint': get_request_fingerprint(keyed_event()), 'status': 'in_progress',
+        'created_at': datetime.utcnow()})
+    handler = CountingHandler(200)
+
+    response = idempotent('test')(handler)(keyed_event(), None)
+
+    assert (response['statusCode'], handler.calls) == (409, 0)
+
+
+def test_key_reused_for_another_request_gets_422(harness):
+    handler = CountingHandler(200, 200)
+    wrapped = idempotent('test')(handler)
+    wrapped(keyed_event(), None)
+
+    response = wrapped(keyed_event(params={'controls': 'Endpoint Security'}), None)
+
+    assert (response['statusCode'], handler.calls) == (422, 1)
+
+
+def test_stale_placeholder_is_taken_over(harness):
+    harness.db[IDEMPOTENCY_COLLECTION].insert_one({
+        '_id': key_id(), 'fingerprint': get_request_fingerprint(keyed_event()), 'status': 'in_progress',
+        'created_at': datetime.utcnow() - timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS + 1)})
+    handler = CountingHandler(200)
+
+    response = idempotent('test')(handler)(keyed_event(), None)
+
+    assert (response['statusCode'], handler.calls) == (200, 1)
+    assert harness.db[IDEMPOTENCY_COLLECTION].find_one({'_id': key_id()})['status'] == 'completed'
+
+
+def test_stale_placeholder_of_another_request_is_not_taken_over(harness):
+    harness.db[IDEMPOTENCY_COLLECTION].insert_one({
+        '_id': key_id(), 'fingerprint': 'another request', 'status': 'in_progress',
+        'created_at': datetime.utcnow() - timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS + 1)})
+    handler = CountingHandler(200)
+
+    assert idempotent('test')(handler)(keyed_event(), None)['statusCode'] == 422
+    assert handler.calls == 0
+
+
+def test_5xx_is_not_stored(harness):
+    handler = CountingHandler(500, 200)
+    wrapped = idempotent('test')(handler)
+
+    assert wrapped(keyed_event(), None)['statusCode'] == 500
+    assert harness.db[IDEMPOTENCY_COLLECTION].count_documents({}) == 0
+    assert wrapped(keyed_event(), None)['statusCode'] == 200
+    assert handler.calls == 2
+
+
+def test_handler_exception_releases_the_key(harness):
+    def failing(event, context):
+        raise RuntimeError('boom')
+    wrapped = idempotent('test')(failing)
+
+    with pytest.raises(RuntimeError):
+        wrapped(keyed_event(), None)
+
+    assert harness.db[IDEMPOTENCY_COLLECTION].count_documents({}) == 0
+
+
+def test_requests_without_key_are_not_tracked(harness):
+    handler = CountingHandler(200, 200)
+    wrapped = idempotent('test')(handler)
+    event = rest_event('/selectControls', 'player1', {'controls': 'Secure Web Gateway'})
+
+    wrapped(event, None)
+    wrapped(event, None)
+
+    assert handler.calls == 2
+    assert harness.db[IDEMPOTENCY_COLLECTION].count_documents({}) == 0
+
+
+def test_replayed_purchase_spends_once(harness, player):
+    budget = harness.db.usersData.find_one({'user_id': player})['budget_left']
+    headers = {'Idempotency-Key': 'key-1'}
+
+    first = harness.call('/selectControls', player, {'controls': 'Secure Web Gateway'}, headers=headers)
+    replay = harness.call('/selectControls', player, {'controls': 'Secure Web Gateway'}, headers=headers)
+
+    assert (first['statusCode'], replay['statusCode']) == (200, 200)
+    assert replay['body'] == first['body']
+    assert harness.db.usersData.find_one({'user_id': player})['budget_left'] == json.loads(first['body'])['budget_left'] < budget
@@ -0,0 +1,117 @@
+from gamecore.ledger import backfill_budget_left, change_budget
+
+
+def test_backfill_sets_budget_and_bumps_version(harness):
+    harness.db.usersData.insert_many([
+        {'user_id': 'player1', 'initial_budget': 15000, 'version': 4},
+        {'user_id': 'player2', 'initial_budget': 15000},
+        {'user_id': 'player3', 'initial_budget': 15000, 'budget_left': 900, 'version': 2}
+    ])
+
+    assert backfill_budget_left(harness.db) == 2
+
+    users = {user['user_id']: user for user in harness.db.usersData.find()}
+    assert (users['player1']['budget_left'], users['player1']['version']) == (15000, 5)
+    assert (users['player2']['budget_left'], users['player2']['version']) == (15000, 1)
+    assert (users['player3']['budget_left'], users['player3']['version']) == (900, 2)
+
+
+def test_backfilled_player_gets_a_new_etag(harness):
+    harness.db.usersData.insert_one({'user_id': 'player1', 'initial_budget': 15000, 'version': 4})
+    etag = harness.call('/getUserStats', 'player1')['headers']['ETag']
+
+    backfill_budget_left(harness.db)
+
+    response = harness.call('/getUserStats', 'player1', headers={'If-None-Match': etag})
+    assert response['statusCode'] == 200
+    assert response['headers']['ETag'] != etag
+
+
+def add_player(harness, budget_left=1000):
+    harness.db.usersData.insert_one({'user_id': 'player1', 'initial_budget': 15000, 'budget_left': budget_left, 'version': 0})
+
+
+def ledger(harness):
+    return list(harness.db.budgetLedger.find({}, {'_id': 0, 'ts': 0}))
+
+
+def test_spend_within_budget_is_applied_and_recorded(harness):
+    add_player(harness)
+
+    user = change_budget(harness.db, 'player1', -1000, 'controls', ref=['Secure Web Gateway'])
+
+    assert (user['budget_left'], user['version']) == (0, 1)
+    assert ledger(harness) == [{'user_id': 'player1', 'amount': -1000, 'reason': 'controls', 'balance': 0,
+                                'ref': ['Secure Web Gateway']}]
+
+
+def test_spend_over_budget_is_rejected(harness):
+    add_player(harness)
+
+    assert change_budget(harness.db, 'player1', -1001, 'controls') is None
+
+    user = harness.db.usersData.find_one({'user_id': 'player1'})
+    assert (user['budget_left'], user['version']) == (1000, 0)
+    assert ledger(harness) == []
+
+
+def test_grant_is_not_guarded(harness):
+    add_player(harness, budget_left=0)
+
+    user = change_budget(harness.db, 'player1', 2000, 'budget')
+
+    assert user['budget_left'] == 2000
+    assert [(entry['amount'], entry['balance']) for entry in ledger(harness)] == [(2000, 2000)]
+
+
+def test_unknown_player_changes_nothing(harness):
+    assert change_budget(harness.db, 'player1', 2000, 'budget') is None
+    assert harness.db.usersData.count_documents({}) == 0
+    assert ledger(harness) == []
+
+
+def test_failed_guard_changes_nothing(harness):
+    add_player(harness)
+
+    assert change_budget(harness.db, 'player1', -100, 'project', guards={'tasks_completed': {'$ne': 'Implement https'}},
+                         update=[{'$set': {'tasks_completed': ['Implement https']}}]) is not None
+    assert change_budget(harness.db, 'player1', -100, 'project', guards={'tasks_completed': {'$ne': 'Implement https'}},
+                         update=[{'$set': {'tasks_completed': ['Implement https']}}]) is None
+
+    user = harness.db.usersData.find_one({'user_id': 'player1'})
+    assert (user['budget_left'], user['tasks_completed']) == (900, ['Implement https'])
+    assert [entry['amount'] for entry in ledger(harness)] == [-100]
+
+
+def test_ledger_sums_to_balance(harness):
+    add_player(harness, budget_left=0)
+    for amount in (5000, -1500, -500, 2000, -5000):
+        change_budget(harness.db, 'player1', amount, 'test')
+
+    balance = harness.db.usersData.find_one({'user_id': 'player1'})['budget_left']
+    assert balance == sum(entry['amount'] for entry in ledger(harness)) == 0
+
+
+def test_legacy_player_spends_from_initial_budget(harness):
+    harness.db.usersData.insert_one({'user_id': 'player1', 'initial_budget': '15000', 'version': 0})
+
+    assert change_budget(harness.db, 'player1', -15001, 'controls') is None
+    user = change_budget(harness.db, 'player1', -1000, 'controls')
+
+    assert user['budget_left'] == 14000
+    assert [(entry['amount'], entry['balance']) for entry in ledger(harness)] == [(-1000, 14000)]
+
+
+def test_legacy_player_is_granted_on_top_of_initial_budget(harness):
+    harness.db.usersData.insert_one({'user_id': 'player1', 'initial_budget': 15000})
+
+    assert change_budget(harness.db, 'player1', 2000, 'budget')['budget_left'] == 17000
+
+
+def test_legacy_player_pays_situation_from_initial_budget(harness, player):
+    harness.db.usersData.update_one({'user_id': player}, {'$unset': {'budget_left': ''}, '$set': {'initial_budget': 15000}})
+
+    assert harness.call('/situation', player, {'situation': 'situation1,2'})['statusCode'] == 200
+
+    assert harness.db.usersData.find_one({'user_id': player})['budget_left'] == 14500
+    assert [(entry['amount'], entry['balance']) for entry in ledger(harness) if entry['reason'] == 'situation'] == [(-500, 14500)]
@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+from gamecore import log as gamelog
+from gamecore.log import Logger, LEVELS
+
+
+@pytest.fixture
+def loggers(monkeypatch):
+    """A handler logger and a gamecore module logger, both at INFO."""
+    monkeypatch.setattr(gamelog, 'sampled', True)
+    handler, module = Logger('handler'), Logger('gamecore.module')
+    handler.level = module.level = LEVELS['INFO']
+    return handler, module
+
+
+def records(capsys):
+    return [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+
+def test_unsampled_invocation_silences_every_logger(loggers, capsys):
+    handler, module = loggers
+    handler.sample_rate = 0.0
+
+    handler.start({'requestContext': {'authorizer': {'claims': {'username': 'player1'}}}})
+    handler.info('handler info')
+    module.info('module info')
+    module.warning('module warning')
+
+    assert [(record['logger'], record['msg']) for record in records(capsys)] == [('gamecore.module', 'module warning')]
+
+
+def test_sampled_invocation_logs_every_logger(loggers, capsys):
+    handler, module = loggers
+    handler.sample_rate = 1.0
+
+    handler.start({'requestContext': {'authorizer': {'claims': {'username': 'player1'}}}})
+    handler.info('handler info %s', 1)
+    module.info('module info')
+
+    assert [(record['logger'], record['msg']) for record in records(capsys)] == [
+        ('handler', 'handler info 1'), ('gamecore.module', 'module info')]
+    assert records(capsys) == []
+
+
+def test_next_invocation_draws_again(loggers, capsys):
+    handler, module = loggers
+    handler.sample_rate = 0.0
+    handler.start({})
+    handler.sample_rate = 1.0
+    handler.start({})
+
+    module.info('module info')
+
+    assert [record['msg'] for record in records(capsys)] == ['module info']
+
+
+def test_fields_are_redacted(loggers, capsys):
+    handler, _ = loggers
+    handler.start({})
+
+    handler.info('request', headers={'Authorization': 'Bearer secret', 'Host': 'example.com'})
+
+    assert records(capsys)[0]['headers'] == {'Authorization': '[redacted]', 'Host': 'example.com'}
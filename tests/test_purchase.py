@@ -0,0 +1,145 @@
+import json
+import threading
+
+import pytest
+
+from gamecore import purchase
+
+
+def body(response):
+    return json.loads(response['body'])
+
+
+def get_user(harness, user_id):
+    return harness.db.usersData.find_one({'user_id': user_id})
+
+
+def get_control_cost(harness, name):
+    for control in harness.db.controls_data.find_one()['info']['controls'].values():
+        if control['control'] == name:
+            return int(control['cost'].strip('$'))
+
+
+def call_concurrently(calls):
+    """Runs the calls on one thread each, released together; returns their responses."""
+    barrier = threading.Barrier(len(calls))
+    responses = [None] * len(calls)
+
+    def run(index, call):
+        barrier.wait()
+        responses[index] = call()
+
+    threads = [threading.Thread(target=run, args=item) for item in enumerate(calls)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return responses
+
+
+def test_purchase_spends_budget_and_records_it(harness, player):
+    cost = get_control_cost(harness, 'Secure Web Gateway')
+    budget = get_user(harness, player)['budget_left']
+
+    response = harness.call('/selectControls', player, {'controls': 'Secure Web Gateway'})
+
+    assert response['statusCode'] == 200
+    assert body(response)['budget_left'] == budget - cost
+    user = get_user(harness, player)
+    assert (user['budget_left'], [control['control'] for control in user['controls']]) == (budget - cost, ['Secure Web Gateway'])
+    assert [entry['amount'] for entry in harness.db.budgetLedger.find({'user_id': player, 'reason': 'controls'})] == [-cost]
+
+
+def test_legacy_player_buys_from_initial_budget(harness, player):
+    harness.db.usersData.update_one({'user_id': player}, {'$unset': {'budget_left': ''}})
+    cost = get_control_cost(harness, 'Secure Web Gateway')
+
+    response = harness.call('/selectControls', player, {'controls': 'Secure Web Gateway'})
+
+    assert response['statusCode'] == 200
+    assert get_user(harness, player)['budget_left'] == int(get_user(harness, player)['initial_budget']) - cost
+
+
+def test_over_budget_purchase_is_rejected(harness, player):
+    harness.db.usersData.update_one({'user_id': player}, {'$set': {'budget_left': 100}})
+
+    response = harness.call('/selectControls', player, {'controls': 'Secure Web Gateway'})
+
+    assert response['statusCode'] == 432
+    user = get_user(harness, player)
+    assert (user['budget_left'], user['controls']) == (100, [])
+    assert harness.db.budgetLedger.count_documents({'reason': 'controls'}) == 0
+
+
+def test_owned_control_is_rejected(harness, player):
+    harness.call('/selectControls', player, {'controls': 'Secure Web Gateway'})
+    budget = get_user(harness, player)['budget_left']
+
+    response = harness.call('/selectControls', player, {'controls': 'Secure Web Gateway,Endpoint Security'})
+
+    assert response['statusCode'] == 434
+    assert 'Secure Web Gateway' in body(response)['error']
+    user = get_user(harness, player)
+    assert (user['budget_left'], len(user['controls'])) == (budget, 1)
+
+
+def test_unknown_control_is_rejected(harness, player):
+    response = harness.call('/selectControls', player, {'controls': 'Quantum Firewall'})
+
+    assert response['statusCode'] == 435
+    assert get_user(harness, player)['controls'] == []
+
+
+def test_unregistered_player_is_rejected(harness):
+    assert harness.call('/selectControls', 'player1', {'controls': 'Secure Web Gateway'})['statusCode'] == 436
+
+
+# mongomock does not evaluate expressions nested in array literals; mongod does
+@pytest.mark.parametrize('backend', ['harness', 'mongod_harness'])
+@pytest.mark.parametrize('name', ['$budget_left', '$$NOW'])
+def test_control_names_are_stored_literally(request, backend, name):
+    harness = request.getfixturevalue(backend)
+    harness.call('/play', 'player1')
+    harness.call('/addControl', 'admin', method='POST',
+                 body={'c99': {'control': name, 'cost': '$500', 'effectiveness': {'t1': '10%'}}})
+
+    response = harness.call('/selectControls', 'player1', {'controls': name})
+
+    assert response['statusCode'] == 200
+    assert [control['control'] for control in get_user(harness, 'player1')['controls']] == [name]
+
+
+def test_new_controls_are_spliced_in_as_literals(monkeypatch):
+    updates = []
+    monkeypatch.setattr(purchase, 'change_budget', lambda *args, **kwargs: updates.append(kwargs['update']))
+
+    purchase.purchase_controls(None, 'player1', ['$budget_left'], 500)
+
+    spliced = updates[0][0]['$set']['controls']['$filter']['input']['$concatArrays'][1]
+    assert [control['control'] for control in spliced['$literal']] == ['$budget_left']
+
+
+def test_concurrent_purchases_of_one_control_apply_once(harness, player):
+    cost = get_control_cost(harness, 'Secure Web Gateway')
+    budget = get_user(harness, player)['budget_left']
+
+    responses = call_concurrently(
+        [lambda: harness.call('/selectControls', player, {'controls': 'Secure Web Gateway'})] * 8)
+
+    assert sorted(response['statusCode'] for response in responses) == [200] + [434] * 7
+    user = get_user(harness, player)
+    assert (user['budget_left'], len(user['controls'])) == (budget - cost, 1)
+    assert harness.db.budgetLedger.count_documents({'user_id': player, 'reason': 'controls'}) == 1
+
+
+def test_concurrent_purchases_cannot_overspend(harness, player):
+    cost = get_control_cost(harness, 'Endpoint Security')
+    assert get_control_cost(harness, 'Regular security audits and risk assessments') == cost
+    harness.db.usersData.update_one({'user_id': player}, {'$set': {'budget_left': cost}})
+
+    responses = call_concurrently([
+        lambda: harness.call('/selectControls', player, {'controls': 'Endpoint Security'}),
+        lambda: harness.call('/selectControls', player, {'controls': 'Regular security audits and risk assessments'})])
+
+    assert sorted(response['statusCode'] for response in responses) == [200, 432]
+    assert get_user(harness, player)['budget_left'] == 0
@@ -0,0 +1,65 @@
+import json
+
+
+def body(response):
+    return json.loads(response['body'])
+
+
+def make_eligible(harness, player, budget_left=200, earned=100000, expected=100000):
+    harness.db.usersData.update_one({'user_id': player}, {'$set': {
+        'apply_for_budget': True, 'budget_left': budget_left, 'accumulated_production_amount': earned,
+        'expected_production_amount': expected, 'no_of_attacks': 1}})
+
+
+def test_unregistered_player_gets_436(harness):
+    assert harness.call('/requestBudget', 'player1')['statusCode'] == 436
+
+
+def test_registered_player_without_renewal_fields_gets_437(harness):
+    # The projection of a freshly registered player is empty, but it exists
+    harness.db.usersData.insert_one({'user_id': 'player1', 'initial_budget': 15000, 'budget_left': 15000})
+    assert harness.call('/requestBudget', 'player1')['statusCode'] == 437
+
+
+def test_player_not_applying_gets_437(harness, player):
+    harness.db.usersData.update_one({'user_id': player}, {'$set': {'apply_for_budget': False}})
+
+    assert harness.call('/requestBudget', player)['statusCode'] == 437
+    assert harness.db.budgetLedger.count_documents({'reason': 'renewal'}) == 0
+
+
+def test_eligible_player_is_granted_budget(harness, player):
+    make_eligible(harness, player)
+
+    response = harness.call('/requestBudget', player)
+
+    assert response['statusCode'] == 200
+    # 100% production efficiency grants 10% of the production amount
+    assert body(response) == {'assigned_budget': 10000, 'total_budget_you_have': 10200}
+    user = harness.db.usersData.find_one({'user_id': player})
+    assert (user['budget_left'], user['accumulated_production_amount'], user['apply_for_budget']) == (10200, 90000, False)
+    assert [(entry['amount'], entry['balance']) for entry in harness.db.budgetLedger.find({'reason': 'renewal'})] == [(10000, 10200)]
+    assert [event['budget']['budget'] for event in harness.db.userEvents.find({'kind': 'budget'})] == [10000]
+
+
+def test_low_efficiency_grants_less(harness, player):
+    make_eligible(harness, player, earned=40000, expected=100000)
+    assert body(harness.call('/requestBudget', player))['assigned_budget'] == 1200
+
+
+def test_budget_is_granted_once(harness, player):
+    make_eligible(harness, player)
+
+    assert harness.call('/requestBudget', player)['statusCode'] == 200
+    assert harness.call('/requestBudget', player)['statusCode'] == 437
+    assert harness.db.budgetLedger.count_documents({'reason': 'renewal'}) == 1
+
+
+def test_legacy_player_is_renewed_from_initial_budget(harness, player):
+    make_eligible(harness, player)
+    harness.db.usersData.update_one({'user_id': player}, {'$unset': {'budget_left': ''}, '$set': {'initial_budget': 200}})
+
+    response = harness.call('/requestBudget', player)
+
+    assert body(response)['total_budget_you_have'] == 10200
+    assert harness.db.usersData.find_one({'user_id': player})['apply_for_budget'] is False
@@ -0,0 +1,63 @@
+import json
+from types import SimpleNamespace
+
+import bson
+
+from gamecore import tracing
+from gamecore.tracing import CommandTracer, EmfExporter
+
+REPLY = {'cursor': {'firstBatch': [{'user_id': 'player1', 'budget_left': 14500}], 'id': 0}, 'ok': 1}
+
+
+def succeeded(tracer, reply=REPLY):
+    tracer.succeeded(SimpleNamespace(command_name='find', duration_micros=1500, reply=reply))
+
+
+def test_replies_are_not_reencoded_by_default(monkeypatch):
+    def encode(document):
+        raise AssertionError('reply re-encoded')
+    monkeypatch.setattr(bson, 'encode', encode)
+    tracer = CommandTracer()
+    tracer.begin('handler')
+
+    succeeded(tracer)
+
+    trace = tracer.end()
+    assert (trace['operations'], trace['db_ms'], trace['bytes']) == (1, 1.5, 0)
+
+
+def test_returned_documents_are_counted_by_default():
+    tracer = CommandTracer()
+    tracer.begin('handler')
+
+    succeeded(tracer)
+    succeeded(tracer, {'cursor': {'nextBatch': [{}, {}], 'id': 0}, 'ok': 1})
+    succeeded(tracer, {'value': {'user_id': 'player1'}, 'ok': 1})
+    succeeded(tracer, {'value': None, 'ok': 1})
+    succeeded(tracer, {'n': 1, 'ok': 1})
+
+    assert tracer.end()['documents'] == 4
+
+
+def test_reply_bytes_are_measured_when_enabled(monkeypatch):
+    monkeypatch.setattr(tracing, 'TRACE_REPLY_BYTES', True)
+    tracer = CommandTracer()
+    tracer.begin('handler')
+
+    succeeded(tracer)
+
+    assert tracer.end()['bytes'] == len(bson.encode(REPLY))
+
+
+def test_emf_record_leaves_out_unmeasured_bytes(capsys):
+    trace = {'function': 'handler', 'operations': 1, 'failed': 0, 'db_ms': 1.5, 'documents': 1, 'bytes': 0,
+             'handler_ms': 3.0, 'commands': {'find': {'count': 1, 'ms': 1.5}}}
+
+    EmfExporter().export(trace)
+
+    record = json.loads(capsys.readouterr().out)
+    assert 'DbBytesReturned' not in record
+    assert record['DbDocumentsReturned'] == 1
+    assert [metric['Name'] for metric in record['_aws']['CloudWatchMetrics'][0]['Metrics']] == [
+        'DbOperations', 'DbFailedOperations', 'DbTimeMs', 'DbDocumentsReturned', 'HandlerTimeMs']
+    assert (record['Function'], record['DbOperations'], record['db_commands']) == ('handler', 1, {'find': {'count': 1, 'ms': 1.5}})
@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+
+NOW = datetime(2026, 1, 1, 12, 0)
+INTEGRAL_FIELDS = ('downtime', 'expected_uptime', 'uptime', 'accumulated_production_amount',
+                   'accumulated_production_loss', 'expected_production_amount')
+
+
+def at(expression, now):
+    """expression with $$NOW replaced by now, which mongomock cannot evaluate."""
+    if isinstance(expression, dict):
+        return {key: at(value, now) for key, value in expression.items()}
+    if isinstance(expression, list):
+        return [at(value, now) for value in expression]
+    return now if expression == '$$NOW' else expression
+
+
+def test_stats_pipeline_keeps_fields_integral(harness):
+    import updateGameStats
+    harness.db.usersData.insert_one({
+        'user_id': 'player1', 'player_start_time': NOW - timedelta(minutes=30, seconds=20), 'downtime': 5, 'version': 2})
+
+    harness.db.usersData.update_many({}, at(updateGameStats.get_stats_pipeline(NOW - timedelta(hours=1)), NOW))
+
+    user = harness.db.usersData.find_one({'user_id': 'player1'})
+    assert {field: user[field] for field in INTEGRAL_FIELDS} == {
+        'downtime': 5, 'expected_uptime': 30, 'uptime': 25, 'accumulated_production_amount': 250000,
+        'accumulated_production_loss': 50000, 'expected_production_amount': 300000}
+    assert all(type(user[field]) is int for field in INTEGRAL_FIELDS)
+    assert user['version'] == 3
+
+
+def test_stats_pipeline_converts_minutes_to_int(harness):
+    import updateGameStats
+    # mongomock's $trunc returns a Python int, but the server's keeps $divide's double
+    expected_uptime = updateGameStats.get_stats_pipeline(NOW)[0]['$set']['expected_uptime']
+    assert list(expected_uptime) == ['$toInt']
+
+
+def test_stats_pipeline_counts_from_game_start(harness):
+    import updateGameStats
+    harness.db.usersData.insert_one({'user_id': 'player1', 'player_start_time': NOW - timedelta(hours=2)})
+
+    harness.db.usersData.update_many({}, at(updateGameStats.get_stats_pipeline(NOW - timedelta(minutes=45)), NOW))
+
+    user = harness.db.usersData.find_one({'user_id': 'player1'})
+    assert (user['expected_uptime'], user['downtime'], user['uptime']) == (45, 0, 45)
+
+
+def test_stats_tick_on_mongod_stores_ints(mongod_harness):
+    db = mongod_harness.db
+    db.game_status.update_one({}, {'$set': {
+        'started': 'True', 'update_attack_stats': 'False',
+        'start_timestamp': datetime.utcnow() - timedelta(minutes=90)}}, upsert=True)
+    db.usersData.insert_one({
+        'user_id': 'player1', 'player_start_time': datetime.utcnow() - timedelta(minutes=30, seconds=20),
+        'downtime': 5, 'version': 0,
+        'degraded_controls': [{'effected_controls': ['Secure Web Gateway', 10],
+                               'timestamp': datetime.utcnow() - timedelta(minutes=11)}]})
+
+    mongod_harness.invoke('updateGameStats')
+
+    user = db.usersData.find_one({'user_id': 'player1'})
+    assert (user['expected_uptime'], user['uptime']) == (30, 25)
+    assert user['accumulated_production_amount'] == 250000
+    # int32 and int64 decode to int (Int64 subclasses it); a double would be a float
+    assert all(isinstance(user[field], int) for field in INTEGRAL_FIELDS)
+    assert user['degraded_controls'][0]['expired'] == 1
+    assert user['version'] == 1
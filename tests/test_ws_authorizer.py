@@ -0,0 +1,94 @@
+import json
+import base64
+import importlib
+
+import pytest
+
+from gamecore.clients import set_client
+from lambda_harness import client_error
+
+POOL_ID = 'us-east-1_TestPool'
+
+
+class FakeCognitoClient:
+    """Accepts the tokens in `users` (token -> username) like GetUser would."""
+
+    def __init__(self, users):
+        self.users = users
+        self.calls = 0
+
+    def get_user(self, AccessToken):
+        self.calls += 1
+        if AccessToken not in self.users:
+            raise client_error('NotAuthorizedException', 'GetUser')
+        return {'Username': self.users[AccessToken]}
+
+
+def make_token(**claims):
+    claims = {'token_use': 'access', 'iss': f'https://cognito-idp.us-east-1.amazonaws.com/{POOL_ID}',
+              'client_id': 'player-client', **claims}
+    encode = lambda part: base64.urlsafe_b64encode(json.dumps(part).encode()).decode().rstrip('=')
+    return f"{encode({'alg': 'RS256'})}.{encode(claims)}.signature"
+
+
+def authorizer_event(token=None):
+    return {
+        'type': 'REQUEST',
+        'methodArn': 'arn:aws:execute-api:us-east-1:111111111111:abc/production/$connect',
+        'queryStringParameters': {'token': token} if token else {},
+        'requestContext': {'routeKey': '$connect', 'connectionId': 'conn-1'}
+    }
+
+
+@pytest.fixture
+def authorizer(harness, monkeypatch):
+    module = importlib.import_module('wsAuthorizer')
+    monkeypatch.setattr(module, 'COGNITO_USER_POOL_ID', POOL_ID)
+    monkeypatch.setattr(module, 'COGNITO_CLIENT_IDS', {'player-client'})
+    return module
+
+
+def test_valid_token_authorizes_its_user(harness, authorizer):
+    token = make_token()
+    set_client('cognito-idp', FakeCognitoClient({token: 'player1'}))
+
+    policy = harness.invoke('wsAuthorizer', authorizer_event(token))
+
+    assert policy['principalId'] == 'player1'
+    assert policy['context'] == {'user_id': 'player1'}
+    assert policy['policyDocument']['Statement'][0]['Effect'] == 'Allow'
+
+
+def test_authorizer_context_is_recorded_on_connect(harness, authorizer):
+    token = make_token()
+    set_client('cognito-idp', FakeCognitoClient({token: 'player1'}))
+    policy = harness.invoke('wsAuthorizer', authorizer_event(token))
+
+    event = authorizer_event(token)
+    event['requestContext']['authorizer'] = {'principalId': policy['principalId'], **policy['context']}
+    harness.invoke('connect', event)
+
+    assert harness.db.connections.find_one({'_id': 'conn-1'})['user_id'] == 'player1'
+
+
+@pytest.mark.parametrize('token', [
+    None,
+    'not-a-jwt',
+    make_token(iss='https://cognito-idp.us-east-1.amazonaws.com/us-east-1_OtherPool'),
+    make_token(client_id='other-client'),
+    make_token(token_use='id'),
+])
+def test_foreign_tokens_are_refused_without_calling_cognito(harness, authorizer, token):
+    cognito = FakeCognitoClient({token: 'player1'} if token else {})
+    set_client('cognito-idp', cognito)
+
+    with pytest.raises(Exception, match='Unauthorized'):
+        harness.invoke('wsAuthorizer', authorizer_event(token))
+    assert cognito.calls == 0
+
+
+def test_tokens_cognito_rejects_are_refused(harness, authorizer):
+    set_client('cognito-idp', FakeCognitoClient({}))
+
+    with pytest.raises(Exception, match='Unauthorized'):
+        harness.invoke('wsAuthorizer', authorizer_event(make_token()))